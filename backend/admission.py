@@ -0,0 +1,226 @@
+# backend/admission.py
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import List, NamedTuple
+from starlette.responses import StreamingResponse
+import metrics
+
+class Overloaded(Exception):
+    """The request was shed; `retry_after` is a suggested wait in seconds."""
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Tier(NamedTuple):
+    name: str
+    min_daily_limit: int
+    weight: int
+
+def parse_tiers(spec: str) -> List[Tier]:
+    """Parse "name:min_daily_limit:weight,..." into tiers sorted by min_daily_limit."""
+    tiers = []
+    for entry in spec.split(","):
+        name, min_daily_limit, weight = entry.strip().split(":")
+        tiers.append(Tier(name, int(min_daily_limit), int(weight)))
+    return sorted(tiers, key=lambda tier: tier.min_daily_limit)
+
+class _Tenant:
+    def __init__(self):
+        self.in_flight = 0
+        self.queue = deque()
+        self.finish = 0.0
+
+class _Waiter:
+    def __init__(self, tenant: _Tenant, tier: Tier, tag: float):
+        self.tenant = tenant
+        self.tier = tier
+        self.tag = tag
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+class Ticket:
+    """An admitted generation. `release` is idempotent."""
+    def __init__(self, controller: "AdmissionController", tenant_id, tenant: _Tenant):
+        self.controller = controller
+        self.tenant_id = tenant_id
+        self.tenant = tenant
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+class AdmissionController:
+    """
+    Admission control in front of the provider calls.
+
+    At most ADMISSION_MAX_IN_FLIGHT generations run at once, and each tenant (user)
+    at most ADMISSION_TENANT_CONCURRENCY x its tier weight. Requests over either
+    limit wait in per-tenant queues that are served by weighted fair queueing:
+    every waiter gets a virtual finish tag of 1/weight past its tenant's previous
+    one, and the smallest tag goes next, so a burst from one tenant can't starve
+    the others and higher tiers get proportionally more of the slots.
+
+    The tier comes from the key's daily limit, which subscriptions set from
+    Plan.daily_requests; ADMISSION_TIERS ("name:min_daily_limit:weight,...")
+    defines them. Requests are shed with Overloaded when ADMISSION_MAX_QUEUE
+    requests are already waiting, or after waiting ADMISSION_MAX_WAIT_MS.
+    Limits are per API worker process.
+    """
+    def __init__(self, max_in_flight: int = None, tenant_concurrency: int = None,
+                 max_queue: int = None, max_wait_ms: int = None, tiers: List[Tier] = None):
+        self.max_in_flight = max_in_flight or int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+        self.tenant_concurrency = tenant_concurrency or int(os.getenv("ADMISSION_TENANT_CONCURRENCY", "2"))
+        self.max_queue = max_queue or int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+        self.max_wait = (max_wait_ms or int(os.getenv("ADMISSION_MAX_WAIT_MS", "10000"))) / 1000
+        self.tiers = tiers or parse_tiers(os.getenv("ADMISSION_TIERS", "free:0:1,pro:100:4,enterprise:10000:16"))
+        self.in_flight = 0
+        self.waiting = 0
+        self.virtual_time = 0.0
+        self.avg_service_seconds = 1.0
+        self.stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0}
+        self._tenants = {}
+
+    def tier_for(self, daily_limit: int) -> Tier:
+        tier = self.tiers[0]
+        for candidate in self.tiers:
+            if daily_limit >= candidate.min_daily_limit:
+                tier = candidate
+        return tier
+
+    def retry_after(self) -> int:
+        """Rough time for the current queue to drain, in whole seconds."""
+        return max(1, math.ceil(self.waiting * self.avg_service_seconds / self.max_in_flight))
+
+    @asynccontextmanager
+    async def slot(self, tenant_id, daily_limit: int, shed: bool = True):
+        ticket = await self.acquire(tenant_id, daily_limit, shed)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def acquire(self, tenant_id, daily_limit: int, shed: bool = True) -> Ticket:
+        """
+        Wait for a slot. With `shed` (interactive requests) raise Overloaded
+        instead of queueing past the limits; background work just waits.
+        """
+        tier = self.tier_for(daily_limit)
+        tenant = self._tenants.setdefault(tenant_id, _Tenant())
+        if (self.in_flight < self.max_in_flight and not tenant.queue
+                and tenant.in_flight < self.tenant_concurrency * tier.weight):
+            return self._grant(tenant_id, tenant, tier, waited=0.0)
+
+        if shed and self.waiting >= self.max_queue:
+            self.stats["shed_queue_full"] += 1
+            metrics.ADMISSION_SHED.labels("queue_full").inc()
+            self._forget(tenant_id, tenant)
+            raise Overloaded("Server is busy, please retry later.", self.retry_after())
+
+        tenant.finish = max(self.virtual_time, tenant.finish) + 1 / tier.weight
+        waiter = _Waiter(tenant, tier, tenant.finish)
+        tenant.queue.append(waiter)
+        self.waiting += 1
+        self.stats["queued"] += 1
+        metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting)
+        try:
+            return await asyncio.wait_for(waiter.future, self.max_wait if shed else None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we gave up: hand the slot straight back.
+                waiter.future.result().release()
+            else:
+                # _dispatch drops cancelled waiters it finds at a queue head.
+                if waiter in tenant.queue:
+                    tenant.queue.remove(waiter)
+                    self.waiting -= 1
+                    metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting)
+                self._forget(tenant_id, tenant)
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["shed_timeout"] += 1
+                metrics.ADMISSION_SHED.labels("timeout").inc()
+                raise Overloaded("Server is busy, please retry later.", self.retry_after())
+            raise
+
+    def _grant(self, tenant_id, tenant: _Tenant, tier: Tier, waited: float) -> Ticket:
+        self.in_flight += 1
+        tenant.in_flight += 1
+        self.stats["admitted"] += 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        metrics.ADMISSION_WAIT_SECONDS.labels(tier.name).observe(waited)
+        return Ticket(self, tenant_id, tenant)
+
+    def _release(self, ticket: Ticket):
+        held = time.monotonic() - ticket.started
+        self.avg_service_seconds = 0.9 * self.avg_service_seconds + 0.1 * held
+        self.in_flight -= 1
+        ticket.tenant.in_flight -= 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        self._forget(ticket.tenant_id, ticket.tenant)
+        self._dispatch()
+
+    def _forget(self, tenant_id, tenant: _Tenant):
+        # Idle tenants are dropped; their finish tag is behind virtual_time anyway.
+        if not tenant.in_flight and not tenant.queue and self._tenants.get(tenant_id) is tenant:
+            del self._tenants[tenant_id]
+
+    def _dispatch(self):
+        """Grant free slots to the eligible waiters with the smallest finish tags."""
+        while self.in_flight < self.max_in_flight:
+            best_id, best = None, None
+            for tenant_id, tenant in self._tenants.items():
+                # A waiter cancelled (or timed out) in this same tick hasn't run its
+                # cleanup yet; granting its future would leak the slot.
+                while tenant.queue and tenant.queue[0].future.done():
+                    tenant.queue.popleft()
+                    self.waiting -= 1
+                    metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting)
+                if not tenant.queue:
+                    continue
+                head = tenant.queue[0]
+                if tenant.in_flight >= self.tenant_concurrency * head.tier.weight:
+                    continue
+                if best is None or head.tag < best.tag:
+                    best_id, best = tenant_id, head
+            if best is None:
+                return
+            best.tenant.queue.popleft()
+            self.waiting -= 1
+            metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting)
+            self.virtual_time = best.tag
+            best.future.set_result(self._grant(best_id, best.tenant, best.tier, time.monotonic() - best.enqueued_at))
+
+    def status(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "tenants": len(self._tenants),
+            "avg_service_seconds": self.avg_service_seconds,
+            **self.stats,
+        }
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that holds an admission ticket until it has finished
+    sending, however that ends: the body completes or fails, or the client
+    disconnects (possibly before the body produced its first chunk, in which
+    case the body iterator is never closed by anything else).
+    """
+    def __init__(self, content, ticket: Ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
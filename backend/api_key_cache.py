@@ -0,0 +1,108 @@
+# backend/api_key_cache.py
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "api_key_cache:invalidate"
+
+class CachedAPIKey(NamedTuple):
+    """The subset of an APIKey row the chat hot path needs."""
+    id: int
+    user_id: int
+    daily_limit: int
+    is_active: bool
+    cache_responses: bool = True
+    coalesce_requests: bool = True
+    daily_token_limit: Optional[int] = None
+
+    @classmethod
+    def from_model(cls, api_key) -> "CachedAPIKey":
+        return cls(api_key.id, api_key.user_id, api_key.daily_limit, api_key.is_active,
+                   api_key.cache_responses is not False, api_key.coalesce_requests is not False,
+                   api_key.daily_token_limit)
+
+class APIKeyCache:
+    """
+    Bounded LRU + TTL cache of validated API keys, optionally fronted by Redis.
+
+    Lookups hit the in-process dict first, then Redis (shared between workers),
+    and only fall through to Postgres on a miss. Only active keys are cached, so
+    anything that revokes or changes a key must call `invalidate`; with Redis
+    configured, invalidations are also broadcast so every worker drops its copy.
+    """
+    def __init__(self, redis_client=None, maxsize: int = None, ttl: float = None):
+        self.redis = redis_client
+        self.maxsize = maxsize or int(os.getenv("API_KEY_CACHE_SIZE", "1024"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("API_KEY_CACHE_TTL", "60"))
+        self._entries: "OrderedDict[str, tuple[float, CachedAPIKey]]" = OrderedDict()
+
+    def _store_local(self, key: str, value: CachedAPIKey):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[CachedAPIKey]:
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+
+        if self.redis:
+            try:
+                raw = await self.redis.get(f"api_key_cache:{key}")
+                if raw:
+                    value = CachedAPIKey(**json.loads(raw))
+                    self._store_local(key, value)
+                    return value
+            except Exception as e:
+                logger.warning(f"API key cache Redis lookup failed: {e}")
+        return None
+
+    async def set(self, key: str, value: CachedAPIKey):
+        if not value.is_active:
+            return
+        self._store_local(key, value)
+        if self.redis:
+            try:
+                await self.redis.set(f"api_key_cache:{key}", json.dumps(value._asdict()), ex=int(self.ttl))
+            except Exception as e:
+                logger.warning(f"API key cache Redis write failed: {e}")
+
+    async def invalidate(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+        if self.redis and keys:
+            try:
+                await self.redis.delete(*[f"api_key_cache:{key}" for key in keys])
+                for key in keys:
+                    await self.redis.publish(INVALIDATION_CHANNEL, key)
+            except Exception as e:
+                logger.warning(f"API key cache Redis invalidation failed: {e}")
+
+    async def listen_for_invalidations(self):
+        """Drop keys invalidated by other workers. Run as a background task."""
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._entries.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Anything cached while we were disconnected may have missed an
+                # invalidation, so start from scratch.
+                logger.warning(f"API key invalidation listener failed: {e}")
+                self._entries.clear()
+                await asyncio.sleep(1)
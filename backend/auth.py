@@ -1,14 +1,18 @@
 # backend/auth.py
 import os
 from dotenv import load_dotenv
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import User
+from user_cache import UserCache, UserSnapshot
 
 # Load environment variables to get the secret key
 load_dotenv()
@@ -18,6 +22,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 # Increased for better user experience
 
 security = HTTPBearer()
 
+# Decoded tokens, so repeat requests skip the signature check. Entries live until
+# the token's own expiry, bounded in count.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+_token_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+user_cache = UserCache()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -28,21 +39,53 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     token = credentials.credentials
+    payload = _token_cache.get(token)
+    if payload is not None:
+        if payload["exp"] > time.time():
+            _token_cache.move_to_end(token)
+            return payload
+        del _token_cache[token]
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
-        return user_id
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    _token_cache[token] = payload
+    while len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
 
-def get_current_user(user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == int(user_id)).first()
+def verify_token(claims: dict = Depends(token_claims)):
+    return claims["sub"]
+
+async def get_current_user(user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)) -> UserSnapshot:
+    user = user_cache.get(int(user_id))
     if user is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        row = (await db.execute(select(User).filter(User.id == int(user_id)))).scalars().first()
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        user = UserSnapshot.from_model(row)
+        user_cache.set(user)
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Account deactivated")
+    return user
+
+async def get_admin_user(claims: dict = Depends(token_claims), db: AsyncSession = Depends(get_async_db)) -> UserSnapshot:
+    """
+    Tokens carry an `adm` claim from login time. A token without it is refused
+    straight away with no user lookup. A token with it is still checked against
+    the (cached) user, so a revoked admin loses access once the cache is invalidated.
+    A newly promoted admin needs to log in again.
+    """
+    if not claims.get("adm"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    user = await get_current_user(claims["sub"], db)
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
     return user
@@ -0,0 +1,197 @@
+# backend/batch_jobs.py
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "batch:queue"
+
+class ProviderSlots:
+    """
+    Per-provider concurrency caps for batch work, so a large batch can't occupy
+    every connection to a provider and starve interactive traffic.
+
+    BATCH_PROVIDER_CONCURRENCY sets the default cap; BATCH_CONCURRENCY_<PROVIDER>
+    (e.g. BATCH_CONCURRENCY_OLLAMA) overrides it for one provider. Caps are per
+    API worker process.
+    """
+    def __init__(self, default: int = None):
+        self.default = default or int(os.getenv("BATCH_PROVIDER_CONCURRENCY", "2"))
+        self._semaphores = {}
+
+    def acquire(self, provider_name: str) -> asyncio.Semaphore:
+        """Use as `async with slots.acquire(name):` around one provider attempt."""
+        semaphore = self._semaphores.get(provider_name)
+        if semaphore is None:
+            limit = int(os.getenv(f"BATCH_CONCURRENCY_{provider_name.upper()}", str(self.default)))
+            semaphore = self._semaphores[provider_name] = asyncio.Semaphore(limit)
+        return semaphore
+
+class BatchJobs:
+    """
+    Job queue behind /api/chat/batch.
+
+    A job is a list of prompts; each prompt is queued as its own item so a pool
+    of `workers` tasks can process them concurrently, and with Redis the pool of
+    every API worker process drains the same queue. Without Redis jobs and the
+    queue live in this process only. `process(job, index, message)` does the
+    actual generation and returns the item's result dict.
+
+    Items in progress at shutdown are put back on the queue. Items taken by a
+    process that crashes are lost; they stay pending until the job expires
+    (BATCH_JOB_TTL).
+    """
+    def __init__(self, redis_client=None, process: Callable[[dict, int, str], Awaitable[dict]] = None,
+                 workers: int = None, ttl: int = None, max_local: int = 1000):
+        self.redis = redis_client
+        self.process = process
+        self.workers = workers or int(os.getenv("BATCH_WORKERS", "4"))
+        self.ttl = ttl or int(os.getenv("BATCH_JOB_TTL", "86400"))
+        self.max_local = max_local
+        self._local: "OrderedDict[str, dict]" = OrderedDict()
+        self._queue: asyncio.Queue = None
+        self._tasks = []
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job: dict, messages: List[str]) -> str:
+        """Queue `messages` as a new job; `job` holds whatever `process` needs (key, model, ...)."""
+        job_id = uuid.uuid4().hex
+        job = {**job, "id": job_id, "total": len(messages), "created_at": time.time()}
+        entries = [json.dumps([job_id, index]) for index in range(len(messages))]
+        if self.redis:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.set(f"batch:{job_id}", json.dumps(job), ex=self.ttl)
+                pipe.rpush(f"batch:{job_id}:messages", *messages)
+                pipe.expire(f"batch:{job_id}:messages", self.ttl)
+                pipe.rpush(QUEUE_KEY, *entries)
+                await pipe.execute()
+        else:
+            self._local[job_id] = {"job": job, "messages": messages, "results": {}}
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+            for entry in entries:
+                self._queue.put_nowait(entry)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        if self.redis:
+            raw = await self.redis.get(f"batch:{job_id}")
+            return json.loads(raw) if raw else None
+        local = self._local.get(job_id)
+        return local["job"] if local else None
+
+    async def results(self, job_id: str) -> dict:
+        """Finished items so far, as {index: result}."""
+        if self.redis:
+            raw = await self.redis.hgetall(f"batch:{job_id}:results")
+            return {int(index): json.loads(result) for index, result in raw.items()}
+        local = self._local.get(job_id)
+        return dict(local["results"]) if local else {}
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        job = await self.get(job_id)
+        if job is None:
+            return None
+        results = await self.results(job_id)
+        return {
+            "job_id": job_id,
+            "status": _job_status(job, results),
+            "total": job["total"],
+            "completed": len(results),
+            "failed": sum(1 for result in results.values() if result["status"] != "ok"),
+            "results": [{"index": index, **results[index]} for index in sorted(results)],
+        }
+
+    async def follow(self, job_id: str, poll_interval: float = 0.5) -> AsyncIterator[dict]:
+        """Yield each item result as it finishes (in completion order) until the job is done."""
+        job = await self.get(job_id)
+        sent = set()
+        while job is not None:
+            results = await self.results(job_id)
+            for index, result in results.items():
+                if index not in sent:
+                    sent.add(index)
+                    yield {"index": index, **result}
+            if len(sent) >= job["total"]:
+                return
+            await asyncio.sleep(poll_interval)
+            job = await self.get(job_id)
+
+    async def _next(self) -> tuple:
+        if self.redis:
+            while True:
+                try:
+                    item = await self.redis.blpop(QUEUE_KEY, timeout=5)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Batch queue read failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                if item:
+                    return tuple(json.loads(item[1]))
+        return tuple(json.loads(await self._queue.get()))
+
+    async def _requeue(self, job_id: str, index: int):
+        entry = json.dumps([job_id, index])
+        if self.redis:
+            await self.redis.lpush(QUEUE_KEY, entry)
+        else:
+            self._queue.put_nowait(entry)
+
+    async def _message(self, job_id: str, index: int) -> Optional[str]:
+        if self.redis:
+            return await self.redis.lindex(f"batch:{job_id}:messages", index)
+        local = self._local.get(job_id)
+        return local["messages"][index] if local else None
+
+    async def _save_result(self, job_id: str, index: int, result: dict):
+        if self.redis:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(f"batch:{job_id}:results", str(index), json.dumps(result))
+                pipe.expire(f"batch:{job_id}:results", self.ttl)
+                await pipe.execute()
+        elif job_id in self._local:
+            self._local[job_id]["results"][index] = result
+
+    async def _work(self):
+        while True:
+            job_id, index = await self._next()
+            try:
+                job = await self.get(job_id)
+                message = await self._message(job_id, index)
+                if job is None or message is None:
+                    continue  # expired or evicted
+                try:
+                    result = await self.process(job, index, message)
+                except asyncio.CancelledError:
+                    await self._requeue(job_id, index)
+                    raise
+                except Exception as e:
+                    logger.exception(f"Batch item {job_id}/{index} failed")
+                    result = {"status": "failed", "error": str(e)}
+                await self._save_result(job_id, index, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Could not process batch item {job_id}/{index}: {e}")
+
+def _job_status(job: dict, results: dict) -> str:
+    if len(results) >= job["total"]:
+        return "completed"
+    return "running" if results else "queued"
@@ -0,0 +1,65 @@
+# backend/batching.py
+import asyncio
+import os
+from typing import Callable, List
+from executors import inference_executor, run_blocking
+
+class BatchingEngine:
+    """
+    Dynamic micro-batcher for local model inference.
+
+    Callers `submit` a prompt and await its result. A single worker task collects
+    queued prompts for up to `max_wait_ms` (or until `max_batch_size` are waiting),
+    groups them by model and runs one `generate_batch(prompts, model_name)` call per
+    group on the inference pool. Each result is routed back to its caller's future.
+    """
+    def __init__(self, generate_batch: Callable[[List[str], str], List[str]],
+                 max_batch_size: int = None, max_wait_ms: int = None):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size or int(os.getenv("HF_MAX_BATCH_SIZE", "8"))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else int(os.getenv("HF_BATCH_WAIT_MS", "10"))) / 1000
+        self.queue: asyncio.Queue = None
+        self._worker = None
+
+    async def submit(self, prompt: str, model_name: str) -> str:
+        if self._worker is None or self._worker.done():
+            self.queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((prompt, model_name, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Requests whose caller already gave up don't need generating.
+            batch = [item for item in batch if not item[2].done()]
+            groups = {}
+            for prompt, model_name, future in batch:
+                groups.setdefault(model_name, []).append((prompt, future))
+            for model_name, items in groups.items():
+                prompts = [prompt for prompt, _ in items]
+                try:
+                    results = await run_blocking(inference_executor, self.generate_batch, prompts, model_name)
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
@@ -0,0 +1,46 @@
+# backend/benchmarks/bench_batching.py
+"""
+Requests/sec of HuggingFaceClient.chat with micro-batching versus one prompt per
+generate() call (max batch size 1, the old path), using a tiny local model.
+
+    python benchmarks/bench_batching.py [model] [concurrency] [requests]
+
+Defaults: sshleifer/tiny-gpt2, 16 concurrent callers, 64 requests.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import BatchingEngine
+from huggingface_client import HuggingFaceClient
+
+async def measure(client: HuggingFaceClient, model: str, concurrency: int, requests: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await client.chat(f"Hello there, this is request {i}", model)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+async def main(model: str, concurrency: int, requests: int):
+    client = HuggingFaceClient()
+    client.load_model(model)
+    await client.chat("warm up", model)
+    for label, max_batch_size in (("unbatched", 1), ("batched", concurrency)):
+        client.batcher = BatchingEngine(client._generate_batch, max_batch_size=max_batch_size)
+        rate = await measure(client, model, concurrency, requests)
+        print(f"{label:>10}: {rate:7.1f} req/s (max batch size {max_batch_size})")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        args[0] if args else "sshleifer/tiny-gpt2",
+        int(args[1]) if len(args) > 1 else 16,
+        int(args[2]) if len(args) > 2 else 64,
+    ))
@@ -0,0 +1,75 @@
+# backend/benchmarks/bench_passwords.py
+"""
+Login throughput at various KDF cost settings: for each rounds value, a burst
+of concurrent verify_and_update calls on kdf_executor (as verify_password runs
+them), and the same calls made inline on the event loop. Alongside logins/s it
+reports the worst event-loop stall seen by a 10 ms ticker, which is what every
+other request on the worker would wait.
+
+    PASSWORD_SCHEME=bcrypt PASSWORD_HASH_WORKERS=4 python benchmarks/bench_passwords.py [logins] [rounds ...]
+
+Rounds default to a range around the scheme's default from passwords.py.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passlib.context import CryptContext
+from executors import kdf_executor, run_blocking
+from passwords import DEFAULT_ROUNDS, SCHEME
+
+ROUNDS_RANGE = {"bcrypt": [10, 11, 12, 13], "scrypt": [14, 15, 16],
+                "pbkdf2_sha256": [200000, 600000, 1200000], "argon2": [2, 3, 4]}
+
+def make_context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=[SCHEME], **{f"{SCHEME}__default_rounds": rounds})
+
+async def max_stall(stop: asyncio.Event) -> float:
+    """Longest delay past a 10 ms sleep while `stop` is unset, in seconds."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - started - 0.01)
+    return worst
+
+async def logins(context: CryptContext, password_hash: str, count: int, offload: bool) -> tuple:
+    """Run `count` concurrent verifications. Returns (logins/s, worst loop stall in ms)."""
+    async def one():
+        if offload:
+            return await run_blocking(kdf_executor, context.verify_and_update, "correct horse", password_hash)
+        await asyncio.sleep(0)
+        return context.verify_and_update("correct horse", password_hash)
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(max_stall(stop))
+    await asyncio.sleep(0.02)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    stall = await ticker
+    assert all(valid for valid, _ in results)
+    return count / elapsed, stall * 1000
+
+async def main(count: int, rounds_list: list):
+    print(f"{SCHEME}, {kdf_executor._max_workers} KDF workers, {count} concurrent logins per setting")
+    for rounds in rounds_list:
+        context = make_context(rounds)
+        started = time.perf_counter()
+        password_hash = context.hash("correct horse")
+        single = (time.perf_counter() - started) * 1000
+        pooled, pooled_stall = await logins(context, password_hash, count, offload=True)
+        inline, inline_stall = await logins(context, password_hash, count, offload=False)
+        print(f"rounds {rounds:>8}: {single:7.1f} ms/hash   "
+              f"pool {pooled:7.1f} logins/s (loop stall {pooled_stall:7.1f} ms)   "
+              f"inline {inline:7.1f} logins/s (loop stall {inline_stall:7.1f} ms)")
+    kdf_executor.shutdown()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    rounds_list = [int(arg) for arg in args[1:]] or ROUNDS_RANGE.get(SCHEME, [DEFAULT_ROUNDS.get(SCHEME, 12)])
+    asyncio.run(main(int(args[0]) if args else 32, rounds_list))
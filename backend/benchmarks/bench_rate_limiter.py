@@ -0,0 +1,84 @@
+# backend/benchmarks/bench_rate_limiter.py
+"""
+Microbenchmark of RateLimiter.check_rate_limit: each Lua policy against the
+old sequential GET / INCR / EXPIRE / HSET x3 / EXPIRE implementation, plus a
+concurrent burst showing whether either overshoots the limit.
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_rate_limiter.py [checks] [concurrency]
+
+Without REDIS_URL it runs against fakeredis, which has no network round trips,
+so only the relative script overhead shows; use a local Redis (a scratch DB: keys
+are written) to see the round-trip savings.
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import POLICIES, RateLimiter
+
+class SequentialLimiter:
+    """The pre-Lua limiter: up to seven round trips, racing between GET and INCR."""
+    policy = "sequential"
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    async def check_rate_limit(self, api_key, daily_limit, ip_address, daily_token_limit=None):
+        today = datetime.now().strftime("%Y-%m-%d")
+        key = f"rate_limit:{api_key}:{today}"
+        count = int(await self.redis.get(key) or 0)
+        if count >= daily_limit:
+            return (False, 0)
+        count = await self.redis.incr(key)
+        await self.redis.expire(key, 86400)
+        usage = f"usage:{api_key}:{today}"
+        await self.redis.hset(usage, "last_ip", ip_address)
+        await self.redis.hset(usage, "last_seen", datetime.utcnow().isoformat())
+        await self.redis.hset(usage, "count", count)
+        await self.redis.expire(usage, 86400)
+        return (True, daily_limit - count)
+
+def connect():
+    url = os.getenv("REDIS_URL")
+    if url:
+        import redis.asyncio as redis
+        return redis.from_url(url, decode_responses=True), url
+    import fakeredis
+    return fakeredis.aioredis.FakeRedis(decode_responses=True), "fakeredis"
+
+async def throughput(limiter, checks: int, concurrency: int) -> float:
+    api_key = f"bench-{uuid.uuid4().hex}"
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await limiter.check_rate_limit(api_key, 10**9, "127.0.0.1")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(checks)))
+    return checks / (time.perf_counter() - started)
+
+async def burst(limiter, limit: int, attempts: int) -> int:
+    api_key = f"burst-{uuid.uuid4().hex}"
+    results = await asyncio.gather(*(limiter.check_rate_limit(api_key, limit, "127.0.0.1") for _ in range(attempts)))
+    return sum(1 for allowed, _ in results if allowed)
+
+async def main(checks: int, concurrency: int):
+    redis_client, target = connect()
+    print(f"Redis: {target}; {checks} checks, {concurrency} concurrent")
+    limiters = [RateLimiter(redis_client, policy=policy, window_seconds=3600) for policy in POLICIES]
+    limiters.append(SequentialLimiter(redis_client))
+    for limiter in limiters:
+        rate = await throughput(limiter, checks, concurrency)
+        allowed = await burst(limiter, limit=100, attempts=500)
+        print(f"{limiter.policy:>12}: {rate:9.0f} checks/s   burst of 500 at limit 100 -> {allowed} allowed")
+    await redis_client.aclose()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 5000, int(args[1]) if len(args) > 1 else 50))
@@ -0,0 +1,56 @@
+# backend/benchmarks/bench_response_cache.py
+"""
+Lookups/sec of ResponseCache for exact hits, semantic hits and misses.
+
+    python benchmarks/bench_response_cache.py [entries] [lookups]
+
+The semantic tier uses random unit vectors in place of a real embedding model, so
+this measures the cache itself (hashing, LRU bookkeeping, the nearest-neighbour
+scan), not embedding latency.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from response_cache import CachedResponse, ResponseCache
+
+DIMENSIONS = 384
+
+async def main(entries: int, lookups: int):
+    rng = np.random.default_rng(0)
+    vectors = {}
+
+    async def embed(text: str):
+        # Deterministic per prompt; lookups of unseen prompts reuse a stored vector
+        # so they land as semantic hits.
+        if text not in vectors:
+            vectors[text] = rng.standard_normal(DIMENSIONS)
+        return vectors[text]
+
+    cache = ResponseCache(maxsize=entries, ttl=3600, embed=embed, similarity_threshold=0.99)
+    prompts = [f"prompt number {i}" for i in range(entries)]
+    for prompt in prompts:
+        await cache.put(prompt, "default", CachedResponse("response", "ollama:mistral", 1.0))
+    for i in range(lookups):
+        vectors[f"near duplicate {i}"] = vectors[prompts[i % entries]]
+
+    async def run(label: str, make_prompt):
+        started = time.perf_counter()
+        for i in range(lookups):
+            await cache.get(make_prompt(i), "default")
+        rate = lookups / (time.perf_counter() - started)
+        print(f"{label:>14}: {rate:10.0f} lookups/s")
+
+    await run("exact hit", lambda i: prompts[i % entries])
+    await run("semantic hit", lambda i: f"near duplicate {i}")
+    cache.embed = None
+    await run("miss (exact)", lambda i: f"unseen {i}")
+    print(cache.get_stats())
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 1000, int(args[1]) if len(args) > 1 else 5000))
@@ -0,0 +1,69 @@
+# backend/benchmarks/bench_usage_rollups.py
+"""
+Seed synthetic ChatLog rows, backfill the usage rollups, and compare analytics
+served from usage_rollups with the same totals computed by scanning chat_logs.
+
+    DATABASE_URL=postgresql://.../scratch python benchmarks/bench_usage_rollups.py [rows]
+
+Defaults to 2,000,000 rows. It inserts into (and backfills) whatever database
+DATABASE_URL points at, so only run it against a scratch database.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select
+from database import AsyncSessionLocal, async_engine, engine
+from models import ChatLog
+import usage_rollups
+
+USERS = 500
+MODELS = ["ollama:mistral", "ollama:llama2", "gemini:pro", "huggingface:default"]
+DAYS = 90
+CHUNK = 20000
+
+def seed(rows: int):
+    rng = random.Random(0)
+    start = datetime.utcnow() - timedelta(days=DAYS)
+    with engine.begin() as conn:
+        for offset in range(0, rows, CHUNK):
+            conn.execute(insert(ChatLog), [
+                dict(user_id=user_id, api_key_id=user_id, model=rng.choice(MODELS), message="m", response="r",
+                     created_at=start + timedelta(seconds=rng.randrange(DAYS * 86400)),
+                     total_tokens=rng.randrange(20, 400), latency_ms=rng.randrange(50, 3000))
+                for user_id in (rng.randrange(1, USERS + 1) for _ in range(min(CHUNK, rows - offset)))
+            ])
+            print(f"Seeded {min(offset + CHUNK, rows):,} rows", end="\r")
+    print()
+
+async def timed(label: str, coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    print(f"{label:>32}: {(time.perf_counter() - started) * 1000:9.1f} ms")
+    return result
+
+async def scan(db, since: datetime):
+    query = (select(ChatLog.model, func.count(), func.sum(ChatLog.total_tokens), func.sum(ChatLog.latency_ms))
+             .filter(ChatLog.created_at >= since).group_by(ChatLog.model))
+    return (await db.execute(query)).all()
+
+async def main(rows: int):
+    seed(rows)
+    await timed("backfill", usage_rollups.backfill())
+    since = datetime.utcnow() - timedelta(days=30)
+    async with AsyncSessionLocal() as db:
+        for _ in range(2):  # second round runs with warm caches
+            await timed("scan chat_logs by model (30d)", scan(db, since))
+            await timed("rollups by model (30d)", usage_rollups.query_usage(db, since, None, "model"))
+            await timed("rollups by user (30d)", usage_rollups.query_usage(db, since, None, "user"))
+            await timed("rollups hourly buckets (30d)", usage_rollups.query_usage(db, since, None, "bucket", "hour"))
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 2000000))
@@ -0,0 +1,128 @@
+# backend/benchmarks/harness.py
+"""
+Shared setup for the load-test scripts: a stand-in Ollama server with a fixed
+generation latency, and the API running in-process (lifespan included) with one
+enterprise-tier API key. Requests go through httpx's ASGI transport, so what is
+measured is the app and its event loop, not a network hop.
+
+Uses DATABASE_URL if set, otherwise a scratch SQLite file. LOG_LEVEL defaults
+to WARNING.
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "chatbot-loadtest.db"))
+# Per-request INFO logs would drown the results.
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+
+class SlowOllama:
+    """Answers /api/generate after `latency` seconds, each request on its own thread."""
+    def __init__(self, latency: float):
+        self.generated = 0
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.reply({"models": [{"name": "mistral:latest"}]})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(latency)
+                stand_in.generated += 1
+                self.reply({"response": "ok", "done": True, "prompt_eval_count": 5, "eval_count": 5})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+async def create_api_key(daily_limit: int = 10**9, coalesce_requests: bool = False) -> str:
+    """A fresh user and API key; the limit puts it in the top admission tier."""
+    from database import AsyncSessionLocal
+    from models import APIKey, User
+    suffix = uuid.uuid4().hex[:12]
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"load-{suffix}@example.com", username=f"load-{suffix}", password_hash="-")
+        db.add(user)
+        await db.flush()
+        key = f"load-{suffix}"
+        db.add(APIKey(user_id=user.id, key=key, name="load test", daily_limit=daily_limit,
+                      cache_responses=False, coalesce_requests=coalesce_requests))
+        await db.commit()
+    return key
+
+@asynccontextmanager
+async def running_app(ollama_latency: float):
+    """Yield (client, api_key, ollama) with the app started against a SlowOllama."""
+    ollama = SlowOllama(ollama_latency)
+    os.environ["OLLAMA_URL"] = ollama.url
+    import migrate
+    migrate.migrate()
+    import main
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            api_key = await create_api_key()
+            transport = httpx.ASGITransport(app=main.app, client=("127.0.0.1", 12345))
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=300) as client:
+                yield client, api_key, ollama
+    finally:
+        ollama.stop()
+
+async def fire(client: httpx.AsyncClient, api_key: str, requests: int, concurrency: int,
+               body: dict = None) -> tuple:
+    """POST /api/chat `requests` times, `concurrency` at once. Returns (latencies, wall seconds, failures)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", headers={"X-API-Key": api_key},
+                                         json=body or {"message": f"load test {uuid.uuid4().hex} #{i}"})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, time.perf_counter() - started, failures
+
+def summarize(latencies: list) -> str:
+    ordered = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+
+    return (f"p50 {pct(50):7.1f} ms  p95 {pct(95):7.1f} ms  p99 {pct(99):7.1f} ms  "
+            f"mean {statistics.mean(ordered) * 1000:7.1f} ms")
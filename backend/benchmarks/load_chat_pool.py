@@ -0,0 +1,62 @@
+# backend/benchmarks/load_chat_pool.py
+"""
+Load test: /api/chat latency and database pool behaviour at rising concurrency.
+
+For each concurrency level it fires a burst of chat requests and reports the
+latency percentiles next to the pool's checkout wait (average and worst), the
+peak connections in use and in overflow, and checkout timeouts, taken from
+database.pool_status(). Run it against the real database with the settings to
+compare, e.g.
+
+    DATABASE_URL=postgresql://... DB_POOL_SIZE=5 DB_MAX_OVERFLOW=0 DB_PRE_PING=always \
+        python benchmarks/load_chat_pool.py [requests] [latency_seconds] [concurrency ...]
+
+On the default scratch SQLite file there is no QueuePool (SQLite keeps its own
+pooling), so only the latencies are meaningful.
+"""
+import asyncio
+import sys
+from harness import fire, running_app, summarize
+
+async def sample_peaks(done: asyncio.Event, peaks: dict):
+    from database import pool_status
+    while not done.is_set():
+        status = pool_status()
+        for field in ("in_use", "overflow"):
+            if field in status:
+                peaks[field] = max(peaks.get(field, 0), status[field])
+        await asyncio.sleep(0.005)
+
+async def main(requests: int, latency: float, levels: list):
+    from database import pool_metrics, pool_status
+    async with running_app(latency) as (client, api_key, ollama):
+        status = pool_status()
+        print(f"{status['pool']} (pre_ping={status['pre_ping']}, size={status.get('size', '-')}, "
+              f"max_overflow={status.get('max_overflow', '-')}); "
+              f"{requests} requests per level, {latency * 1000:.0f} ms per generation")
+        for concurrency in levels:
+            before = pool_status()
+            peaks = {}
+            done = asyncio.Event()
+            sampler = asyncio.create_task(sample_peaks(done, peaks))
+            pool_metrics.checkout_seconds_max = 0.0
+            latencies, wall, failures = await fire(client, api_key, requests, concurrency)
+            done.set()
+            await sampler
+            after = pool_status()
+            checkouts = after["checkouts"] - before["checkouts"]
+            wait = after["checkout_seconds_total"] - before["checkout_seconds_total"]
+            print(f"  c={concurrency:<4} {summarize(latencies)}  {requests / wall:6.1f} req/s")
+            print(f"         pool: {checkouts} checkouts, wait avg {1000 * wait / checkouts if checkouts else 0:.2f} ms "
+                  f"max {after['checkout_wait_max_ms']:.2f} ms, peak in_use {peaks.get('in_use', '-')} "
+                  f"overflow {peaks.get('overflow', '-')}, "
+                  f"timeouts {after['checkout_timeouts'] - before['checkout_timeouts']}"
+                  + (f", {len(failures)} failed: {sorted(set(failures))}" if failures else ""))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if args else 100,
+        float(args[1]) if len(args) > 1 else 0.05,
+        [int(arg) for arg in args[2:]] or [1, 10, 25, 50],
+    ))
@@ -0,0 +1,42 @@
+# backend/benchmarks/load_coalescing.py
+"""
+Load test: a burst of identical /api/chat prompts, with and without request
+coalescing on the API key. With coalescing the burst should cost one upstream
+generation (or a few, if requests arrive after the first one finishes); without
+it, one per request.
+
+    python benchmarks/load_coalescing.py [requests] [latency_seconds]
+
+Exits with status 1 if coalescing didn't cut the upstream generations by at
+least half.
+"""
+import asyncio
+import sys
+from harness import create_api_key, fire, running_app, summarize
+
+async def main(requests: int, latency: float) -> bool:
+    body = {"message": "Hi! What can you help me with?"}
+    generations = {}
+    async with running_app(latency) as (client, _, ollama):
+        print(f"{requests} identical prompts at once, {latency * 1000:.0f} ms per generation")
+        for coalesce in (False, True):
+            api_key = await create_api_key(coalesce_requests=coalesce)
+            before = ollama.generated
+            latencies, wall, failures = await fire(client, api_key, requests, requests, body)
+            generations[coalesce] = ollama.generated - before
+            print(f"  coalesce={str(coalesce):<5} {generations[coalesce]:4d} generations  "
+                  f"wall {wall:5.2f} s  {summarize(latencies)}"
+                  + (f"  {len(failures)} failed: {sorted(set(failures))}" if failures else ""))
+        import main as app_main
+        print(f"  single_flight stats: {app_main.provider_router.single_flight.stats}")
+    ok = generations[True] * 2 <= generations[False]
+    print("OK: identical prompts were coalesced" if ok else "FAIL: identical prompts were not coalesced")
+    return ok
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    ok = asyncio.run(main(
+        int(args[0]) if args else 50,
+        float(args[1]) if len(args) > 1 else 0.5,
+    ))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,56 @@
+# backend/benchmarks/load_concurrency.py
+"""
+Load test: concurrent /api/chat requests must overlap, not serialize.
+
+Every generation on the stand-in Ollama takes LATENCY seconds. If anything in
+the request path blocked the event loop (a sync DB session, sync Redis, an
+inline SDK call), N requests would take about N x LATENCY. Meanwhile a probe
+polls /api/models to show the loop stays responsive under load.
+
+    python benchmarks/load_concurrency.py [requests] [concurrency] [latency_seconds]
+
+Exits with status 1 if the requests ran less than half as concurrently as allowed.
+"""
+import asyncio
+import sys
+import time
+from harness import fire, running_app, summarize
+
+async def main(requests: int, concurrency: int, latency: float) -> bool:
+    async with running_app(latency) as (client, api_key, ollama):
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/api/models")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        probe_task = asyncio.create_task(probe())
+        latencies, wall, failures = await fire(client, api_key, requests, concurrency)
+        done.set()
+        await probe_task
+
+    serial = requests * latency
+    ideal = -(-requests // concurrency) * latency
+    overlap = serial / wall
+    print(f"{requests} requests, {concurrency} concurrent, {latency * 1000:.0f} ms per generation")
+    print(f"  wall time {wall:.2f} s (serialized: {serial:.2f} s, ideal: {ideal:.2f} s) -> {overlap:.1f}x overlap")
+    print(f"  chat      {summarize(latencies)}")
+    print(f"  probe     {summarize(probe_latencies)}  ({len(probe_latencies)} samples)")
+    if failures:
+        print(f"  {len(failures)} failed requests: {sorted(set(failures))}")
+    ok = not failures and overlap >= min(requests, concurrency) / 2
+    print("OK: requests overlap" if ok else "FAIL: requests are serializing")
+    return ok
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    ok = asyncio.run(main(
+        int(args[0]) if args else 40,
+        int(args[1]) if len(args) > 1 else 20,
+        float(args[2]) if len(args) > 2 else 0.25,
+    ))
+    sys.exit(0 if ok else 1)
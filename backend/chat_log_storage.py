@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Time-partitioned chat_logs storage, retention and cold archival.
+
+On Postgres chat_logs is a table partitioned by RANGE (created_at), with one
+partition per month (chat_logs_y2024m05). Inserts only touch the current month's
+partition and its indexes, and old months are removed by dropping their
+partition instead of a huge DELETE. Rows for a month without a partition land
+in the DEFAULT partition (chat_logs_default) instead of failing the insert;
+the next `archive` run moves them into their month's partition. SQLite has no partitioning, so there the
+same retention job deletes expired rows by created_at range.
+
+Usage:
+    python chat_log_storage.py partition   # convert an existing chat_logs table
+    python chat_log_storage.py archive     # archive and drop expired months (run daily)
+
+Archives are gzipped JSON Lines, one file per month, written to
+CHAT_LOG_ARCHIVE_DIR. Months that end before CHAT_LOG_RETENTION_DAYS ago are
+archived and removed from the hot table.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, text
+
+load_dotenv()
+
+from database import engine
+from models import ChatLog
+
+RETENTION_DAYS = int(os.getenv("CHAT_LOG_RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("CHAT_LOG_ARCHIVE_DIR", "archive/chat_logs")
+# How many months ahead of the current one get a partition created in advance.
+# Rows past that still insert, into the default partition, but scanning and
+# splitting it gets slower the more it holds, so run `archive` at least this often.
+MONTHS_AHEAD = int(os.getenv("CHAT_LOG_PARTITIONS_AHEAD", "2"))
+DEFAULT_PARTITION = "chat_logs_default"
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"chat_logs_y{month.year}m{month.month:02d}"
+
+def is_partitioned(conn) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('chat_logs')")) == "p"
+
+def ensure_partitions(conn, start: Optional[date] = None, through: Optional[date] = None):
+    """
+    Create the default partition and any missing monthly partitions from `start`
+    through MONTHS_AHEAD months from now, plus one for every month that has
+    rows sitting in the default partition.
+    """
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF chat_logs DEFAULT"))
+    month = start or month_start(datetime.utcnow())
+    last = through or month_start(datetime.utcnow())
+    for _ in range(MONTHS_AHEAD):
+        last = next_month(last)
+    months = set()
+    while month <= last:
+        months.add(month)
+        month = next_month(month)
+    stray = conn.scalars(text(
+        f"SELECT DISTINCT date_trunc('month', created_at) FROM {DEFAULT_PARTITION} WHERE created_at IS NOT NULL"
+    )).all()
+    months.update(month_start(value) for value in stray)
+    for month in sorted(months):
+        create_partition(conn, month)
+
+def create_partition(conn, month: date):
+    """
+    Create one month's partition if it doesn't exist yet. Postgres refuses to
+    add a partition while the default partition holds rows in its range, so
+    those rows are moved into a new table first, which is then attached.
+    """
+    name = partition_name(month)
+    if conn.scalar(text(f"SELECT to_regclass('{name}')")):
+        return
+    bounds = f"FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    in_month = f"created_at >= '{month.isoformat()}' AND created_at < '{next_month(month).isoformat()}'"
+    if not conn.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})")):
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF chat_logs FOR VALUES {bounds}"))
+        return
+    conn.execute(text(f"CREATE TABLE {name} (LIKE chat_logs INCLUDING DEFAULTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ))
+    conn.execute(text(f"ALTER TABLE chat_logs ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    print(f"Moved {month:%Y-%m} chat logs out of the default partition into {name}")
+
+def partition_chat_logs(conn):
+    """
+    Rebuild chat_logs as a partitioned table and move the existing rows into it.
+
+    Postgres can't partition a table in place: the old table is renamed, a
+    partitioned copy takes its name, rows are copied across and the old table
+    is dropped. The primary key becomes (id, created_at) because it has to
+    include the partition key. This rewrites the table, so on a large
+    deployment run it during a maintenance window.
+    """
+    if is_partitioned(conn):
+        return
+    sequence = conn.scalar(text("SELECT pg_get_serial_sequence('chat_logs', 'id')"))
+    conn.execute(text("ALTER TABLE chat_logs RENAME TO chat_logs_unpartitioned"))
+    conn.execute(text("UPDATE chat_logs_unpartitioned SET created_at = now() AT TIME ZONE 'utc' WHERE created_at IS NULL"))
+    conn.execute(text(
+        "CREATE TABLE chat_logs (LIKE chat_logs_unpartitioned INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    ))
+    oldest, newest = conn.execute(text("SELECT min(created_at), max(created_at) FROM chat_logs_unpartitioned")).one()
+    ensure_partitions(conn, month_start(oldest) if oldest else None,
+                      max(month_start(newest), month_start(datetime.utcnow())) if newest else None)
+    conn.execute(text("INSERT INTO chat_logs SELECT * FROM chat_logs_unpartitioned"))
+    if sequence:
+        # Otherwise dropping the old table would drop the id sequence with it.
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY chat_logs.id"))
+    conn.execute(text("DROP TABLE chat_logs_unpartitioned"))
+    # Constraints and indexes are added after the drop so their names are free again.
+    conn.execute(text("ALTER TABLE chat_logs ADD PRIMARY KEY (id, created_at)"))
+    for fk in ChatLog.__table__.foreign_keys:
+        conn.execute(text(
+            f"ALTER TABLE chat_logs ADD FOREIGN KEY ({fk.parent.name}) "
+            f"REFERENCES {fk.column.table.name} ({fk.column.name})"
+        ))
+    for index in ChatLog.__table__.indexes:
+        index.create(conn)
+    print("Partitioned chat_logs by month")
+
+def list_partitions(conn) -> List[date]:
+    names = conn.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'chat_logs'::regclass"
+    )).all()
+    months = []
+    for name in names:
+        if name == DEFAULT_PARTITION:
+            continue
+        try:
+            months.append(datetime.strptime(name, "chat_logs_y%Ym%m").date())
+        except ValueError:
+            print(f"WARNING: Skipping unexpected chat_logs partition {name}")
+    return sorted(months)
+
+def export_month(conn, month: date) -> Optional[str]:
+    """Write one month of chat logs to a gzipped JSONL file; returns its path (None if empty)."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"{partition_name(month)}.jsonl.gz")
+    columns = ChatLog.__table__.columns
+    rows = conn.execute(
+        select(columns)
+        .filter(ChatLog.created_at >= month, ChatLog.created_at < next_month(month))
+        .order_by(ChatLog.id),
+        execution_options={"stream_results": True}
+    )
+    count = 0
+    # Write to a temporary name so a crash never leaves a truncated archive behind.
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        for partition in rows.mappings().partitions(1000):
+            for row in partition:
+                f.write(json.dumps(dict(row), default=str) + "\n")
+                count += 1
+    if not count:
+        os.remove(path + ".tmp")
+        return None
+    os.replace(path + ".tmp", path)
+    print(f"Archived {count} chat logs to {path}")
+    return path
+
+def archive_expired(retention_days: int = RETENTION_DAYS):
+    """Archive and remove every whole month older than the retention window."""
+    cutoff = month_start(datetime.utcnow() - timedelta(days=retention_days))
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            for month in list_partitions(conn):
+                if month >= cutoff:
+                    continue
+                export_month(conn, month)
+                conn.execute(text(f"DROP TABLE {partition_name(month)}"))
+                print(f"Dropped partition {partition_name(month)}")
+            ensure_partitions(conn)
+            return
+        oldest = conn.scalar(select(ChatLog.created_at).order_by(ChatLog.created_at).limit(1))
+        if not oldest:
+            return
+        month = month_start(oldest)
+        while month < cutoff:
+            export_month(conn, month)
+            conn.execute(delete(ChatLog).filter(
+                ChatLog.created_at >= month, ChatLog.created_at < next_month(month)))
+            month = next_month(month)
+
+if __name__ == "__main__":
+    import sys
+    command = sys.argv[1:]
+    if command == ["partition"]:
+        with engine.begin() as conn:
+            if conn.dialect.name != "postgresql":
+                raise Exception(f"Partitioning needs Postgres, not {conn.dialect.name}")
+            partition_chat_logs(conn)
+            ensure_partitions(conn)
+    elif command == ["archive"]:
+        archive_expired()
+    else:
+        print("usage: python chat_log_storage.py partition|archive")
@@ -0,0 +1,128 @@
+# backend/chat_log_writer.py
+import asyncio
+import logging
+import os
+from datetime import datetime
+from sqlalchemy import insert
+from database import AsyncSessionLocal
+from models import ChatLog
+import usage_rollups
+
+logger = logging.getLogger(__name__)
+
+CHAT_LOG_COLUMNS = set(ChatLog.__table__.columns.keys())
+
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest", "inline")
+
+_STOP = object()
+
+class ChatLogWriter:
+    """
+    Background pipeline that takes ChatLog inserts off the request path.
+
+    `log()` only enqueues a row; a single worker drains the bounded queue and
+    bulk-inserts whenever `batch_size` rows are waiting or `flush_interval_ms`
+    has passed since the first row of the batch, whichever comes first. Each
+    batch is also folded into the usage rollups. Rows with `error=True` record a
+    failed request: they only count towards the rollups and aren't inserted.
+
+    When the queue is full the overflow policy decides what happens:
+      - block:       wait for room (backpressure onto the request)
+      - drop_newest: discard the incoming row
+      - drop_oldest: discard the oldest queued row to make room
+      - inline:      write the row directly, bypassing the queue
+    """
+    def __init__(self, batch_size: int = None, flush_interval_ms: int = None,
+                 max_queue: int = None, overflow: str = None):
+        self.batch_size = batch_size or int(os.getenv("CHAT_LOG_BATCH_SIZE", "100"))
+        self.flush_interval = (flush_interval_ms or int(os.getenv("CHAT_LOG_FLUSH_MS", "500"))) / 1000
+        self.max_queue = max_queue or int(os.getenv("CHAT_LOG_MAX_QUEUE", "10000"))
+        self.overflow = overflow or os.getenv("CHAT_LOG_OVERFLOW", "block")
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown chat log overflow policy '{self.overflow}', expected one of {OVERFLOW_POLICIES}")
+        self.queue: asyncio.Queue = None
+        self.dropped = 0
+        self._task = None
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the worker."""
+        if not self._task:
+            return
+        await self.queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def log(self, row: dict):
+        # Stamp the row now; the column default would otherwise record flush time.
+        row.setdefault("created_at", datetime.utcnow())
+        if not self._task:
+            await self._write([row])
+            return
+        try:
+            self.queue.put_nowait(row)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow == "block":
+            await self.queue.put(row)
+        elif self.overflow == "drop_newest":
+            self.dropped += 1
+        elif self.overflow == "drop_oldest":
+            oldest = self.queue.get_nowait()
+            if oldest is _STOP:
+                self.queue.put_nowait(oldest)
+                self.dropped += 1
+                return
+            self.dropped += 1
+            self.queue.put_nowait(row)
+        else:
+            await self._write([row])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+
+    async def _write(self, rows: list):
+        log_rows = [
+            {key: value for key, value in row.items() if key in CHAT_LOG_COLUMNS}
+            for row in rows if not row.get("error")
+        ]
+        async with AsyncSessionLocal() as db:
+            if log_rows:
+                try:
+                    # A list of parameter dicts makes this a single executemany INSERT.
+                    await db.execute(insert(ChatLog), log_rows)
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    self.dropped += len(log_rows)
+                    logger.error(f"Failed to write {len(log_rows)} chat log rows: {e}")
+            try:
+                await usage_rollups.apply(db, usage_rollups.aggregate(rows))
+                await db.commit()
+            except Exception as e:
+                logger.error(f"Failed to update usage rollups for {len(rows)} rows: {e}")
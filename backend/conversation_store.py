@@ -0,0 +1,213 @@
+# backend/conversation_store.py
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+from sqlalchemy import select, update
+from database import AsyncSessionLocal
+from models import ChatLog, Conversation
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap provider-agnostic token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+class ConversationState:
+    """
+    Server-side state of one conversation: a rolling summary of old turns, the
+    recent (user, assistant) turns, and Ollama's `context` token array from the
+    last turn if Ollama generated it, which lets the next turn skip re-prefilling
+    the whole history.
+    """
+    def __init__(self, id: int, user_id: int, summary: str = "", turns: List[list] = None,
+                 context: List[int] = None, context_model: str = None):
+        self.id = id
+        self.user_id = user_id
+        self.summary = summary or ""
+        self.turns = turns or []
+        self.context = context
+        self.context_model = context_model
+
+    def to_json(self) -> str:
+        return json.dumps(self.__dict__)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "ConversationState":
+        return cls(**json.loads(raw))
+
+    def prompt_for(self, message: str, token_budget: int) -> str:
+        """
+        Build a text prompt from the summary plus as many of the most recent turns
+        as fit within `token_budget`, ending with the new message.
+        """
+        tail = f"User: {message}\nAssistant:"
+        budget = token_budget - estimate_tokens(tail)
+        header = f"Summary of the earlier conversation: {self.summary}\n\n" if self.summary else ""
+        budget -= estimate_tokens(header) if header else 0
+        window = []
+        for user_text, assistant_text in reversed(self.turns):
+            turn = f"User: {user_text}\nAssistant: {assistant_text}\n"
+            cost = estimate_tokens(turn)
+            if cost > budget:
+                break
+            budget -= cost
+            window.append(turn)
+        return header + "".join(reversed(window)) + tail
+
+class ConversationContext(NamedTuple):
+    """What a provider needs to continue a conversation (see provider_router.Provider)."""
+    state: ConversationState
+    token_budget: int
+
+    def prompt(self, message: str) -> str:
+        return self.state.prompt_for(message, self.token_budget)
+
+class ConversationStore:
+    """
+    Keeps conversation state in Redis (or an in-process LRU without Redis) so each
+    turn can assemble its context without querying chat_logs. If the state has
+    expired, it is rebuilt from the Conversation row and its ChatLog history.
+
+    Once the stored turns exceed the token budget, the oldest turns are dropped
+    from the window; with a `summarize` callable they are first folded into the
+    conversation's rolling summary in the background.
+    """
+    def __init__(self, redis_client=None, token_budget: int = None, ttl: int = None,
+                 summarize: Optional[Callable[[str], Awaitable[str]]] = None, max_local: int = 10000):
+        self.redis = redis_client
+        self.token_budget = token_budget or int(os.getenv("CONVERSATION_TOKEN_BUDGET", "2000"))
+        self.ttl = ttl or int(os.getenv("CONVERSATION_TTL", str(7 * 86400)))
+        self.summarize = summarize
+        self.max_local = max_local
+        self._local: "OrderedDict[int, str]" = OrderedDict()
+        # The loop only keeps weak references to tasks, so in-flight summaries live here.
+        self._tasks = set()
+
+    async def stop(self):
+        """Cancel summaries still in flight."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _summary_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Conversation summary failed: {task.exception()}")
+
+    async def _save(self, state: ConversationState):
+        raw = state.to_json()
+        if self.redis:
+            try:
+                await self.redis.set(f"conversation:{state.id}", raw, ex=self.ttl)
+                return
+            except Exception as e:
+                logger.warning(f"Could not save conversation {state.id} to Redis: {e}")
+        self._local[state.id] = raw
+        self._local.move_to_end(state.id)
+        while len(self._local) > self.max_local:
+            self._local.popitem(last=False)
+
+    async def _load_cached(self, conversation_id: int) -> Optional[ConversationState]:
+        raw = None
+        if self.redis:
+            try:
+                raw = await self.redis.get(f"conversation:{conversation_id}")
+            except Exception as e:
+                logger.warning(f"Could not load conversation {conversation_id} from Redis: {e}")
+        if raw is None:
+            raw = self._local.get(conversation_id)
+        return ConversationState.from_json(raw) if raw else None
+
+    async def _load_from_db(self, conversation_id: int) -> Optional[ConversationState]:
+        async with AsyncSessionLocal() as db:
+            conversation = await db.get(Conversation, conversation_id)
+            if not conversation:
+                return None
+            logs = (await db.execute(
+                select(ChatLog.message, ChatLog.response)
+                .filter(ChatLog.conversation_id == conversation_id)
+                .order_by(ChatLog.id.desc())
+                .limit(50)
+            )).all()
+        state = ConversationState(conversation.id, conversation.user_id, conversation.summary,
+                                  [[message, response] for message, response in reversed(logs)])
+        self._trim(state)
+        return state
+
+    async def create(self, user_id: int, api_key_id: int) -> ConversationState:
+        async with AsyncSessionLocal() as db:
+            conversation = Conversation(user_id=user_id, api_key_id=api_key_id)
+            db.add(conversation)
+            await db.commit()
+        state = ConversationState(conversation.id, user_id)
+        await self._save(state)
+        return state
+
+    async def get(self, conversation_id: int, user_id: int) -> Optional[ConversationState]:
+        """Return the conversation if it exists and belongs to `user_id`."""
+        state = await self._load_cached(conversation_id)
+        if state is None:
+            state = await self._load_from_db(conversation_id)
+            if state:
+                await self._save(state)
+        if state is None or state.user_id != user_id:
+            return None
+        return state
+
+    def context_for(self, state: ConversationState) -> ConversationContext:
+        return ConversationContext(state, self.token_budget)
+
+    def _trim(self, state: ConversationState) -> list:
+        """Drop the oldest turns until the rest fit the token budget; returns the dropped turns."""
+        total = sum(estimate_tokens(user_text) + estimate_tokens(assistant_text)
+                    for user_text, assistant_text in state.turns)
+        dropped = []
+        while total > self.token_budget and len(state.turns) > 1:
+            user_text, assistant_text = state.turns.pop(0)
+            total -= estimate_tokens(user_text) + estimate_tokens(assistant_text)
+            dropped.append([user_text, assistant_text])
+        return dropped
+
+    async def append(self, state: ConversationState, message: str, response: str,
+                     model_used: str, context: List[int] = None):
+        state.turns.append([message, response])
+        state.context = context
+        state.context_model = model_used if context else None
+        dropped = self._trim(state)
+        if dropped:
+            # Ollama's context array covers the full untrimmed history, so stop
+            # reusing it and let the next turn re-prefill from the budgeted window.
+            state.context = None
+            state.context_model = None
+            if self.summarize:
+                task = asyncio.create_task(self._summarize(state.id, state.summary, dropped))
+                self._tasks.add(task)
+                task.add_done_callback(self._summary_done)
+        await self._save(state)
+
+    async def _summarize(self, conversation_id: int, summary: str, dropped: list):
+        transcript = "".join(f"User: {u}\nAssistant: {a}\n" for u, a in dropped)
+        try:
+            new_summary = await self.summarize(
+                "Summarize the following conversation in a few sentences, keeping any facts "
+                f"the assistant will need later.\n\nEarlier summary: {summary}\n\n{transcript}"
+            )
+        except Exception as e:
+            logger.warning(f"Could not summarize conversation {conversation_id}: {e}")
+            return
+        state = await self._load_cached(conversation_id)
+        if state:
+            state.summary = new_summary
+            await self._save(state)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(summary=new_summary, updated_at=datetime.utcnow())
+            )
+            await db.commit()
@@ -4,10 +4,11 @@ Create admin user for the AI Chatbot system
 """
 from dotenv import load_dotenv
 import os
-import hashlib
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-from models import User, Plan, Base
+from database import SessionLocal
+from models import User, Plan
+from migrate import migrate
+from passwords import pwd_context
 import uuid
 
 load_dotenv()
@@ -16,7 +17,7 @@ print("DATABASE_URL from .env file is:", os.getenv("DATABASE_URL"))
 
 def create_admin_user():
     # Create tables if they don't exist
-    Base.metadata.create_all(bind=engine)
+    migrate()
     
     db = SessionLocal()
     
@@ -29,7 +30,7 @@ def create_admin_user():
         
         # Create admin user
         admin_password = "admin123"  # Change this!
-        hashed_password = hashlib.sha256(admin_password.encode()).hexdigest()
+        hashed_password = pwd_context.hash(admin_password)
         
         admin = User(
             email="admin@chatbot.com",
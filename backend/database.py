@@ -1,8 +1,12 @@
 # backend/database.py
 import os
+import time
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 
 # Load environment variables from .env file
@@ -13,15 +17,152 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("FATAL ERROR: DATABASE_URL environment variable is not set. Please check your .env file.")
 
-# FIX: Added pool_pre_ping=True to handle database connection timeouts
-# This is crucial for serverless/cloud databases like NeonDB.
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True
-)
+# Pool tuning. NeonDB and similar serverless databases drop idle connections, which
+# is what pool_pre_ping used to guard against, at the cost of an extra round trip
+# on every checkout. DB_PRE_PING picks the trade-off:
+#   always: ping on every checkout (the old behaviour)
+#   idle:   only ping connections idle longer than DB_PING_IDLE_SECONDS (default).
+#           Busy connections skip the round trip; one idle long enough to have
+#           been dropped is pinged and, if dead, transparently replaced.
+# There is no mode without pings: a request's session runs several queries, so a
+# dropped connection can't be safely retried underneath it and would fail the
+# request. Set DB_PING_IDLE_SECONDS below the server's idle timeout, and keep
+# DB_POOL_RECYCLE below its connection lifetime.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+POOL_USE_LIFO = os.getenv("DB_POOL_USE_LIFO", "true").lower() == "true"
+PRE_PING = os.getenv("DB_PRE_PING", "idle")
+PING_IDLE_SECONDS = float(os.getenv("DB_PING_IDLE_SECONDS", "30"))
+if PRE_PING not in ("always", "idle"):
+    raise ValueError(f"Unknown DB_PRE_PING '{PRE_PING}', expected always or idle")
+
+class PoolMetrics:
+    """Checkout counters shared by both engines' pools."""
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+        self.timeouts = 0
+        self.idle_pings = 0
+        self.invalidations = 0
+
+    def record_checkout(self, seconds: float):
+        self.checkouts += 1
+        self.checkout_seconds_total += seconds
+        self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+pool_metrics = PoolMetrics()
+
+def _timed_pool(pool_class):
+    class TimedPool(pool_class):
+        def connect(self):
+            # Covers waiting for a free slot, opening overflow connections and pings.
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            except exc.TimeoutError:
+                pool_metrics.timeouts += 1
+                raise
+            finally:
+                pool_metrics.record_checkout(time.perf_counter() - started)
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+def _pool_kwargs(url, pool_class) -> dict:
+    # SQLite keeps the dialect's own pooling (NullPool for aiosqlite files).
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return dict(
+        poolclass=_timed_pool(pool_class),
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        # LIFO keeps the hottest few connections busy and lets the rest go idle
+        # and get recycled, instead of cycling through (and re-pinging) all of them.
+        pool_use_lifo=POOL_USE_LIFO,
+        pool_pre_ping=PRE_PING == "always",
+    )
+
+def _instrument(sync_engine):
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.invalidations += 1
+
+    if PRE_PING == "idle":
+        @event.listens_for(sync_engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            checked_in_at = connection_record.info.get("checked_in_at")
+            if checked_in_at is None or time.monotonic() - checked_in_at < PING_IDLE_SECONDS:
+                return
+            pool_metrics.idle_pings += 1
+            try:
+                sync_engine.dialect.do_ping(dbapi_connection)
+            except Exception as e:
+                # Makes the pool discard this connection and check out a fresh one.
+                raise exc.DisconnectionError(f"Idle connection failed ping: {e}")
+
+engine = create_engine(DATABASE_URL, **_pool_kwargs(DATABASE_URL, QueuePool))
+_instrument(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(url: str):
+    """
+    Map the sync DATABASE_URL onto its async driver (asyncpg / aiosqlite).
+    asyncpg doesn't understand libpq-only query params like `sslmode` or
+    `channel_binding` that NeonDB connection strings carry, so translate those.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode and sslmode != "disable":
+            query["ssl"] = "require"
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+# The API routes use this async engine so DB round trips never block the event loop.
+# The sync engine above is kept for scripts like create_admin.py.
+async_engine = create_async_engine(_async_url(DATABASE_URL), **_pool_kwargs(DATABASE_URL, AsyncAdaptedQueuePool))
+_instrument(async_engine.sync_engine)
+
+def pool_status() -> dict:
+    """Live pool occupancy of the async (request-serving) engine plus checkout metrics."""
+    pool = async_engine.pool
+    status = {"pool": type(pool).__name__, "pre_ping": PRE_PING}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": MAX_OVERFLOW,
+        })
+    return {
+        **status,
+        "checkouts": pool_metrics.checkouts,
+        "checkout_wait_avg_ms": 1000 * pool_metrics.checkout_seconds_total / pool_metrics.checkouts if pool_metrics.checkouts else 0.0,
+        "checkout_wait_max_ms": 1000 * pool_metrics.checkout_seconds_max,
+        "checkout_seconds_total": pool_metrics.checkout_seconds_total,
+        "checkout_timeouts": pool_metrics.timeouts,
+        "idle_pings": pool_metrics.idle_pings,
+        "invalidations": pool_metrics.invalidations,
+    }
+
+# expire_on_commit=False so returned ORM objects can still be serialized after commit
+# without triggering a lazy (and, under asyncio, illegal) refresh.
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Base class for declarative models that all models will inherit from.
 Base = declarative_base()
 
@@ -31,3 +172,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,34 @@
+# backend/executors.py
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Bounded pools for work that must not run on the event loop thread.
+# io_executor: blocking SDK calls (Stripe) and other short blocking I/O.
+# inference_executor: CPU-bound model loading/generation. Kept small on purpose so
+# local inference can't eat every core and starve the rest of the worker.
+# kdf_executor: password hashing. Its size caps how many ~100ms KDF runs can happen
+# at once, so a login burst queues up instead of saturating every core.
+io_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IO_WORKERS", "16")),
+    thread_name_prefix="io"
+)
+inference_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INFERENCE_WORKERS", "1")),
+    thread_name_prefix="inference"
+)
+kdf_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    thread_name_prefix="kdf"
+)
+
+async def run_blocking(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """Run a blocking callable on the given executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+def shutdown_executors():
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    inference_executor.shutdown(wait=False, cancel_futures=True)
+    kdf_executor.shutdown(wait=False, cancel_futures=True)
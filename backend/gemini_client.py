@@ -1,24 +1,42 @@
-import google.generativeai as genai
+import logging
 import os
-from typing import Optional
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+def _record_tokens(meta: Optional[dict], response):
+    usage = getattr(response, "usage_metadata", None)
+    if meta is not None and usage:
+        meta["prompt_tokens"] = usage.prompt_token_count
+        meta["completion_tokens"] = usage.candidates_token_count
 
 class GeminiClient:
     def __init__(self):
-        self.model = None # Initialize as None first
-        api_key = os.getenv("GEMINI_API_KEY")
-        if api_key:
+        # google.generativeai is slow to import, so the SDK is only loaded and
+        # configured on first use (see _get_model).
+        self.model = None
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        self._init_failed = False
+        if not self.api_key:
+            logger.warning("GeminiClient: GEMINI_API_KEY not found in .env file.")
+    
+    def _get_model(self):
+        if self.model is None and self.api_key and not self._init_failed:
             try:
-                genai.configure(api_key=api_key)
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
                 self.model = genai.GenerativeModel('gemini-1.5-flash')
-                print("GeminiClient initialized successfully.")
+                logger.debug("GeminiClient initialized successfully.")
             except Exception as e:
-                print(f"Failed to initialize GeminiClient: {e}")
-        else:
-            print("GeminiClient: GEMINI_API_KEY not found in .env file.")
-    
-    async def chat(self, message: str, model_name: Optional[str] = None) -> str:
+                self._init_failed = True
+                logger.warning(f"Failed to initialize GeminiClient: {e}")
         if not self.model:
             raise Exception("Gemini API key not configured or initialization failed")
+        return self.model
+    
+    async def chat(self, message: str, model_name: Optional[str] = None, meta: Optional[dict] = None) -> str:
+        """If `meta` is given, the usage metadata's token counts are stored in it."""
+        self._get_model()
         
         try:
             # The new SDK uses generate_content_async for async operations
@@ -26,9 +44,24 @@ class GeminiClient:
                  response = await self.model.generate_content_async(message)
             else:
                  response = self.model.generate_content(message)
+            _record_tokens(meta, response)
             return response.text
         except Exception as e:
             raise Exception(f"Gemini error: {str(e)}")
     
+    async def chat_stream(self, message: str, model_name: Optional[str] = None,
+                          meta: Optional[dict] = None) -> AsyncIterator[str]:
+        self._get_model()
+        
+        try:
+            response = await self.model.generate_content_async(message, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            # Usage metadata is complete once the stream has been consumed.
+            _record_tokens(meta, response)
+        except Exception as e:
+            raise Exception(f"Gemini error: {str(e)}")
+    
     def is_available(self) -> bool:
-        return self.model is not None
+        return bool(self.api_key) and not self._init_failed
@@ -1,53 +1,362 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-import torch
-from typing import Optional
+# transformers and torch take seconds to import, so they are imported inside the
+# methods that need them rather than when this module is loaded.
+import asyncio
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import AsyncIterator, List, Optional
+from executors import inference_executor, io_executor, run_blocking
+from batching import BatchingEngine
+
+logger = logging.getLogger(__name__)
+
+
+def _cancel_criteria(event: threading.Event):
+    """A StoppingCriteria that stops an in-flight ``generate`` call once the event is set."""
+    from transformers import StoppingCriteria
+
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            return event.is_set()
+
+    return CancelCriteria()
+
+
+def _footprint(model) -> int:
+    """Approximate resident size in bytes of a model's weights and buffers."""
+    import torch
+    total = 0
+    for value in model.state_dict().values():
+        # Dynamically quantized Linear layers store packed (weight, bias) tuples.
+        tensors = value if isinstance(value, tuple) else (value,)
+        for tensor in tensors:
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _conv1d_to_linear(module):
+    """
+    Replace transformers' Conv1D layers (GPT-2 style models) with equivalent
+    nn.Linear layers, which dynamic quantization knows how to handle.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+    for parent in module.modules():
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                # Conv1D computes x @ weight + bias with weight shaped (in, out).
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features, bias=child.bias is not None, device="meta")
+                linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous(), requires_grad=False)
+                if child.bias is not None:
+                    linear.bias = torch.nn.Parameter(child.bias.detach(), requires_grad=False)
+                setattr(parent, name, linear)
+
 
 class HuggingFaceClient:
+    """
+    Local transformers models, kept resident under an optional RAM budget.
+
+    Models are loaded lazily or preloaded at startup (HF_PRELOAD_MODELS). Only
+    models in HF_ALLOWED_MODELS (default: the default and preloaded models) can be
+    requested by name. When HF_MEMORY_BUDGET_MB is set, the least recently used
+    idle models are unloaded until a model's estimated size fits before it is
+    loaded; models with requests in flight are never unloaded. HF_TORCH_DTYPE,
+    HF_LOW_CPU_MEM_USAGE and HF_QUANTIZE=int8 reduce the per-model footprint.
+    int8 is dynamic quantization on CPU; GPT-2 style models such as DialoGPT
+    implement their projections as transformers' Conv1D rather than nn.Linear,
+    so those layers are converted to nn.Linear first to be quantized at all.
+    """
     def __init__(self):
-        self.models = {}
+        self.models = OrderedDict()
         self.default_model = "microsoft/DialoGPT-medium"
+        self.memory_budget = int(os.getenv("HF_MEMORY_BUDGET_MB", "0")) * 1024 * 1024  # 0 = unbounded
+        self.torch_dtype = os.getenv("HF_TORCH_DTYPE")  # e.g. "float16", "bfloat16"
+        self.low_cpu_mem_usage = os.getenv("HF_LOW_CPU_MEM_USAGE", "true").lower() == "true"
+        self.quantize = os.getenv("HF_QUANTIZE", "").lower() == "int8"
+        self.preload_models = [name.strip() for name in os.getenv("HF_PRELOAD_MODELS", "").split(",") if name.strip()]
+        # Models that may be requested as "huggingface:<name>"; anything else would
+        # let a caller trigger arbitrary Hub downloads or local-path loads.
+        self.allowed_models = set(
+            [name.strip() for name in os.getenv("HF_ALLOWED_MODELS", "").split(",") if name.strip()]
+            or [self.default_model, *self.preload_models]
+        )
+        # _lock guards self.models and is only ever held briefly, so memory_report
+        # can take it on the event loop; _load_lock serializes the slow loads.
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._load_bytes = {}  # peak size seen while loading each model, for re-loads
+        self.batcher = BatchingEngine(self._generate_batch)
+    
+    def _resident_bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self.models.values())
+    
+    def _make_room(self, needed: int) -> bool:
+        """Unload idle models, LRU first, until `needed` more bytes fit. Call with _lock held."""
+        if not self.memory_budget:
+            return False
+        unloaded = False
+        # self.models is kept in LRU order, oldest first.
+        for name in list(self.models):
+            if self._resident_bytes() + needed <= self.memory_budget:
+                break
+            if self.models[name]["in_use"]:
+                continue
+            logger.info(f"Unloading idle HF model {name} to stay within the memory budget")
+            del self.models[name]
+            unloaded = True
+        if self._resident_bytes() + needed > self.memory_budget:
+            logger.warning("HF memory budget exceeded; all other resident models are in use.")
+        return unloaded
+    
+    def _estimate_bytes(self, model_name: str) -> int:
+        """Size of a model's weights at load time, from its config, without loading it."""
+        if model_name in self._load_bytes:
+            return self._load_bytes[model_name]
+        try:
+            import torch
+            from transformers import AutoConfig, AutoModelForCausalLM
+            config = AutoConfig.from_pretrained(model_name)
+            with torch.device("meta"):
+                skeleton = AutoModelForCausalLM.from_config(config)
+            dtype = getattr(torch, self.torch_dtype) if self.torch_dtype else torch.float32
+            return sum(p.numel() for p in skeleton.parameters()) * torch.empty(0, dtype=dtype).element_size()
+        except Exception as e:
+            logger.warning(f"Could not estimate the size of HF model {model_name}: {e}")
+            return 0
+    
+    def _load(self, model_name: str) -> tuple:
+        """Load (tokenizer, model, size in bytes, size before quantization)."""
+        try:
+            import torch
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            kwargs = {"low_cpu_mem_usage": self.low_cpu_mem_usage}
+            if self.torch_dtype:
+                kwargs["torch_dtype"] = getattr(torch, self.torch_dtype)
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModelForCausalLM.from_pretrained(model_name, **kwargs)
+            model.eval()
+            loaded_size = _footprint(model)
+            if self.quantize:
+                _conv1d_to_linear(model)
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        except Exception as e:
+            raise Exception(f"Failed to load model {model_name}: {str(e)}")
+        return tokenizer, model, _footprint(model), loaded_size
     
     def load_model(self, model_name: str):
-        if model_name not in self.models:
-            try:
-                tokenizer = AutoTokenizer.from_pretrained(model_name)
-                model = AutoModelForCausalLM.from_pretrained(model_name)
+        with self._lock:
+            if model_name in self.models:
+                self.models.move_to_end(model_name)
+                return
+        with self._load_lock:
+            with self._lock:
+                if model_name in self.models:  # loaded while we waited for _load_lock
+                    self.models.move_to_end(model_name)
+                    return
+            # Unload before loading, so the load itself doesn't push memory past the budget.
+            estimate = self._estimate_bytes(model_name) if self.memory_budget else 0
+            with self._lock:
+                unloaded = self._make_room(estimate)
+            if unloaded:
+                gc.collect()
+            tokenizer, model, size, loaded_size = self._load(model_name)
+            self._load_bytes[model_name] = loaded_size
+            with self._lock:
+                self._make_room(size)  # in case the estimate was low
                 self.models[model_name] = {
                     "tokenizer": tokenizer,
-                    "model": model
+                    "model": model,
+                    "bytes": size,
+                    "in_use": 0,
+                    "last_used": time.time()
                 }
+            logger.info(f"Loaded HF model {model_name} ({size / 2**20:.0f} MB)")
+    
+    def _try_pin(self, model_name: str) -> Optional[dict]:
+        """Pin a resident model without loading it; None if it isn't resident."""
+        with self._lock:
+            entry = self.models.get(model_name)
+            if entry is not None:
+                entry["in_use"] += 1
+                entry["last_used"] = time.time()
+            return entry
+    
+    def _pin(self, model_name: str) -> dict:
+        """Load a model if needed and pin it so it can't be unloaded; pair with _unpin."""
+        while True:
+            self.load_model(model_name)
+            # Another load may have unloaded it again in between; then retry.
+            entry = self._try_pin(model_name)
+            if entry is not None:
+                return entry
+    
+    def _unpin(self, entry: dict):
+        with self._lock:
+            entry["in_use"] -= 1
+    
+    @contextmanager
+    def _use(self, model_name: str):
+        """Pin a model (loading it if needed) so it can't be unloaded mid-generation."""
+        entry = self._pin(model_name)
+        try:
+            yield entry["tokenizer"], entry["model"]
+        finally:
+            self._unpin(entry)
+    
+    async def preload(self, model_names: Optional[List[str]] = None):
+        for model_name in model_names or self.preload_models:
+            try:
+                await run_blocking(inference_executor, self.load_model, model_name)
             except Exception as e:
-                raise Exception(f"Failed to load model {model_name}: {str(e)}")
+                logger.warning(f"Failed to preload HF model {model_name}: {e}")
+    
+    def memory_report(self) -> dict:
+        """Per-model footprint. Safe on the event loop: it never waits for a model load."""
+        with self._lock:
+            return {
+                "budget_mb": self.memory_budget / 2**20 if self.memory_budget else None,
+                "resident_mb": self._resident_bytes() / 2**20,
+                "models": {
+                    name: {
+                        "mb": entry["bytes"] / 2**20,
+                        "in_use": entry["in_use"],
+                        "last_used": entry["last_used"]
+                    }
+                    for name, entry in self.models.items()
+                }
+            }
     
-    async def chat(self, message: str, model_name: Optional[str] = None) -> str:
+    def _generate_batch(self, messages: List[str], model_name: str) -> List[tuple]:
+        """(response, prompt tokens, completion tokens) per message."""
+        with self._use(model_name) as (tokenizer, model):
+            # Count while pinned: once released the model may be unloaded.
+            return [
+                (response, len(tokenizer.encode(message)), len(tokenizer.encode(response)))
+                for message, response in zip(messages, self._generate_with(tokenizer, model, messages))
+            ]
+    
+    def _generate_with(self, tokenizer, model, messages: List[str]) -> List[str]:
+        import torch
+        # Decoder-only models continue from the right edge of the prompt, so pad on
+        # the left to keep every prompt in the batch flush against its generated text.
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        inputs = tokenizer(
+            [message + tokenizer.eos_token for message in messages],
+            return_tensors="pt",
+            padding=True
+        )
+        prompt_length = inputs["input_ids"].shape[1]
+        
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs,
+                max_new_tokens=100,
+                num_return_sequences=1,
+                temperature=0.7,
+                do_sample=True,
+                pad_token_id=tokenizer.eos_token_id
+            )
+        
+        return [
+            tokenizer.decode(output[prompt_length:], skip_special_tokens=True).strip()
+            for output in outputs
+        ]
+    
+    async def chat(self, message: str, model_name: Optional[str] = None, meta: Optional[dict] = None) -> str:
+        """
+        If `meta` is given, prompt and completion lengths in model tokens are stored in it.
+        Failures raise, so the router counts them against the provider and falls back.
+        """
         if not model_name:
             model_name = self.default_model
         
         try:
-            # Load model if not already loaded
-            if model_name not in self.models:
-                self.load_model(model_name)
-            
-            tokenizer = self.models[model_name]["tokenizer"]
-            model = self.models[model_name]["model"]
-            
-            # Encode input
-            inputs = tokenizer.encode(message + tokenizer.eos_token, return_tensors="pt")
-            
-            # Generate response
-            with torch.no_grad():
-                outputs = model.generate(
-                    inputs,
-                    max_length=inputs.shape[1] + 100,
-                    num_return_sequences=1,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=tokenizer.eos_token_id
-                )
-            
-            # Decode response
-            response = tokenizer.decode(outputs[0][inputs.shape[1]:], skip_special_tokens=True)
-            return response.strip()
-            
+            # Concurrent requests are micro-batched into a single generate() call
+            # on the inference pool instead of running one prompt at a time.
+            response, prompt_tokens, completion_tokens = await self.batcher.submit(message, model_name)
         except Exception as e:
-            return f"I'm sorry, I encountered an error: {str(e)}"
+            raise Exception(f"HuggingFace error: {str(e)}")
+        if meta is not None:
+            meta["prompt_tokens"] = prompt_tokens
+            meta["completion_tokens"] = completion_tokens
+        return response
+    
+    def _start_stream(self, entry: dict, message: str) -> tuple:
+        """Submit a streamed generation on a pinned model. Returns (future, streamer, inputs, cancel event)."""
+        import torch
+        from transformers import TextIteratorStreamer, StoppingCriteriaList
+        tokenizer, model = entry["tokenizer"], entry["model"]
+        
+        inputs = tokenizer.encode(message + tokenizer.eos_token, return_tensors="pt")
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=120.0)
+        cancel = threading.Event()
+        
+        def generate():
+            try:
+                with torch.no_grad():
+                    model.generate(
+                        inputs,
+                        max_length=inputs.shape[1] + 100,
+                        num_return_sequences=1,
+                        temperature=0.7,
+                        do_sample=True,
+                        pad_token_id=tokenizer.eos_token_id,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_cancel_criteria(cancel)])
+                    )
+            except Exception:
+                # Unblock the consumer; the error is re-raised from the future below.
+                streamer.end()
+                raise
+        
+        return inference_executor.submit(generate), streamer, inputs, cancel
+    
+    async def chat_stream(self, message: str, model_name: Optional[str] = None,
+                          meta: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield decoded text as ``model.generate`` produces it.
+
+        Generation runs on the inference pool feeding a ``TextIteratorStreamer``;
+        if the consumer goes away, the cancel event stops generation at the next step.
+        """
+        if not model_name:
+            model_name = self.default_model
+        
+        # Pinned from here until generation finishes, so the tokenizer and model
+        # used below can't be unloaded by another request in the meantime. The pin
+        # is taken on the loop: a cancelled await can then never leave one behind.
+        entry = self._try_pin(model_name)
+        while entry is None:
+            await run_blocking(inference_executor, self.load_model, model_name)
+            entry = self._try_pin(model_name)
+        try:
+            future, streamer, inputs, cancel = self._start_stream(entry, message)
+        except BaseException:
+            self._unpin(entry)
+            raise
+        # Also runs if the future is cancelled before it starts (pool shutdown).
+        future.add_done_callback(lambda _: self._unpin(entry))
+        tokenizer = entry["tokenizer"]
+        sentinel = object()
+        chunks = []
+        try:
+            while True:
+                text = await run_blocking(io_executor, next, streamer, sentinel)
+                if text is sentinel:
+                    break
+                if text:
+                    chunks.append(text)
+                    yield text
+            await asyncio.wrap_future(future)
+            if meta is not None:
+                meta["prompt_tokens"] = inputs.shape[1]
+                meta["completion_tokens"] = len(tokenizer.encode("".join(chunks)))
+        finally:
+            cancel.set()
@@ -0,0 +1,55 @@
+# backend/logging_config.py
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is
+# emitted as a field of the structured line.
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        line.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_info:
+            line["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+_listener = None
+
+def setup_logging():
+    """
+    Route all logging through a QueueHandler. Request handlers only enqueue the
+    record; a QueueListener thread does the formatting and the stdout write.
+
+    LOG_LEVEL sets the level (default INFO); LOG_FORMAT is "json" (default) or "text".
+    """
+    global _listener
+    if _listener:
+        return
+    output = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """Flush queued records; call on shutdown."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
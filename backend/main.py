@@ -1,76 +1,159 @@
 # main.py
 from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import datetime
-import redis
+from fastapi.responses import StreamingResponse, Response as PlainResponse
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
 import os
-from contextlib import asynccontextmanager
-from typing import List
+import json
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, aclosing
+from typing import List, Optional
 
 # Load environment variables first, this is a crucial step
 from dotenv import load_dotenv
 load_dotenv()
 
+# Set up logging before the local modules log anything
+from logging_config import setup_logging, shutdown_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Now import local modules
-from database import get_db, engine, Base
-from models import User, APIKey, Subscription, ChatLog, Plan
+from database import get_async_db, async_engine, pool_status, AsyncSessionLocal
+from models import User, APIKey, Subscription, Plan
 from schemas import *
-from auth import create_access_token, get_current_user
+from auth import create_access_token, get_current_user, get_admin_user, user_cache
+from user_cache import UserSnapshot
 from rate_limiter import RateLimiter
 from ollama_client import OllamaClient
 from huggingface_client import HuggingFaceClient
 from stripe_client import StripeClient
 from gemini_client import GeminiClient
-import hashlib
+from executors import shutdown_executors
+from passwords import hash_password, verify_password
+from api_key_cache import APIKeyCache, CachedAPIKey
+from chat_log_writer import ChatLogWriter
+from batch_jobs import BatchJobs, ProviderSlots
+from usage_history import UsageHistory, naive_utc
+import usage_rollups
+import metrics
+from response_cache import ResponseCache, CachedResponse
+from conversation_store import ConversationStore
+from model_catalog import ModelCatalog
+from admission import AdmissionController, AdmittedStreamingResponse, Overloaded
+from provider_router import ProviderRouter, OllamaProvider, GeminiProvider, HuggingFaceProvider, AllProvidersFailed, UnknownProvider
 import uuid
 
-# This line will now work correctly because Base is defined in database.py
-# and all models in models.py inherit from it, registering themselves.
-Base.metadata.create_all(bind=engine)
-
 # --- Client and App Initialization ---
 
 redis_url = os.getenv("REDIS_URL")
 redis_client = None
 if redis_url:
     try:
-        redis_client = redis.from_url(redis_url, decode_responses=True)
+        redis_client = metrics.InstrumentedRedis.from_url(redis_url, decode_responses=True)
     except Exception as e:
-        print(f"WARNING: Could not initialize Redis client: {e}")
+        logger.warning(f"Could not initialize Redis client: {e}")
 
 # Initialize other clients, reading from .env
+# OLLAMA_URL may list several nodes, comma-separated; requests are balanced across them.
 ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
 ollama_client = OllamaClient(base_url=ollama_url)
 hf_client = HuggingFaceClient()
 stripe_client = StripeClient()
 gemini_client = GeminiClient()
 
+# Served from memory and refreshed in the background; also keeps OLLAMA_WARM_MODELS loaded.
+model_catalog = ModelCatalog(ollama_client, gemini_client)
+
+# Fallback order: Ollama -> Gemini -> Hugging Face
+provider_router = ProviderRouter([
+    OllamaProvider(ollama_client),
+    GeminiProvider(gemini_client),
+    HuggingFaceProvider(hf_client),
+])
+# Caps concurrent generations overall and per user, queueing fairly by plan tier.
+admission = AdmissionController()
+# Default for requests that don't set ChatRequest.hedge themselves
+hedge_by_default = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+
 # Ensure redis_client is available before creating RateLimiter
 if redis_client:
     rate_limiter = RateLimiter(redis_client)
 else:
     # If Redis is down, create a dummy rate limiter that always allows requests
     # This prevents the app from crashing but should be logged.
-    print("WARNING: Redis not connected. Rate limiting is disabled.")
+    logger.warning("Redis not connected. Rate limiting is disabled.")
     class DummyRateLimiter:
         async def check_rate_limit(self, *args, **kwargs):
-            return True
+            return (True, 9999)
+        async def record_tokens(self, *args, **kwargs):
+            pass
     rate_limiter = DummyRateLimiter()
 
+api_key_cache = APIKeyCache(redis_client)
+# auth.py owns the user cache; give it Redis so invalidations reach every worker.
+user_cache.redis = redis_client
+usage_history = UsageHistory(redis_client)
+chat_log_writer = ChatLogWriter()
+# Batch prompts run on a background worker pool with their own per-provider caps.
+batch_jobs = BatchJobs(redis_client)
+batch_slots = ProviderSlots()
+
+# The semantic tier embeds prompts with Ollama, so it is opt-in.
+semantic_cache = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+embed_model = os.getenv("RESPONSE_CACHE_EMBED_MODEL", "nomic-embed-text")
+response_cache = ResponseCache(
+    embed=(lambda text: ollama_client.embed(text, embed_model)) if semantic_cache else None
+)
+
+async def summarize_text(prompt: str) -> str:
+    response_text, _ = await provider_router.chat(prompt)
+    return response_text
+
+# Folding old turns into a summary costs an extra generation, so it is opt-in.
+summarize_conversations = os.getenv("CONVERSATION_SUMMARIZE", "false").lower() == "true"
+conversation_store = ConversationStore(redis_client, summarize=summarize_text if summarize_conversations else None)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Starting AI Chatbot API...")
+    logger.info("Starting AI Chatbot API...")
     if redis_client:
         try:
-            # FIX: Removed 'await' because redis-py's ping is synchronous
-            if redis_client.ping():
-                print("Successfully connected to Redis.")
+            if await redis_client.ping():
+                logger.info("Successfully connected to Redis.")
         except Exception as e:
-            print(f"Could not connect to Redis during startup check: {e}")
+            logger.warning(f"Could not connect to Redis during startup check: {e}")
+    chat_log_writer.start()
+    batch_jobs.start()
+    ollama_client.start()
+    # Also loads OLLAMA_WARM_MODELS in the background, like the HF preload below.
+    model_catalog.start()
+    # Warm local HF models in the background so startup isn't blocked on them.
+    hf_preload = asyncio.create_task(hf_client.preload())
+    invalidation_listeners = []
+    if redis_client:
+        invalidation_listeners.append(asyncio.create_task(api_key_cache.listen_for_invalidations()))
+        invalidation_listeners.append(asyncio.create_task(user_cache.listen_for_invalidations()))
     yield
-    print("Shutting down...")
+    logger.info("Shutting down...")
+    for listener in invalidation_listeners:
+        listener.cancel()
+    hf_preload.cancel()
+    await batch_jobs.stop()
+    await model_catalog.stop()
+    await conversation_store.stop()
+    await chat_log_writer.stop()
+    await ollama_client.close()
+    if redis_client:
+        await redis_client.close()
+    await async_engine.dispose()
+    shutdown_executors()
+    shutdown_logging()
 
 app = FastAPI(
     title="AI Chatbot API",
@@ -89,23 +172,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.RequestMetricsMiddleware)
+metrics.instrument_engine(async_engine.sync_engine)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = metrics.render(pool_status())
+    return PlainResponse(body, media_type=content_type)
+
 # --- API Routes ---
 
 @app.post("/api/auth/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = (await db.execute(select(User).filter(User.email == user_data.email))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = hashlib.sha256(user_data.password.encode()).hexdigest()
+    hashed_password = await hash_password(user_data.password)
     new_user = User(
         email=user_data.email,
         username=user_data.username,
         password_hash=hashed_password,
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     api_key = APIKey(
         user_id=new_user.id,
@@ -113,140 +204,451 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         name="Default Key",
     )
     db.add(api_key)
-    db.commit()
+    await db.commit()
     
     return new_user
 
 @app.post("/api/auth/login")
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == credentials.email).first()
-    if not user or user.password_hash != hashlib.sha256(credentials.password.encode()).hexdigest():
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).filter(User.email == credentials.email))).scalars().first()
+    valid, new_hash = await verify_password(credentials.password, user.password_hash if user else None)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Legacy SHA-256 or outdated cost: store the rehashed password
+        user.password_hash = new_hash
+        await db.commit()
     
     if not user.is_active:
         raise HTTPException(status_code=401, detail="Account deactivated")
     
-    access_token = create_access_token(data={"sub": str(user.id)})
+    access_token = create_access_token(data={"sub": str(user.id), "adm": bool(user.is_admin)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.get("/api/auth/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: UserSnapshot = Depends(get_current_user)):
     """
     Fetch the currently authenticated user.
     """
     return current_user
 
 @app.get("/api/keys", response_model=List[APIKeyResponse])
-async def get_api_keys(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(APIKey).filter(APIKey.user_id == current_user.id).all()
+async def get_api_keys(current_user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(APIKey).filter(APIKey.user_id == current_user.id))).scalars().all()
 
 @app.post("/api/keys", response_model=APIKeyResponse)
-async def create_api_key(key_data: APIKeyCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_api_key(key_data: APIKeyCreate, current_user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     api_key = APIKey(user_id=current_user.id, key=f"ak_{uuid.uuid4().hex}", name=key_data.name)
     db.add(api_key)
-    db.commit()
-    db.refresh(api_key)
+    await db.commit()
+    await db.refresh(api_key)
+    return api_key
+
+@app.put("/api/keys/{key_id}", response_model=APIKeyResponse)
+async def update_api_key(key_id: int, key_data: APIKeyUpdate, current_user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    api_key = (await db.execute(select(APIKey).filter(APIKey.id == key_id, APIKey.user_id == current_user.id))).scalars().first()
+    if not api_key:
+        raise HTTPException(status_code=404, detail="API key not found")
+    for field, value in key_data.dict(exclude_unset=True).items():
+        setattr(api_key, field, value)
+    await db.commit()
+    await api_key_cache.invalidate(api_key.key)
     return api_key
 
 @app.delete("/api/keys/{key_id}")
-async def delete_api_key(key_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    api_key = db.query(APIKey).filter(APIKey.id == key_id, APIKey.user_id == current_user.id).first()
+async def delete_api_key(key_id: int, current_user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    api_key = (await db.execute(select(APIKey).filter(APIKey.id == key_id, APIKey.user_id == current_user.id))).scalars().first()
     if not api_key:
         raise HTTPException(status_code=404, detail="API key not found")
-    db.delete(api_key)
-    db.commit()
+    await db.delete(api_key)
+    await db.commit()
+    await api_key_cache.invalidate(api_key.key)
     return {"message": "API key deleted"}
 
+async def _usage_series(keys: List[APIKey], start: Optional[datetime], end: Optional[datetime], step_minutes: int) -> dict:
+    # Query strings like ?start=2024-01-01T00:00:00Z parse as aware datetimes.
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - timedelta(hours=1)
+    if step_minutes < 1 or start > end:
+        raise HTTPException(status_code=400, detail="Invalid usage range")
+    try:
+        series = await usage_history.series([key.key for key in keys], start, end, step_minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "start": start, "end": end, "step_minutes": step_minutes,
+        "keys": [{"id": key.id, "name": key.name, "series": series[key.key]} for key in keys],
+    }
+
+@app.get("/api/keys/usage")
+async def get_all_keys_usage(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    step_minutes: int = 1,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Per-minute request counts (UTC) for every one of the user's API keys."""
+    keys = (await db.execute(select(APIKey).filter(APIKey.user_id == current_user.id))).scalars().all()
+    return await _usage_series(keys, start, end, step_minutes)
+
+@app.get("/api/keys/{key_id}/usage")
+async def get_key_usage(
+    key_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    step_minutes: int = 1,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    api_key = (await db.execute(select(APIKey).filter(APIKey.id == key_id, APIKey.user_id == current_user.id))).scalars().first()
+    if not api_key:
+        raise HTTPException(status_code=404, detail="API key not found")
+    return await _usage_series([api_key], start, end, step_minutes)
+
+async def lookup_api_key(api_key: str, db: AsyncSession) -> Optional[CachedAPIKey]:
+    """Return the active key, or None if it doesn't exist or was revoked."""
+    key_obj = await api_key_cache.get(api_key)
+    if key_obj is None:
+        key_row = (await db.execute(select(APIKey).filter(APIKey.key == api_key, APIKey.is_active == True))).scalars().first()
+        if not key_row:
+            return None
+        key_obj = CachedAPIKey.from_model(key_row)
+        await api_key_cache.set(api_key, key_obj)
+        # End the read transaction now so the pooled connection isn't held
+        # for the whole (potentially very long) generation.
+        await db.commit()
+    return key_obj
+
+async def authenticate_api_key(fastapi_request: Request, db: AsyncSession) -> CachedAPIKey:
+    api_key = fastapi_request.headers.get("X-API-Key")
+    if not api_key:
+        raise HTTPException(status_code=401, detail="API key required")
+    key_obj = await lookup_api_key(api_key, db)
+    if key_obj is None:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    return key_obj
+
+@app.post("/api/conversations")
+async def create_conversation(fastapi_request: Request, db: AsyncSession = Depends(get_async_db)):
+    key_obj = await authenticate_api_key(fastapi_request, db)
+    state = await conversation_store.create(key_obj.user_id, key_obj.id)
+    return {"conversation_id": state.id}
+
 @app.post("/api/chat")
 async def chat(
     fastapi_request: Request, # Renamed to avoid conflict with our own request object
     fastapi_response: Response,
     chat_request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    key_obj = await authenticate_api_key(fastapi_request, db)
     api_key = fastapi_request.headers.get("X-API-Key")
-    if not api_key:
-        raise HTTPException(status_code=401, detail="API key required")
-    key_obj = db.query(APIKey).filter(APIKey.key == api_key, APIKey.is_active == True).first()
-    if not key_obj:
-        raise HTTPException(status_code=401, detail="Invalid API key")
     
     # FIX: Use the new rate limiter which returns remaining requests
     is_allowed, remaining_requests = await rate_limiter.check_rate_limit(
-        api_key, key_obj.daily_limit, fastapi_request.client.host
+        api_key, key_obj.daily_limit, fastapi_request.client.host, key_obj.daily_token_limit
     )
     
     # Add the remaining count to the response headers
     fastapi_response.headers["X-RateLimit-Remaining"] = str(remaining_requests)
     
     if not is_allowed:
+        metrics.RATE_LIMIT_REJECTIONS.labels(getattr(rate_limiter, "policy", "none")).inc()
         raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Try again tomorrow.")
     
-    response_text = None
-    model_used = "unknown"
+    try:
+        provider_router.parse_model(chat_request.model)
+    except UnknownProvider as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    conversation = None
+    if chat_request.conversation_id is not None:
+        state = await conversation_store.get(chat_request.conversation_id, key_obj.user_id)
+        if not state:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        conversation = conversation_store.context_for(state)
+    
+    requested_model = chat_request.model or "default"
+    # Responses inside a conversation depend on its history, so they aren't cached.
+    use_cache = key_obj.cache_responses and conversation is None
+    # Identical prompts arriving while one is already generating share its result.
+    coalesce = key_obj.coalesce_requests and conversation is None
+    cached = None
+    if use_cache:
+        cached = await response_cache.get(chat_request.message, requested_model)
+    if cached:
+        model_used = f"cache:{cached.model}"
+        await chat_log_writer.log(dict(
+            user_id=key_obj.user_id, api_key_id=key_obj.id, message=chat_request.message,
+            response=cached.response, model=model_used, ip_address=fastapi_request.client.host,
+            latency_ms=0
+        ))
+        if chat_request.stream:
+            return StreamingResponse(
+                iter([_sse({"token": cached.response}), _sse({"done": True, "model": model_used})]),
+                media_type="text/event-stream",
+                headers={"X-RateLimit-Remaining": str(remaining_requests), "Cache-Control": "no-cache"},
+            )
+        return {"response": cached.response, "model": model_used}
+    
+    try:
+        ticket = await admission.acquire(key_obj.user_id, key_obj.daily_limit)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    if chat_request.stream:
+        return AdmittedStreamingResponse(
+            stream_chat(chat_request, key_obj, fastapi_request.client.host, conversation,
+                        use_cache, coalesce, api_key),
+            ticket=ticket,
+            media_type="text/event-stream",
+            headers={
+                "X-RateLimit-Remaining": str(remaining_requests),
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            },
+        )
     
-    # FIX: Corrected and robust fallback chain: Ollama -> Gemini -> Hugging Face
+    started = time.perf_counter()
+    meta = {}
     try:
-        # 1. Try Ollama first
-        print("Attempting to use primary model: Ollama")
-        response_text = await ollama_client.chat(chat_request.message, "mistral")
-        model_used = "ollama:mistral"
-
-    except Exception as ollama_error:
-        print(f"Ollama failed: {ollama_error}. Falling back to Gemini.")
-        
-        # 2. Try Gemini as the second option
-        if gemini_client.is_available():
-            try:
-                print("Attempting to use secondary model: Gemini")
-                response_text = await gemini_client.chat(chat_request.message)
-                model_used = "gemini:pro"
-            except Exception as gemini_error:
-                print(f"Gemini failed: {gemini_error}. Falling back to Hugging Face.")
-                # 3. Fallback to Hugging Face if both Ollama and Gemini fail
-                try:
-                    print("Attempting to use fallback model: Hugging Face")
-                    response_text = await hf_client.chat(chat_request.message) 
-                    model_used = "huggingface:default"
-                except Exception as hf_error:
-                    print(f"Hugging Face fallback also failed: {hf_error}")
-                    raise HTTPException(status_code=503, detail="All AI services are currently unavailable.")
+        hedge = chat_request.hedge if chat_request.hedge is not None else hedge_by_default
+        if hedge:
+            response_text, model_used = await provider_router.hedged_chat(
+                chat_request.message, chat_request.model, conversation, meta, coalesce)
         else:
-             # 3. Fallback to Hugging Face if Gemini is not configured
-            try:
-                print("Gemini not available. Falling back to Hugging Face.")
-                response_text = await hf_client.chat(chat_request.message) 
-                model_used = "huggingface:default"
-            except Exception as hf_error:
-                print(f"Hugging Face fallback also failed: {hf_error}")
-                raise HTTPException(status_code=503, detail="All AI services are currently unavailable.")
-
-    # Log the successful chat
-    chat_log = ChatLog(
+            response_text, model_used = await provider_router.chat(
+                chat_request.message, chat_request.model, conversation, meta, coalesce)
+    except AllProvidersFailed as e:
+        # Only counted in the usage rollups; there's no response to store in chat_logs.
+        await chat_log_writer.log(dict(
+            user_id=key_obj.user_id, api_key_id=key_obj.id, model=requested_model,
+            ip_address=fastapi_request.client.host, error=True
+        ))
+        raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        ticket.release()
+
+    if use_cache:
+        await response_cache.put(chat_request.message, requested_model,
+                                 CachedResponse(response_text, model_used, time.perf_counter() - started))
+    if conversation:
+        await conversation_store.append(conversation.state, chat_request.message, response_text,
+                                        model_used, meta.get("context"))
+    
+    # Log the successful chat; the writer batches inserts off the request path
+    usage = _usage(meta, started)
+    await chat_log_writer.log(dict(
         user_id=key_obj.user_id, api_key_id=key_obj.id, message=chat_request.message,
-        response=response_text, model=model_used, ip_address=fastapi_request.client.host
-    )
-    db.add(chat_log)
-    db.commit()
+        response=response_text, model=model_used, ip_address=fastapi_request.client.host,
+        conversation_id=chat_request.conversation_id, **usage
+    ))
+    await rate_limiter.record_tokens(api_key, usage["total_tokens"])
     
-    return {"response": response_text, "model": model_used}
+    return {"response": response_text, "model": model_used, "conversation_id": chat_request.conversation_id}
+
+def _usage(meta: dict, started: float) -> dict:
+    """ChatLog token and latency fields for a generation, from the counts the provider put in `meta`."""
+    prompt_tokens = meta.get("prompt_tokens") or 0
+    completion_tokens = meta.get("completion_tokens") or 0
+    return dict(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                latency_ms=int((time.perf_counter() - started) * 1000))
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+async def stream_chat(chat_request: ChatRequest, key_obj: CachedAPIKey, ip_address: str,
+                      conversation=None, cache_response: bool = False, coalesce: bool = False,
+                      api_key: str = None):
+    """
+    Server-Sent Events generator for streaming chat responses.
+
+    Uses the same provider router as `chat`, but only falls back while no tokens
+    have been sent yet. Tokens are yielded as the provider produces them, and a
+    slow client pauses the upstream read rather than buffering it. On client
+    disconnect Starlette cancels this generator, which closes the provider stream
+    and aborts generation. The ChatLog row is written once the stream completes,
+    and with `cache_response` the response is cached. With `coalesce`, a client
+    asking for a prompt that is already streaming joins that generation instead
+    of starting its own; only the client that started it records the attempt.
+    """
+    message = chat_request.message
+    requested_model = chat_request.model
+    chunks = []
+    model_used = None
+    meta = {}
+    started = time.perf_counter()
+    for provider, model in provider_router.candidates(requested_model):
+        name = provider.label(model)
+        provider_started = time.perf_counter()
+        first_token_at = None
+        stream, leader = provider_router.stream(provider, model, message, conversation, meta, coalesce)
+        try:
+            async with aclosing(stream):
+                async for token in stream:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        if leader:
+                            metrics.PROVIDER_TTFB_SECONDS.labels(provider.name).observe(first_token_at - provider_started)
+                    model_used = name
+                    chunks.append(token)
+                    yield _sse({"token": token})
+        except Exception as e:
+            if leader:
+                provider_router.record(provider, provider_started, ok=False, mode="stream")
+            if chunks:
+                logger.warning(f"{name} failed mid-stream: {e}")
+                yield _sse({"error": "Generation was interrupted.", "model": model_used})
+                return
+            metrics.PROVIDER_FALLBACKS.labels(provider.name).inc()
+            logger.warning(f"{name} streaming failed: {e}. Falling back.")
+            continue
+        if leader:
+            provider_router.record(provider, provider_started, ok=bool(model_used), mode="stream")
+        if model_used:
+            streaming_seconds = time.perf_counter() - first_token_at
+            if leader and len(chunks) > 1 and streaming_seconds > 0:
+                metrics.PROVIDER_TOKENS_PER_SECOND.labels(provider.name).observe((len(chunks) - 1) / streaming_seconds)
+            break
+        metrics.PROVIDER_FALLBACKS.labels(provider.name).inc()
+        logger.info(f"{name} returned an empty stream. Falling back.")
+
+    if not model_used:
+        yield _sse({"error": "All AI services are currently unavailable."})
+        await chat_log_writer.log(dict(
+            user_id=key_obj.user_id, api_key_id=key_obj.id, model=requested_model or "default",
+            ip_address=ip_address, error=True
+        ))
+        return
+
+    yield _sse({"done": True, "model": model_used, "conversation_id": chat_request.conversation_id})
+
+    response_text = "".join(chunks)
+    if cache_response:
+        await response_cache.put(message, requested_model or "default",
+                                 CachedResponse(response_text, model_used, time.perf_counter() - started))
+    if conversation:
+        await conversation_store.append(conversation.state, message, response_text,
+                                        model_used, meta.get("context"))
+
+    usage = _usage(meta, started)
+    await chat_log_writer.log(dict(
+        user_id=key_obj.user_id, api_key_id=key_obj.id, message=message,
+        response=response_text, model=model_used, ip_address=ip_address,
+        conversation_id=chat_request.conversation_id, **usage
+    ))
+    if api_key:
+        await rate_limiter.record_tokens(api_key, usage["total_tokens"])
+
+# --- Batch chat ---
+
+max_batch_messages = int(os.getenv("BATCH_MAX_MESSAGES", "1000"))
+
+async def run_batch_item(job: dict, index: int, message: str) -> dict:
+    """Process one prompt of a batch job like a buffered /api/chat request."""
+    async with AsyncSessionLocal() as db:
+        key_obj = await lookup_api_key(job["api_key"], db)
+    if key_obj is None:
+        return {"status": "failed", "error": "API key is no longer active."}
+    # Each prompt counts against the key's limit when it runs, like a single request would.
+    is_allowed, _ = await rate_limiter.check_rate_limit(job["api_key"], key_obj.daily_limit, job["ip_address"],
+                                                        key_obj.daily_token_limit)
+    if not is_allowed:
+        metrics.RATE_LIMIT_REJECTIONS.labels(getattr(rate_limiter, "policy", "none")).inc()
+        return {"status": "rate_limited", "error": "Rate limit exceeded."}
+
+    requested_model = job["model"] or "default"
+    log = dict(user_id=key_obj.user_id, api_key_id=key_obj.id, message=message, ip_address=job["ip_address"])
+    cached = await response_cache.get(message, requested_model) if key_obj.cache_responses else None
+    if cached:
+        model_used = f"cache:{cached.model}"
+        await chat_log_writer.log(dict(log, response=cached.response, model=model_used, latency_ms=0))
+        return {"status": "ok", "response": cached.response, "model": model_used}
+
+    started = time.perf_counter()
+    meta = {}
+    try:
+        # Batch work queues for admission without a wait budget instead of being shed.
+        async with admission.slot(key_obj.user_id, key_obj.daily_limit, shed=False):
+            response_text, model_used = await provider_router.chat(
+                message, job["model"], meta=meta, coalesce=key_obj.coalesce_requests, slots=batch_slots)
+    except AllProvidersFailed as e:
+        await chat_log_writer.log(dict(log, model=requested_model, error=True))
+        return {"status": "failed", "error": str(e)}
+    if key_obj.cache_responses:
+        await response_cache.put(message, requested_model,
+                                 CachedResponse(response_text, model_used, time.perf_counter() - started))
+    usage = _usage(meta, started)
+    await chat_log_writer.log(dict(log, response=response_text, model=model_used, **usage))
+    await rate_limiter.record_tokens(job["api_key"], usage["total_tokens"])
+    return {"status": "ok", "response": response_text, "model": model_used}
+
+batch_jobs.process = run_batch_item
+
+async def _owned_batch_job(job_id: str, key_obj: CachedAPIKey) -> dict:
+    job = await batch_jobs.get(job_id)
+    if job is None or job["user_id"] != key_obj.user_id:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@app.post("/api/chat/batch", status_code=202)
+async def create_batch_chat(fastapi_request: Request, batch_request: BatchChatRequest,
+                            db: AsyncSession = Depends(get_async_db)):
+    """
+    Queue many prompts at once. Poll GET /api/chat/batch/{job_id} for results, or
+    follow GET /api/chat/batch/{job_id}/stream to receive each one as it finishes.
+    """
+    key_obj = await authenticate_api_key(fastapi_request, db)
+    if not batch_request.messages or len(batch_request.messages) > max_batch_messages:
+        raise HTTPException(status_code=400, detail=f"A batch must have between 1 and {max_batch_messages} messages")
+    try:
+        provider_router.parse_model(batch_request.model)
+    except UnknownProvider as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_id = await batch_jobs.submit(dict(
+        user_id=key_obj.user_id, api_key=fastapi_request.headers.get("X-API-Key"),
+        model=batch_request.model, ip_address=fastapi_request.client.host
+    ), batch_request.messages)
+    return {"job_id": job_id, "status": "queued", "total": len(batch_request.messages)}
+
+@app.get("/api/chat/batch/{job_id}")
+async def get_batch_chat(job_id: str, fastapi_request: Request, db: AsyncSession = Depends(get_async_db)):
+    key_obj = await authenticate_api_key(fastapi_request, db)
+    await _owned_batch_job(job_id, key_obj)
+    return await batch_jobs.status(job_id)
+
+@app.get("/api/chat/batch/{job_id}/stream")
+async def stream_batch_chat(job_id: str, fastapi_request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Server-Sent Events: one event per finished prompt (in completion order), then `done`."""
+    key_obj = await authenticate_api_key(fastapi_request, db)
+    await _owned_batch_job(job_id, key_obj)
+
+    async def events():
+        async for result in batch_jobs.follow(job_id):
+            yield _sse(result)
+        yield _sse({"done": True, "job_id": job_id})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ... (The rest of your routes: /plans, /subscribe, /admin/*) ...
 # The code for these routes is correct and can remain as you had it.
 # I am including them for completeness.
 
 @app.get("/api/plans", response_model=List[PlanResponse])
-async def get_plans(db: Session = Depends(get_db)):
-    return db.query(Plan).filter(Plan.is_active == True).all()
+async def get_plans(db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(Plan).filter(Plan.is_active == True))).scalars().all()
 
 @app.post("/api/subscribe")
 async def create_subscription(
     subscription_data: SubscriptionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    plan = db.query(Plan).filter(Plan.id == subscription_data.plan_id).first()
+    plan = (await db.execute(select(Plan).filter(Plan.id == subscription_data.plan_id))).scalars().first()
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
@@ -261,76 +663,122 @@ async def create_subscription(
     )
     db.add(subscription)
     
-    for key in db.query(APIKey).filter(APIKey.user_id == current_user.id).all():
+    keys = (await db.execute(select(APIKey).filter(APIKey.user_id == current_user.id))).scalars().all()
+    for key in keys:
         key.daily_limit = plan.daily_requests
+        key.daily_token_limit = plan.daily_tokens
     
-    db.commit()
+    await db.commit()
+    await api_key_cache.invalidate(*[key.key for key in keys])
     return {"message": "Subscription created", "subscription_id": subscription.id}
 
 @app.get("/api/admin/users", response_model=List[UserResponse])
-async def get_all_users(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    return db.query(User).all()
+async def get_all_users(current_user: UserSnapshot = Depends(get_admin_user), db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(User))).scalars().all()
+
+@app.put("/api/admin/users/{user_id}/status", response_model=UserResponse)
+async def update_user_status(
+    user_id: int,
+    status_data: UserStatusUpdate,
+    current_user: UserSnapshot = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    for field, value in status_data.dict(exclude_unset=True).items():
+        setattr(user, field, value)
+    await db.commit()
+    await user_cache.invalidate(user_id)
+    return user
 
 @app.put("/api/admin/users/{user_id}/limit")
 async def update_user_limit(
     user_id: int,
     limit_data: UserLimitUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserSnapshot = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    for key in db.query(APIKey).filter(APIKey.user_id == user_id).all():
+    keys = (await db.execute(select(APIKey).filter(APIKey.user_id == user_id))).scalars().all()
+    token_limit_set = "daily_token_limit" in limit_data.dict(exclude_unset=True)
+    for key in keys:
         key.daily_limit = limit_data.daily_limit
+        if token_limit_set:
+            key.daily_token_limit = limit_data.daily_token_limit
     
-    db.commit()
+    await db.commit()
+    await api_key_cache.invalidate(*[key.key for key in keys])
     return {"message": "Limits updated"}
 
 @app.post("/api/admin/plans", response_model=PlanResponse)
 async def create_plan(
     plan_data: PlanCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserSnapshot = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     plan = Plan(**plan_data.dict())
     db.add(plan)
-    db.commit()
-    db.refresh(plan)
+    await db.commit()
+    await db.refresh(plan)
     return plan
 
 @app.get("/api/admin/analytics")
-async def get_analytics(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def get_analytics(current_user: UserSnapshot = Depends(get_admin_user), db: AsyncSession = Depends(get_async_db)):
+    # Request totals come from the usage rollups rather than counting chat_logs.
+    usage = await usage_rollups.query_usage(db, None, None)
     return {
-        "total_users": db.query(User).count(),
-        "total_requests": db.query(ChatLog).count(),
-        "active_subscriptions": db.query(Subscription).filter(Subscription.status == "active").count()
+        "total_users": await db.scalar(select(func.count()).select_from(User)),
+        "total_requests": usage[0]["requests"],
+        "active_subscriptions": await db.scalar(select(func.count()).select_from(Subscription).filter(Subscription.status == "active"))
     }
 
+@app.get("/api/admin/analytics/usage")
+async def get_usage(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Optional[str] = None,
+    period: str = "day",
+    current_user: UserSnapshot = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if group_by is not None and group_by not in usage_rollups.GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {list(usage_rollups.GROUP_BY)}")
+    if period not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="period must be 'hour' or 'day'")
+    # bucket_start is naive UTC; aware query-string values must match it.
+    start = naive_utc(start) if start else None
+    end = naive_utc(end) if end else None
+    return {"period": period, "group_by": group_by,
+            "usage": await usage_rollups.query_usage(db, start, end, group_by, period)}
+
+@app.get("/api/admin/cache")
+async def get_cache_stats(current_user: UserSnapshot = Depends(get_admin_user)):
+    return response_cache.get_stats()
+
+@app.get("/api/admin/providers")
+async def get_provider_health(current_user: UserSnapshot = Depends(get_admin_user)):
+    return {**provider_router.health(), "ollama_nodes": ollama_client.status()}
+
+@app.get("/api/admin/admission")
+async def get_admission_status(current_user: UserSnapshot = Depends(get_admin_user)):
+    return admission.status()
+
+@app.get("/api/admin/db/pool")
+async def get_db_pool(current_user: UserSnapshot = Depends(get_admin_user)):
+    return pool_status()
+
+@app.get("/api/admin/models/memory")
+async def get_model_memory(current_user: UserSnapshot = Depends(get_admin_user)):
+    return hf_client.memory_report()
+
 @app.get("/api/models")
-async def get_available_models():
-    models = []
-    try:
-        ollama_models = await ollama_client.list_models()
-        for model in ollama_models.get("models", []):
-            models.append({"id": f"ollama:{model['name']}", "name": model['name'], "provider": "ollama", "available": True})
-    except Exception:
-        pass
-    
-    if gemini_client.is_available():
-        models.append({"id": "gemini:pro", "name": "Gemini Pro", "provider": "gemini", "available": True})
-    
-    models.append({"id": "huggingface:microsoft/DialoGPT-medium", "name": "DialoGPT Medium", "provider": "huggingface", "available": True})
-    
-    return {"models": models}
+async def get_available_models(fastapi_request: Request, fastapi_response: Response):
+    body, etag = await model_catalog.get()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if fastapi_request.headers.get("If-None-Match") == etag:
+        return PlainResponse(status_code=304, headers=headers)
+    fastapi_response.headers.update(headers)
+    return body
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,120 @@
+# backend/metrics.py
+import time
+import redis.asyncio as redis
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+
+# Prometheus metrics for the API, scraped from GET /metrics. Each worker process
+# keeps its own registry, so with several uvicorn workers scrape them individually
+# (or aggregate in Prometheus).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to produce the response headers, per route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+
+PROVIDER_SECONDS = Histogram(
+    "provider_generation_seconds", "Full generation time per provider attempt",
+    ["provider", "mode"], buckets=LATENCY_BUCKETS)
+PROVIDER_TTFB_SECONDS = Histogram(
+    "provider_ttfb_seconds", "Time to the first streamed token", ["provider"], buckets=LATENCY_BUCKETS)
+PROVIDER_TOKENS_PER_SECOND = Histogram(
+    "provider_tokens_per_second", "Streamed chunks per second after the first one",
+    ["provider"], buckets=(1, 2, 5, 10, 20, 40, 80, 160, 320))
+PROVIDER_REQUESTS = Counter(
+    "provider_requests_total", "Provider attempts by outcome", ["provider", "outcome"])
+PROVIDER_FALLBACKS = Counter(
+    "provider_fallbacks_total", "Times a provider failed and the next one in the chain was tried",
+    ["provider"])
+
+COALESCED_REQUESTS = Counter(
+    "coalesced_requests_total", "Requests that joined an identical in-flight generation", ["mode"])
+
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Generations currently admitted")
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for admission")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Time spent waiting for admission, by plan tier", ["tier"],
+    buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+ADMISSION_SHED = Counter("admission_shed_total", "Requests rejected by admission control", ["reason"])
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests refused by the rate limiter", ["policy"])
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Database statement execution time", ["operation"], buckets=FAST_BUCKETS)
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_seconds", "Redis command round-trip time", ["command"], buckets=FAST_BUCKETS)
+
+DB_POOL = Gauge("db_pool_connections", "Connections of the async engine's pool", ["state"])
+DB_POOL_CHECKOUTS = Gauge("db_pool_checkouts", "Pool checkouts since start")
+DB_POOL_CHECKOUT_SECONDS = Gauge("db_pool_checkout_seconds_total", "Total time spent checking out connections")
+
+def instrument_engine(sync_engine):
+    """Time every statement run on `sync_engine` (pass `async_engine.sync_engine` for async)."""
+    # The start time lives on the per-statement execution context, so a statement
+    # that fails (and never reaches after_cursor_execute) leaves nothing behind.
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+class InstrumentedRedis(redis.Redis):
+    """redis.asyncio client that times every command (pipelines are not timed)."""
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_SECONDS.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware observing HTTP_REQUEST_SECONDS when the response headers go
+    out, so a long SSE stream is measured by its time to first byte. Requests are
+    labelled by route template (/api/keys/{key_id}) to keep cardinality bounded.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
+
+        async def send_and_observe(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_observe)
+        finally:
+            if not observed:
+                observe(500)
+
+def render(pool_status: dict) -> tuple:
+    """Refresh scrape-time gauges and return (body, content type) for /metrics."""
+    for state in ("in_use", "checked_in", "overflow"):
+        if state in pool_status:
+            DB_POOL.labels(state).set(pool_status[state])
+    DB_POOL_CHECKOUTS.set(pool_status["checkouts"])
+    DB_POOL_CHECKOUT_SECONDS.set(pool_status["checkout_seconds_total"])
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Create or upgrade the database schema.
+
+Run this once per deploy (python migrate.py) instead of creating tables when the
+API is imported, so worker startup never waits on DDL.
+"""
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+
+load_dotenv()
+
+from database import engine, Base
+import models  # noqa: F401  (registers every table on Base.metadata)
+import chat_log_storage
+
+# Columns added to tables after they were first created. create_all only creates
+# missing tables, so existing deployments get these via ALTER TABLE.
+ADDED_COLUMNS = [
+    ("api_keys", "cache_responses", "BOOLEAN DEFAULT TRUE"),
+    ("api_keys", "coalesce_requests", "BOOLEAN DEFAULT TRUE"),
+    ("chat_logs", "conversation_id", "INTEGER REFERENCES conversations(id)"),
+    ("api_keys", "daily_token_limit", "INTEGER"),
+    ("plans", "daily_tokens", "INTEGER"),
+    ("chat_logs", "prompt_tokens", "INTEGER"),
+    ("chat_logs", "completion_tokens", "INTEGER"),
+    ("chat_logs", "total_tokens", "INTEGER"),
+    ("chat_logs", "latency_ms", "INTEGER"),
+]
+
+# Indexes declared on models after their tables existed: (name, table, columns).
+ADDED_INDEXES = [
+    ("ix_chat_logs_conversation_id", "chat_logs", "conversation_id"),
+    ("ix_chat_logs_user_created", "chat_logs", "user_id, created_at"),
+    ("ix_chat_logs_api_key_created", "chat_logs", "api_key_id, created_at"),
+]
+
+def migrate():
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                print(f"Added column {table}.{column}")
+        for name, table, columns in ADDED_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+        if conn.dialect.name == "postgresql":
+            # An empty chat_logs (fresh install) is cheap to convert right away;
+            # a populated one is left for `python chat_log_storage.py partition`.
+            if chat_log_storage.is_partitioned(conn):
+                chat_log_storage.ensure_partitions(conn)
+            elif conn.scalar(text("SELECT NOT EXISTS (SELECT 1 FROM chat_logs)")):
+                chat_log_storage.partition_chat_logs(conn)
+                chat_log_storage.ensure_partitions(conn)
+            else:
+                print("NOTE: chat_logs is not partitioned; run `python chat_log_storage.py partition`")
+    print("✅ Database schema is up to date.")
+
+if __name__ == "__main__":
+    migrate()
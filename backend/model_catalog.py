@@ -0,0 +1,80 @@
+# backend/model_catalog.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class ModelCatalog:
+    """
+    The /api/models listing, served from memory with an ETag.
+
+    It is rebuilt from the Ollama nodes' state whenever OllamaClient's health
+    check has refreshed it (every OLLAMA_HEALTH_INTERVAL seconds), so the
+    catalog adds no polling of its own. Ollama entries carry a `state` of
+    "loaded" or "cold" so clients (and the router, see OllamaProvider.is_cold)
+    can tell which models answer without a load delay. Models listed in
+    OLLAMA_WARM_MODELS are loaded on startup and re-warmed every
+    OLLAMA_WARM_INTERVAL seconds with OLLAMA_KEEP_ALIVE (default "30m"), so they
+    stay resident even when idle.
+    """
+    def __init__(self, ollama_client, gemini_client):
+        self.ollama = ollama_client
+        self.gemini = gemini_client
+        self.warm_models = [name.strip() for name in os.getenv("OLLAMA_WARM_MODELS", "").split(",") if name.strip()]
+        self.warm_interval = float(os.getenv("OLLAMA_WARM_INTERVAL", "600"))
+        self.keep_alive = ollama_client.keep_alive or "30m"
+        self.body: Optional[dict] = None
+        self.etag: Optional[str] = None
+        self._tasks = []
+        ollama_client.on_refresh.append(self.rebuild)
+
+    def start(self):
+        if self.warm_models:
+            self._tasks.append(asyncio.create_task(self._warm_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def get(self) -> tuple:
+        """Return (body, etag), checking the Ollama nodes now if nothing has yet."""
+        if self.body is None:
+            if all(node.available_models is None for node in self.ollama.nodes):
+                await self.ollama.refresh()
+            if self.body is None:
+                self.rebuild()
+        return self.body, self.etag
+
+    def rebuild(self):
+        models = [
+            {"id": f"ollama:{name}", "name": name, "provider": "ollama", "available": True,
+             "state": self.ollama.model_state(name)}
+            for name in self.ollama.models()
+        ]
+        if self.gemini.is_available():
+            models.append({"id": "gemini:pro", "name": "Gemini Pro", "provider": "gemini", "available": True})
+        models.append({"id": "huggingface:microsoft/DialoGPT-medium", "name": "DialoGPT Medium", "provider": "huggingface", "available": True})
+
+        body = {"models": models}
+        self.etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest() + '"'
+        self.body = body
+
+    async def warm(self):
+        for model in self.warm_models:
+            nodes = await self.ollama.warm(model, self.keep_alive)
+            logger.info(f"Warmed Ollama model {model} on {nodes} node(s)")
+
+    async def _warm_loop(self):
+        while True:
+            try:
+                await self.warm()
+                self.rebuild()
+            except Exception as e:
+                logger.warning(f"Model warmup failed: {e}")
+            await asyncio.sleep(self.warm_interval)
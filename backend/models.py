@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, ForeignKey, Float, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base # <-- Import Base from database.py
@@ -27,7 +27,10 @@ class APIKey(Base):
     key = Column(String, unique=True, index=True)
     name = Column(String)
     daily_limit = Column(Integer, default=10)
+    daily_token_limit = Column(Integer, nullable=True)  # None = no token budget
     is_active = Column(Boolean, default=True)
+    cache_responses = Column(Boolean, default=True)
+    coalesce_requests = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_used = Column(DateTime)
     
@@ -42,6 +45,7 @@ class Plan(Base):
     description = Column(Text)
     price = Column(Float)
     daily_requests = Column(Integer)
+    daily_tokens = Column(Integer, nullable=True)  # None = no token budget
     stripe_price_id = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -63,7 +67,12 @@ class Subscription(Base):
     plan = relationship("Plan", back_populates="subscriptions")
 
 class ChatLog(Base):
+    # On Postgres this is partitioned by month on created_at (see chat_log_storage.py)
     __tablename__ = "chat_logs"
+    __table_args__ = (
+        Index("ix_chat_logs_user_created", "user_id", "created_at"),
+        Index("ix_chat_logs_api_key_created", "api_key_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -73,6 +82,45 @@ class ChatLog(Base):
     model = Column(String)
     ip_address = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    total_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=True)
+    
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), index=True, nullable=True)
     
     user = relationship("User", back_populates="chat_logs")
     api_key = relationship("APIKey", back_populates="chat_logs")
+    conversation = relationship("Conversation", back_populates="chat_logs")
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    api_key_id = Column(Integer, ForeignKey("api_keys.id"))
+    # Rolling summary of turns that no longer fit the context window
+    summary = Column(Text, default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    chat_logs = relationship("ChatLog", back_populates="conversation")
+
+class UsageRollup(Base):
+    """Pre-aggregated usage per hour/day bucket, user, API key and model."""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("period", "bucket_start", "user_id", "api_key_id", "model", name="uq_usage_rollups_bucket"),
+        Index("ix_usage_rollups_period_bucket", "period", "bucket_start"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(4))  # "hour" or "day"
+    bucket_start = Column(DateTime)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    api_key_id = Column(Integer, ForeignKey("api_keys.id"))
+    model = Column(String)
+    requests = Column(BigInteger, default=0)
+    errors = Column(BigInteger, default=0)
+    tokens = Column(BigInteger, default=0)
+    latency_ms_total = Column(BigInteger, default=0)
@@ -1,44 +1,343 @@
+import asyncio
 import httpx
+import itertools
+import json
+import logging
 import os
-from typing import Optional
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+def _model_key(model: str) -> str:
+    # Ollama reports untagged models as "<name>:latest".
+    return model if ":" in model else f"{model}:latest"
+
+def _record_tokens(meta: Optional[dict], result: dict):
+    # prompt_eval_count is left out when Ollama reused a cached prompt.
+    if meta is not None:
+        meta["prompt_tokens"] = result.get("prompt_eval_count") or 0
+        meta["completion_tokens"] = result.get("eval_count") or 0
+
+class OllamaNode:
+    """One Ollama server: its own keep-alive connection pool plus routing state."""
+    def __init__(self, base_url: str, limits: httpx.Limits):
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.AsyncClient(base_url=self.base_url, limits=limits)
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.available_models = None  # from /api/tags; None until the first health check
+        self.loaded_models = set()    # from /api/ps, i.e. already in memory
+
+    def is_healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    def status(self) -> dict:
+        return {
+            "healthy": self.is_healthy(),
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "loaded_models": sorted(self.loaded_models),
+        }
 
 class OllamaClient:
-    def __init__(self, base_url: Optional[str] = None):
-        self.base_url = base_url or os.getenv("OLLAMA_URL", "http://localhost:11434")
-        self.client = httpx.AsyncClient()
-        print(f"OllamaClient initialized with base URL: {self.base_url}")
-    
-    async def chat(self, message: str, model: str = "mistral") -> str:
+    """
+    Client for one or more Ollama servers.
+
+    `base_url` (or OLLAMA_URL) may be a comma-separated list of nodes. Each request
+    goes to the healthy node with the fewest in-flight requests, preferring nodes
+    that already have the model in memory, then nodes that have it pulled. A node
+    is ejected for OLLAMA_EJECT_SECONDS after OLLAMA_EJECT_FAILURES consecutive
+    connection failures; `start()` runs a background health check every
+    OLLAMA_HEALTH_INTERVAL seconds that refreshes each node's models and brings
+    ejected nodes back once they answer again.
+
+    Each node keeps its own connection pool: OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE and OLLAMA_KEEPALIVE_EXPIRY (seconds) tune it.
+    OLLAMA_KEEP_ALIVE (e.g. "30m") is sent with every request to control how
+    long Ollama keeps the model in memory afterwards.
+    """
+    def __init__(self, base_url: Union[str, List[str], None] = None):
+        urls = base_url or os.getenv("OLLAMA_URL", "http://localhost:11434")
+        if isinstance(urls, str):
+            urls = [url.strip() for url in urls.split(",") if url.strip()]
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("OLLAMA_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30")),
+        )
+        self.nodes = [OllamaNode(url, limits) for url in urls]
+        self.eject_failures = int(os.getenv("OLLAMA_EJECT_FAILURES", "3"))
+        self.eject_seconds = float(os.getenv("OLLAMA_EJECT_SECONDS", "30"))
+        self.health_interval = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE")
+        self._rotation = itertools.count()
+        self._health_task = None
+        self.on_refresh: List[Callable[[], None]] = []  # called after every health check
+        logger.debug(f"OllamaClient initialized with nodes: {[node.base_url for node in self.nodes]}")
+
+    @property
+    def base_url(self) -> str:
+        return self.nodes[0].base_url
+
+    def start(self):
+        if self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for node in self.nodes:
+            await node.client.aclose()
+
+    def pick(self, model: Optional[str] = None, exclude=()) -> OllamaNode:
+        """Least-outstanding-requests choice among healthy nodes that can serve `model`."""
+        healthy = [node for node in self.nodes if node.is_healthy() and node not in exclude]
+        if not healthy:
+            raise Exception("Ollama connection error: no healthy Ollama nodes")
+        if model:
+            key = _model_key(model)
+            loaded = [node for node in healthy if key in node.loaded_models]
+            # Nodes not checked yet might have the model; only skip known misses.
+            pulled = [node for node in healthy if node.available_models is None or key in node.available_models]
+            healthy = loaded or pulled or healthy
+        # Rotate the starting point so ties don't always land on the first node.
+        offset = next(self._rotation) % len(healthy)
+        rotated = healthy[offset:] + healthy[:offset]
+        return min(rotated, key=lambda node: node.in_flight)
+
+    @contextmanager
+    def _track(self, node: OllamaNode):
+        node.in_flight += 1
         try:
-            print(f"Sending request to Ollama model '{model}'...")
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": message,
-                    "stream": False
-                },
-                # FIX: Increased timeout to 120 seconds
-                timeout=120.0 
-            )
+            yield
+        finally:
+            node.in_flight -= 1
+
+    def _connect_failed(self, node: OllamaNode):
+        node.failures += 1
+        if node.failures >= self.eject_failures and node.is_healthy():
+            node.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning(f"Ejecting Ollama node {node.base_url} after {node.failures} failed connections")
+
+    async def _post(self, path: str, payload: dict, model: Optional[str], timeout: float) -> dict:
+        """POST to the best node, moving on to the next one if it can't be reached."""
+        tried = []
+        while True:
+            node = self.pick(model, exclude=tried)
+            tried.append(node)
+            try:
+                with self._track(node):
+                    response = await node.client.post(path, json=payload, timeout=timeout)
+            except httpx.ConnectError as e:
+                self._connect_failed(node)
+                logger.error(f"Ollama Connection Error: Could not connect to {node.base_url}. Is Ollama running?")
+                if len(tried) < len(self.nodes):
+                    continue
+                raise Exception(f"Ollama connection error: {e}")
+            node.failures = 0
             response.raise_for_status()
-            result = response.json()
-            print("Received successful response from Ollama.")
+            if model:
+                node.loaded_models.add(_model_key(model))
+            return response.json()
+
+    async def chat(self, message: str, model: str = "mistral", context: Optional[list] = None,
+                   meta: Optional[dict] = None) -> str:
+        """
+        `context` is the token array Ollama returned for the previous turn; passing it
+        back continues that conversation without re-sending or re-prefilling it.
+        If `meta` is given, the new context is stored in meta["context"].
+        """
+        try:
+            logger.debug(f"Sending request to Ollama model '{model}'...")
+            payload = {
+                "model": model,
+                "prompt": message,
+                "stream": False
+            }
+            if context:
+                payload["context"] = context
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
+            # FIX: Increased timeout to 120 seconds
+            result = await self._post("/api/generate", payload, model, timeout=120.0)
+            logger.debug("Received successful response from Ollama.")
+            if meta is not None:
+                meta["context"] = result.get("context")
+            _record_tokens(meta, result)
             return result.get("response", "No response generated")
-        except httpx.ConnectError as e:
-            print(f"Ollama Connection Error: Could not connect to {self.base_url}. Is Ollama running?")
-            raise Exception(f"Ollama connection error: {e}")
         except httpx.ReadTimeout as e:
-            print(f"Ollama Timeout Error: The request to model '{model}' timed out. This can happen on the first load.")
+            logger.error(f"Ollama Timeout Error: The request to model '{model}' timed out. This can happen on the first load.")
             raise Exception(f"Ollama timeout error: {e}")
         except Exception as e:
-            print(f"An unexpected Ollama error occurred: {e}")
+            logger.error(f"An unexpected Ollama error occurred: {e}")
             raise Exception(f"Ollama error: {e}")
-    
+
+    async def chat_stream(self, message: str, model: str = "mistral", context: Optional[list] = None,
+                          meta: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield response tokens from Ollama's streaming /api/generate as they arrive.
+
+        Closing the generator (e.g. on client disconnect) exits the ``stream``
+        context, which closes the upstream connection and lets Ollama abort
+        the generation.
+        """
+        payload = {
+            "model": model,
+            "prompt": message,
+            "stream": True
+        }
+        if context:
+            payload["context"] = context
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        tried = []
+        while True:
+            node = self.pick(model, exclude=tried)
+            tried.append(node)
+            try:
+                with self._track(node):
+                    async with node.client.stream(
+                        "POST",
+                        "/api/generate",
+                        json=payload,
+                        timeout=120.0
+                    ) as response:
+                        node.failures = 0
+                        response.raise_for_status()
+                        node.loaded_models.add(_model_key(model))
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            if chunk.get("error"):
+                                raise Exception(chunk["error"])
+                            token = chunk.get("response")
+                            if token:
+                                yield token
+                            if chunk.get("done"):
+                                if meta is not None:
+                                    meta["context"] = chunk.get("context")
+                                _record_tokens(meta, chunk)
+                                break
+                return
+            except httpx.ConnectError as e:
+                # Nothing has been yielded yet, so another node can take over.
+                self._connect_failed(node)
+                logger.error(f"Ollama Connection Error: Could not connect to {node.base_url}. Is Ollama running?")
+                if len(tried) < len(self.nodes):
+                    continue
+                raise Exception(f"Ollama connection error: {e}")
+            except httpx.ReadTimeout as e:
+                logger.error(f"Ollama Timeout Error: The streaming request to model '{model}' timed out.")
+                raise Exception(f"Ollama timeout error: {e}")
+
+    async def embed(self, text: str, model: str = "nomic-embed-text") -> list:
+        try:
+            result = await self._post("/api/embeddings", {"model": model, "prompt": text}, model, timeout=30.0)
+            return result["embedding"]
+        except Exception as e:
+            raise Exception(f"Ollama embedding error: {e}")
+
     async def list_models(self):
+        """Models pulled on any healthy node, in Ollama's /api/tags format."""
+        models = {}
+        errors = []
+        for node in self.nodes:
+            if not node.is_healthy():
+                continue
+            try:
+                response = await node.client.get("/api/tags")
+                response.raise_for_status()
+                for model in response.json().get("models", []):
+                    models.setdefault(model["name"], model)
+            except Exception as e:
+                errors.append(e)
+        if errors and not models:
+            raise Exception(f"Failed to list Ollama models: {errors[0]}")
+        return {"models": list(models.values())}
+
+    async def check_node(self, node: OllamaNode):
+        """Refresh a node's model lists; a node that answers is healthy again."""
         try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
-            return response.json()
+            tags = await node.client.get("/api/tags", timeout=5.0)
+            tags.raise_for_status()
+            ps = await node.client.get("/api/ps", timeout=5.0)
+            loaded = {model["name"] for model in ps.json().get("models", [])} if ps.is_success else node.loaded_models
         except Exception as e:
-            raise Exception(f"Failed to list Ollama models: {str(e)}")
+            if node.is_healthy():
+                self._connect_failed(node)
+            else:
+                node.ejected_until = time.monotonic() + self.eject_seconds
+            logger.debug(f"Ollama health check failed for {node.base_url}: {e}")
+            return
+        if not node.is_healthy():
+            logger.info(f"Ollama node {node.base_url} is back")
+        node.available_models = {model["name"] for model in tags.json().get("models", [])}
+        node.loaded_models = loaded
+        node.failures = 0
+        node.ejected_until = 0.0
+
+    async def refresh(self):
+        await asyncio.gather(*(self.check_node(node) for node in self.nodes))
+        for listener in self.on_refresh:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"Ollama refresh listener failed: {e}")
+
+    async def _health_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.health_interval)
+
+    async def warm(self, model: str, keep_alive: str) -> int:
+        """
+        Load `model` into memory on every healthy node that has it pulled and keep
+        it there for `keep_alive`. A generate call without a prompt only loads the
+        model. Returns the number of nodes that loaded it.
+        """
+        key = _model_key(model)
+        nodes = [node for node in self.nodes if node.is_healthy()
+                 and (node.available_models is None or key in node.available_models)]
+
+        async def warm_node(node: OllamaNode) -> bool:
+            try:
+                with self._track(node):
+                    # Loading a large model from disk can take a while.
+                    response = await node.client.post(
+                        "/api/generate", json={"model": model, "keep_alive": keep_alive}, timeout=300.0)
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"Could not warm {model} on {node.base_url}: {e}")
+                return False
+            node.loaded_models.add(key)
+            return True
+
+        return sum(await asyncio.gather(*(warm_node(node) for node in nodes)))
+
+    def models(self) -> List[str]:
+        """Models pulled on any healthy node, as of the last health check."""
+        names = set()
+        for node in self.nodes:
+            if node.is_healthy() and node.available_models:
+                names |= node.available_models
+        return sorted(names)
+
+    def model_state(self, model: str) -> str:
+        """
+        "loaded" if a healthy node has `model` in memory, "cold" if none does,
+        "unknown" before any health check has answered.
+        """
+        key = _model_key(model)
+        healthy = [node for node in self.nodes if node.is_healthy()]
+        if any(key in node.loaded_models for node in healthy):
+            return "loaded"
+        if any(node.available_models is not None for node in healthy):
+            return "cold"
+        return "unknown"
+
+    def status(self) -> list:
+        return [{"url": node.base_url, **node.status()} for node in self.nodes]
@@ -0,0 +1,41 @@
+# backend/passwords.py
+import os
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from executors import kdf_executor, run_blocking
+
+# PASSWORD_SCHEME picks the KDF (bcrypt, scrypt, pbkdf2_sha256, or argon2 when
+# argon2-cffi is installed) and PASSWORD_ROUNDS its cost. For bcrypt and scrypt
+# rounds are log2 of the work factor; for pbkdf2 it's the iteration count.
+#
+# hex_sha256 is the unsalted SHA-256 hex digest that passwords used to be stored
+# as. It is still accepted, but deprecated, so a successful login rehashes it with
+# the current scheme. The same happens to hashes made with fewer rounds than
+# PASSWORD_ROUNDS.
+SCHEME = os.getenv("PASSWORD_SCHEME", "bcrypt")
+DEFAULT_ROUNDS = {"bcrypt": 12, "scrypt": 16, "pbkdf2_sha256": 600000, "argon2": 3}
+ROUNDS = int(os.getenv("PASSWORD_ROUNDS", str(DEFAULT_ROUNDS.get(SCHEME, 12))))
+
+pwd_context = CryptContext(
+    schemes=[SCHEME, "hex_sha256"],
+    deprecated=["hex_sha256"],
+    **{f"{SCHEME}__default_rounds": ROUNDS, f"{SCHEME}__min_rounds": ROUNDS},
+)
+
+async def hash_password(password: str) -> str:
+    return await run_blocking(kdf_executor, pwd_context.hash, password)
+
+async def verify_password(password: str, password_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password on the KDF pool. Returns (valid, new_hash); new_hash is set
+    when the stored hash should be replaced with one using the current settings.
+    """
+    if not password_hash:
+        # Unknown user: still spend a KDF run so response time doesn't reveal it.
+        await run_blocking(kdf_executor, pwd_context.dummy_verify)
+        return (False, None)
+    try:
+        return await run_blocking(kdf_executor, pwd_context.verify_and_update, password, password_hash)
+    except ValueError:
+        # Unrecognized hash format
+        return (False, None)
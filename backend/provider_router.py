@@ -0,0 +1,403 @@
+# backend/provider_router.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import metrics
+from response_cache import normalize_prompt
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+class AllProvidersFailed(Exception):
+    pass
+
+class UnknownProvider(Exception):
+    pass
+
+class UnknownModel(UnknownProvider):
+    pass
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and the
+    provider is skipped for `reset_timeout` seconds. Then a single half-open
+    probe request is let through: success closes the breaker, failure re-opens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+        self.reset_timeout = reset_timeout or float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.probe_started = None
+        # A probe that never reported back (e.g. its request was cancelled) must not
+        # wedge the breaker, so allow another one after reset_timeout.
+        if self.state == self.HALF_OPEN and (self.probe_started is None or now - self.probe_started >= self.reset_timeout):
+            self.probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_started = None
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class ProviderStats:
+    """Rolling latency / error stats over the last `window` calls."""
+    def __init__(self, window: int = 100):
+        self.calls = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        self.calls.append((latency, ok))
+
+    def percentile(self, pct: float) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self.calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def snapshot(self) -> dict:
+        total = len(self.calls)
+        errors = sum(1 for _, ok in self.calls if not ok)
+        return {
+            "calls": total,
+            "error_rate": errors / total if total else 0.0,
+            "p50_latency": self.percentile(50),
+            "p95_latency": self.percentile(95),
+        }
+
+class Provider:
+    """Common interface over the provider clients."""
+    name: str = None
+    default_model: str = None
+
+    def __init__(self, client):
+        self.client = client
+        self.breaker = CircuitBreaker()
+        self.stats = ProviderStats()
+
+    def is_available(self) -> bool:
+        return True
+
+    def is_cold(self, model: Optional[str]) -> bool:
+        """True if the model is known to need loading before it can answer."""
+        return False
+
+    def accepts(self, model: Optional[str]) -> bool:
+        """Whether callers may request `model` from this provider by name."""
+        return True
+
+    def label(self, model: Optional[str]) -> str:
+        return f"{self.name}:{model or self.default_model}"
+
+    def prompt(self, message: str, conversation) -> str:
+        """The text prompt for `message`, including conversation history if any."""
+        return conversation.prompt(message) if conversation else message
+
+    async def chat(self, message: str, model: Optional[str], conversation=None, meta: Optional[dict] = None) -> str:
+        """
+        `conversation` is an optional ConversationContext; `meta` is an optional dict
+        the provider fills with per-call details (e.g. Ollama's context array, and
+        prompt_tokens / completion_tokens from every provider).
+        """
+        raise NotImplementedError
+
+    def chat_stream(self, message: str, model: Optional[str], conversation=None,
+                    meta: Optional[dict] = None) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+class OllamaProvider(Provider):
+    name = "ollama"
+    default_model = "mistral"
+
+    def _request(self, message, model, conversation):
+        # Continue from Ollama's own context array when the previous turn came from
+        # the same model; only the new message then needs prefilling.
+        if conversation and conversation.state.context and conversation.state.context_model == self.label(model):
+            return message, conversation.state.context
+        return self.prompt(message, conversation), None
+
+    def is_cold(self, model):
+        return self.client.model_state(model or self.default_model) == "cold"
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        prompt, context = self._request(message, model, conversation)
+        return await self.client.chat(prompt, model or self.default_model, context=context, meta=meta)
+
+    def chat_stream(self, message, model, conversation=None, meta=None):
+        prompt, context = self._request(message, model, conversation)
+        return self.client.chat_stream(prompt, model or self.default_model, context=context, meta=meta)
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    default_model = "pro"
+
+    def is_available(self):
+        return self.client.is_available()
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        return await self.client.chat(self.prompt(message, conversation), meta=meta)
+
+    def chat_stream(self, message, model, conversation=None, meta=None):
+        return self.client.chat_stream(self.prompt(message, conversation), meta=meta)
+
+class HuggingFaceProvider(Provider):
+    name = "huggingface"
+    default_model = "default"
+
+    def accepts(self, model):
+        return model in (None, self.default_model) or model in self.client.allowed_models
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        return await self.client.chat(self.prompt(message, conversation),
+                                      None if model in (None, self.default_model) else model, meta)
+
+    def chat_stream(self, message, model, conversation=None, meta=None):
+        return self.client.chat_stream(self.prompt(message, conversation),
+                                       None if model in (None, self.default_model) else model, meta)
+
+class ProviderRouter:
+    """
+    Routes chat requests over an ordered fallback chain of providers.
+
+    Providers whose circuit breaker is open are skipped without a network call,
+    so an unhealthy backend costs nothing until its half-open probe. A requested
+    model of the form "<provider>:<model>" (as listed by /api/models) moves that
+    provider to the front of the chain; a bare model name is treated as an Ollama
+    model.
+    """
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+        self.by_name = {provider.name: provider for provider in providers}
+        # "p95" (default) hedges after the primary's observed p95 latency;
+        # a number pins the hedge delay in milliseconds.
+        self.hedge_delay_setting = os.getenv("HEDGE_DELAY_MS", "p95")
+        self.hedge_default_delay = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "2000")) / 1000
+        self.hedge_stats = {"requests": 0, "hedged": 0, "hedge_won": 0,
+                            "wins": {provider.name: 0 for provider in providers}}
+        self.single_flight = SingleFlight()
+        # Try providers whose default model is cold after the warm ones (explicitly
+        # requested models are never moved).
+        self.avoid_cold = os.getenv("ROUTER_AVOID_COLD_MODELS", "false").lower() == "true"
+
+    def parse_model(self, requested_model: Optional[str]) -> Tuple[Optional[Provider], Optional[str]]:
+        if not requested_model or requested_model == "default":
+            return None, None
+        name, sep, model = requested_model.partition(":")
+        if not sep:
+            name, model = "ollama", requested_model
+        if name not in self.by_name:
+            raise UnknownProvider(f"Unknown model provider '{name}'")
+        if not self.by_name[name].accepts(model or None):
+            raise UnknownModel(f"Unknown model '{requested_model}'")
+        return self.by_name[name], model or None
+
+    def chain(self, requested_model: Optional[str] = None) -> List[Tuple[Provider, Optional[str]]]:
+        """The full ordered (provider, model) fallback chain, ignoring health."""
+        preferred, model = self.parse_model(requested_model)
+        chain = [(preferred, model)] if preferred else []
+        rest = [(provider, None) for provider in self.providers if provider is not preferred]
+        if self.avoid_cold:
+            rest.sort(key=lambda candidate: candidate[0].is_cold(None))
+        return chain + rest
+
+    def candidates(self, requested_model: Optional[str] = None) -> Iterator[Tuple[Provider, Optional[str]]]:
+        """
+        Lazily yield the (provider, model) pairs that are configured and whose breaker
+        admits a call. Lazy so a half-open probe slot is only taken when the caller
+        actually gets as far as that provider.
+        """
+        for provider, model in self.chain(requested_model):
+            if provider.is_available() and provider.breaker.allow():
+                yield provider, model
+
+    def record(self, provider: Provider, started: float, ok: bool, mode: str = "chat"):
+        elapsed = time.perf_counter() - started
+        provider.stats.record(elapsed, ok)
+        metrics.PROVIDER_SECONDS.labels(provider.name, mode).observe(elapsed)
+        metrics.PROVIDER_REQUESTS.labels(provider.name, "ok" if ok else "error").inc()
+        if ok:
+            provider.breaker.record_success()
+        else:
+            provider.breaker.record_failure()
+
+    async def _attempt(self, provider: Provider, model: Optional[str], message: str,
+                       conversation, meta: Optional[dict]) -> str:
+        started = time.perf_counter()
+        try:
+            logger.debug(f"Attempting to use provider: {provider.label(model)}")
+            response_text = await provider.chat(message, model, conversation, meta)
+            if not response_text or not response_text.strip():
+                # Same as an empty stream: not an answer, so fall back and never cache it.
+                raise Exception("empty response")
+        except Exception:
+            self.record(provider, started, ok=False)
+            raise
+        self.record(provider, started, ok=True)
+        return response_text
+
+    async def _chat_once(self, provider: Provider, model: Optional[str], message: str,
+                         conversation, meta: Optional[dict], coalesce: bool) -> str:
+        """
+        One provider attempt. With `coalesce`, identical concurrent prompts to the
+        same provider/model share a single attempt, which is recorded once.
+        Conversation turns are never coalesced since their prompts carry history.
+        """
+        if not coalesce or conversation is not None:
+            return await self._attempt(provider, model, message, conversation, meta)
+        return await self.single_flight.do(
+            (provider.label(model), normalize_prompt(message)),
+            lambda shared_meta: self._attempt(provider, model, message, None, shared_meta),
+            meta,
+        )
+
+    def stream(self, provider: Provider, model: Optional[str], message: str, conversation=None,
+               meta: Optional[dict] = None, coalesce: bool = False) -> Tuple[AsyncIterator[str], bool]:
+        """
+        Open a provider token stream, joining an identical in-flight one when
+        `coalesce` is set. Returns (stream, leader); only the leader should
+        `record` the attempt.
+        """
+        if not coalesce or conversation is not None:
+            return provider.chat_stream(message, model, conversation, meta), True
+        return self.single_flight.stream(
+            (provider.label(model), normalize_prompt(message)),
+            lambda shared_meta: provider.chat_stream(message, model, None, shared_meta),
+            meta,
+        )
+
+    async def chat(self, message: str, requested_model: Optional[str] = None,
+                   conversation=None, meta: Optional[dict] = None, coalesce: bool = False,
+                   slots=None) -> Tuple[str, str]:
+        """
+        Return (response_text, model_label) from the first healthy provider that succeeds.
+        `slots` (see batch_jobs.ProviderSlots) caps how many attempts run against each provider.
+        """
+        for provider, model in self.candidates(requested_model):
+            try:
+                if slots:
+                    async with slots.acquire(provider.name):
+                        response_text = await self._chat_once(provider, model, message, conversation, meta, coalesce)
+                else:
+                    response_text = await self._chat_once(provider, model, message, conversation, meta, coalesce)
+            except Exception as e:
+                metrics.PROVIDER_FALLBACKS.labels(provider.name).inc()
+                logger.warning(f"{provider.label(model)} failed: {e}. Falling back.")
+                continue
+            return response_text, provider.label(model)
+        raise AllProvidersFailed("All AI services are currently unavailable.")
+
+    def hedge_delay(self, provider: Provider) -> float:
+        if self.hedge_delay_setting != "p95":
+            return float(self.hedge_delay_setting) / 1000
+        # Too few samples make p95 meaningless; use the default until we have some.
+        if len(provider.stats.calls) < 20:
+            return self.hedge_default_delay
+        return provider.stats.percentile(95) or self.hedge_default_delay
+
+    async def hedged_chat(self, message: str, requested_model: Optional[str] = None,
+                          conversation=None, meta: Optional[dict] = None, coalesce: bool = False) -> Tuple[str, str]:
+        """
+        Like `chat`, but if the current provider hasn't answered within the hedge
+        delay, fire the same prompt at the next provider in the chain and take
+        whichever answers first. The losing request's task is cancelled, which
+        closes its httpx connection (local HF generation on the inference pool
+        runs to completion in the background).
+        """
+        candidates = self.candidates(requested_model)
+        pending = {}
+
+        def launch():
+            candidate = next(candidates, None)
+            if candidate is None:
+                return None
+            provider, model = candidate
+            # Each racer gets its own meta so the loser can't clobber the winner's.
+            task_meta = {}
+            task = asyncio.create_task(self._chat_once(provider, model, message, conversation, task_meta, coalesce))
+            pending[task] = (provider, model, task_meta)
+            return provider
+
+        self.hedge_stats["requests"] += 1
+        primary = launch()
+        hedged = False
+        try:
+            while pending:
+                timeout = None if hedged else self.hedge_delay(primary)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The primary is slow: hedge with the next provider.
+                    hedged = True
+                    hedge = launch()
+                    if hedge:
+                        self.hedge_stats["hedged"] += 1
+                        logger.info(f"Hedging {primary.name} with {hedge.name}")
+                    continue
+                for task in done:
+                    provider, model, task_meta = pending.pop(task)
+                    try:
+                        response_text = task.result()
+                    except Exception as e:
+                        metrics.PROVIDER_FALLBACKS.labels(provider.name).inc()
+                        logger.warning(f"{provider.label(model)} failed: {e}. Falling back.")
+                        continue
+                    if meta is not None:
+                        meta.update(task_meta)
+                    if hedged:
+                        self.hedge_stats["wins"][provider.name] += 1
+                        if provider is not primary:
+                            self.hedge_stats["hedge_won"] += 1
+                    return response_text, provider.label(model)
+                if not pending:
+                    # Everything in flight failed before the hedge fired: plain fallback.
+                    primary = launch()
+                    hedged = False
+            raise AllProvidersFailed("All AI services are currently unavailable.")
+        finally:
+            for task in pending:
+                task.cancel()
+            # Wait for the losers to finish cancelling so none is left pending or
+            # with an exception nobody retrieved.
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def health(self) -> dict:
+        requests = self.hedge_stats["requests"]
+        return {
+            **{
+                provider.name: {
+                    "available": provider.is_available(),
+                    "circuit": provider.breaker.state,
+                    **provider.stats.snapshot(),
+                }
+                for provider in self.providers
+            },
+            "hedging": {
+                **self.hedge_stats,
+                "hedge_rate": self.hedge_stats["hedged"] / requests if requests else 0.0,
+            },
+            "single_flight": dict(self.single_flight.stats),
+        }
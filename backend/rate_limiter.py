@@ -1,44 +1,186 @@
-import redis
+import logging
+import os
+import time
+import uuid
+import redis.asyncio as redis
 from datetime import datetime, timedelta
+from usage_history import usage_key, minute_field, history_ttl
+
+logger = logging.getLogger(__name__)
+
+# Each policy is a single Lua script, so the check, the increment, the TTL and the
+# usage-hash update happen atomically in one round trip (EVALSHA). Concurrent bursts
+# can no longer slip between a GET and an INCR and overshoot the limit.
+#
+# All scripts take KEYS[1] = limiter state, KEYS[2] = today's usage hash (see
+# usage_history.py), KEYS[3] = today's token counter, and return {allowed (0/1),
+# remaining}. The last five ARGV of every script are the token limit read by
+# CHECK_TOKEN_BUDGET and the usage arguments read by RECORD_USAGE.
+
+# Refuse the request outright once the day's token budget is spent. Token usage is
+# only known after generation (see record_tokens), so concurrent requests can each
+# overshoot the budget by at most their own size.
+# ARGV (fifth from last): daily_token_limit, 0 for none
+CHECK_TOKEN_BUDGET = """
+local token_limit = tonumber(ARGV[#ARGV - 4])
+if token_limit > 0 and tonumber(redis.call('GET', KEYS[3]) or '0') >= token_limit then
+    return {0, 0}
+end
+"""
+
+# Bump the current minute's counter in the usage hash.
+# ARGV (last four): minute_field, ip, timestamp, usage_ttl_seconds
+RECORD_USAGE = """
+local u = #ARGV - 3
+redis.call('HINCRBY', KEYS[2], ARGV[u], 1)
+redis.call('HSET', KEYS[2], 'last_ip', ARGV[u + 1], 'last_seen', ARGV[u + 2])
+redis.call('EXPIRE', KEYS[2], ARGV[u + 3])
+"""
+
+# Calendar-day counter (the original behaviour).
+# ARGV: limit, ttl_seconds, <token limit>, <usage>
+FIXED_DAY_SCRIPT = CHECK_TOKEN_BUDGET + """
+local limit = tonumber(ARGV[1])
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+if count >= limit then
+    return {0, 0}
+end
+count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+""" + RECORD_USAGE + """
+return {1, limit - count}
+"""
+
+# Sliding window over the last `window` ms, one sorted-set member per request.
+# ARGV: limit, window_ms, now_ms, member, <token limit>, <usage>
+SLIDING_WINDOW_SCRIPT = CHECK_TOKEN_BUDGET + """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count >= limit then
+    return {0, 0}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('PEXPIRE', KEYS[1], window)
+""" + RECORD_USAGE + """
+return {1, limit - count - 1}
+"""
+
+# Token bucket holding up to `limit` tokens, refilled continuously so that a full
+# bucket's worth of tokens is restored every `window` ms.
+# ARGV: limit, window_ms, now_ms, <token limit>, <usage>
+TOKEN_BUCKET_SCRIPT = CHECK_TOKEN_BUDGET + """
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + (now - ts) * capacity / window)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+if allowed == 0 then
+    return {0, 0}
+end
+""" + RECORD_USAGE + """
+return {1, math.floor(tokens)}
+"""
+
+# Charge a finished generation against the day's token budget and usage hash.
+# KEYS: token counter, usage hash. ARGV: tokens, ttl_seconds
+RECORD_TOKENS_SCRIPT = """
+local used = redis.call('INCRBY', KEYS[1], ARGV[1])
+if used == tonumber(ARGV[1]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('HINCRBY', KEYS[2], 'tokens', ARGV[1])
+end
+return used
+"""
+
+POLICIES = ("day", "sliding", "token_bucket")
 
 class RateLimiter:
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: redis.Redis, policy: str = None, window_seconds: int = None):
         self.redis = redis_client
-    
-    async def check_rate_limit(self, api_key: str, daily_limit: int, ip_address: str) -> tuple[bool, int]:
+        self.policy = policy or os.getenv("RATE_LIMIT_POLICY", "day")
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown rate limit policy '{self.policy}', expected one of {POLICIES}")
+        # Only used by the sliding and token_bucket policies; "day" follows the calendar.
+        self.window_seconds = window_seconds or int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "86400"))
+        if self.redis:
+            self._fixed_day = self.redis.register_script(FIXED_DAY_SCRIPT)
+            self._sliding = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+            self._token_bucket = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+            self._record_tokens = self.redis.register_script(RECORD_TOKENS_SCRIPT)
+
+    @staticmethod
+    def token_key(api_key: str) -> str:
+        # Token budgets are daily whatever the request policy, on the same local day as "day".
+        return f"token_usage:{api_key}:{datetime.now().strftime('%Y-%m-%d')}"
+
+    async def check_rate_limit(self, api_key: str, daily_limit: int, ip_address: str,
+                               daily_token_limit: int = None) -> tuple[bool, int]:
+        """
+        Count one request against `daily_limit`, and refuse it if the key has
+        already used its `daily_token_limit` tokens today (None = no budget).
+        """
         if not self.redis:
-            print("WARNING: Redis client not available, skipping rate limit check.")
+            logger.warning("Redis client not available, skipping rate limit check.")
             return (True, 9999)
 
-        today = datetime.now().strftime("%Y-%m-%d")
-        key = f"rate_limit:{api_key}:{today}"
-        
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        # Usage history is bucketed in UTC, independent of the limiter's local day.
+        utcnow = datetime.utcnow()
+        usage = [daily_token_limit or 0, minute_field(utcnow), ip_address, utcnow.isoformat(), history_ttl()]
+        usage_keys = [usage_key(api_key, utcnow), self.token_key(api_key)]
+
         try:
-            # FIX: Corrected logic for handling a key that doesn't exist yet
-            raw_count = self.redis.get(key)
-            current_count = int(raw_count) if raw_count else 0
-            
-            if current_count >= daily_limit:
-                return (False, 0)
-            
-            new_count = self.redis.incr(key)
-            
-            if new_count == 1:
-                self.redis.expire(key, 86400)
-
-            remaining = daily_limit - new_count
-            
-            usage_key = f"usage:{api_key}:{today}"
-            usage_data = {
-                "count": str(new_count),
-                "ip": ip_address,
-                "timestamp": datetime.now().isoformat()
-            }
-            for field, value in usage_data.items():
-                self.redis.hset(usage_key, field, value)
-            self.redis.expire(usage_key, 86400)
-            
-            return (True, remaining)
+            if self.policy == "day":
+                allowed, remaining = await self._fixed_day(
+                    keys=[f"rate_limit:{api_key}:{today}", *usage_keys],
+                    args=[daily_limit, 86400, *usage]
+                )
+            elif self.policy == "sliding":
+                now_ms = int(time.time() * 1000)
+                allowed, remaining = await self._sliding(
+                    keys=[f"rate_limit:sliding:{api_key}", *usage_keys],
+                    args=[daily_limit, self.window_seconds * 1000, now_ms,
+                          f"{now_ms}-{uuid.uuid4().hex[:8]}", *usage]
+                )
+            else:
+                allowed, remaining = await self._token_bucket(
+                    keys=[f"rate_limit:bucket:{api_key}", *usage_keys],
+                    args=[daily_limit, self.window_seconds * 1000, int(time.time() * 1000), *usage]
+                )
+            return (bool(allowed), int(remaining))
         except Exception as e:
-            print(f"ERROR: Redis rate limit check failed: {e}")
+            logger.error(f"Redis rate limit check failed: {e}")
             return (True, 9999)
+
+    async def record_tokens(self, api_key: str, tokens: int):
+        """Charge a finished generation's tokens to the key's daily budget."""
+        if not self.redis or not tokens:
+            return
+        try:
+            await self._record_tokens(
+                keys=[self.token_key(api_key), usage_key(api_key, datetime.utcnow())],
+                args=[tokens, 86400]
+            )
+        except Exception as e:
+            logger.error(f"Redis token usage update failed: {e}")
@@ -0,0 +1,139 @@
+# backend/response_cache.py
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+class CachedResponse(NamedTuple):
+    response: str
+    model: str          # provider/model that actually generated the response
+    latency: float      # seconds the original generation took
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt used for cache keys."""
+    return " ".join(prompt.lower().split())
+
+class ResponseCache:
+    """
+    Two-tier cache of chat completions keyed on (normalized prompt, model).
+
+    1. Exact tier: sha256 of the normalized prompt, O(1) lookup.
+    2. Semantic tier (optional, enabled by passing `embed`): every cached prompt's
+       embedding is kept in a local in-memory index, and a miss on the exact tier
+       returns the nearest cached entry if its cosine similarity is at least
+       `similarity_threshold`.
+
+    Entries are evicted LRU once `maxsize` is reached and expire after `ttl` seconds.
+    """
+    def __init__(self, maxsize: int = None, ttl: float = None,
+                 embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                 similarity_threshold: float = None):
+        self.maxsize = maxsize or int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold or float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+        self._entries: "OrderedDict[str, tuple[float, str, CachedResponse]]" = OrderedDict()
+        self._vectors: dict = {}
+        self._index = None  # (keys, matrix) snapshot of self._vectors, rebuilt lazily
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "latency_saved_seconds": 0.0}
+
+    @staticmethod
+    def _key(normalized: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalized}".encode()).hexdigest()
+
+    def _evict(self, key: str):
+        self._entries.pop(key, None)
+        if self._vectors.pop(key, None) is not None:
+            self._index = None
+
+    def _lookup(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _nearest(self, vector, model: str) -> Optional[str]:
+        import numpy as np
+        if not self._vectors:
+            return None
+        if self._index is None:
+            keys = list(self._vectors)
+            self._index = (keys, np.stack([self._vectors[k] for k in keys]))
+        keys, matrix = self._index
+        scores = matrix @ vector
+        for i in np.argsort(-scores):
+            if scores[i] < self.similarity_threshold:
+                return None
+            entry = self._entries.get(keys[i])
+            if entry and entry[1] == model:
+                return keys[i]
+        return None
+
+    async def _embed(self, normalized: str):
+        # numpy is only needed by the optional semantic tier, so import it on first use.
+        import numpy as np
+        try:
+            vector = np.asarray(await self.embed(normalized), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Response cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    async def get(self, prompt: str, model: str) -> Optional[CachedResponse]:
+        normalized = normalize_prompt(prompt)
+        value = self._lookup(self._key(normalized, model))
+        if value:
+            self.stats["exact_hits"] += 1
+            self.stats["latency_saved_seconds"] += value.latency
+            return value
+
+        if self.embed:
+            vector = await self._embed(normalized)
+            if vector is not None:
+                key = self._nearest(vector, model)
+                value = self._lookup(key) if key else None
+                if value:
+                    self.stats["semantic_hits"] += 1
+                    self.stats["latency_saved_seconds"] += value.latency
+                    return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, prompt: str, model: str, value: CachedResponse):
+        """Store a successful generation; blank responses are never cached."""
+        if not value.response.strip():
+            return
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, model)
+        self._entries[key] = (time.monotonic() + self.ttl, model, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            oldest, _ = self._entries.popitem(last=False)
+            self._evict(oldest)
+
+        if self.embed and key not in self._vectors:
+            vector = await self._embed(normalized)
+            # The entry may have been evicted while we were waiting on the embedding.
+            if vector is not None and key in self._entries:
+                self._vectors[key] = vector
+                self._index = None
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
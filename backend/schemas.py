@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from datetime import datetime
 from typing import Optional, List
 
@@ -24,12 +24,28 @@ class UserResponse(BaseModel):
 class APIKeyCreate(BaseModel):
     name: str
 
+class APIKeyUpdate(BaseModel):
+    # Every field is optional, but one that is sent can't be null.
+    name: Optional[str] = None
+    cache_responses: Optional[bool] = None
+    coalesce_requests: Optional[bool] = None
+
+    @field_validator("name", "cache_responses", "coalesce_requests")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
 class APIKeyResponse(BaseModel):
     id: int
     key: str
     name: str
     daily_limit: int
+    daily_token_limit: Optional[int] = None
     is_active: bool
+    cache_responses: Optional[bool] = True
+    coalesce_requests: Optional[bool] = True
     created_at: datetime
     last_used: Optional[datetime]
     
@@ -39,12 +55,20 @@ class APIKeyResponse(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     model: Optional[str] = None
+    stream: bool = False
+    hedge: Optional[bool] = None
+    conversation_id: Optional[int] = None
+
+class BatchChatRequest(BaseModel):
+    messages: List[str]
+    model: Optional[str] = None
 
 class PlanCreate(BaseModel):
     name: str
     description: str
     price: float
     daily_requests: int
+    daily_tokens: Optional[int] = None
     stripe_price_id: str
 
 class PlanResponse(BaseModel):
@@ -53,6 +77,7 @@ class PlanResponse(BaseModel):
     description: str
     price: float
     daily_requests: int
+    daily_tokens: Optional[int] = None
     is_active: bool
     
     class Config:
@@ -63,3 +88,16 @@ class SubscriptionCreate(BaseModel):
 
 class UserLimitUpdate(BaseModel):
     daily_limit: int
+    daily_token_limit: Optional[int] = None
+
+class UserStatusUpdate(BaseModel):
+    # Like APIKeyUpdate: either flag may be omitted, but not sent as null.
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+
+    @field_validator("is_active", "is_admin")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
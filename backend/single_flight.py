@@ -0,0 +1,123 @@
+# backend/single_flight.py
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Optional, Tuple
+import metrics
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class _Stream:
+    def __init__(self):
+        self.chunks = []
+        self.meta = {}
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight upstream calls.
+
+    `do` shares one awaited result between all concurrent callers with the same
+    key. `stream` shares one token stream; a caller that joins late first
+    replays the chunks produced so far, then follows live. The upstream call is
+    cancelled only once every caller waiting on it has gone away, so one client
+    disconnecting doesn't abort the generation for the others.
+
+    Upstream functions receive a fresh `meta` dict (see provider_router.Provider);
+    whatever they put in it is copied into every caller's own meta.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self.stats = {"calls": 0, "coalesced": 0, "streams": 0, "coalesced_streams": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[dict], Awaitable], meta: Optional[dict] = None):
+        call = self._calls.get(key)
+        if call is None:
+            self.stats["calls"] += 1
+            call = _Call(asyncio.ensure_future(self._run(fn)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+        else:
+            self.stats["coalesced"] += 1
+            metrics.COALESCED_REQUESTS.labels("chat").inc()
+        call.waiters += 1
+        try:
+            value, shared_meta = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+        if meta is not None:
+            meta.update(shared_meta)
+        return value
+
+    @staticmethod
+    async def _run(fn):
+        meta = {}
+        return await fn(meta), meta
+
+    def stream(self, key: Hashable, factory: Callable[[dict], AsyncIterator],
+               meta: Optional[dict] = None) -> Tuple[AsyncIterator, bool]:
+        """Return (chunk iterator, leader); `leader` is False when joining an existing stream."""
+        flight = self._streams.get(key)
+        leader = flight is None
+        if leader:
+            self.stats["streams"] += 1
+            flight = _Stream()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, factory))
+        else:
+            self.stats["coalesced_streams"] += 1
+            metrics.COALESCED_REQUESTS.labels("stream").inc()
+        flight.subscribers += 1
+        return self._follow(flight, meta), leader
+
+    async def _pump(self, key, flight: _Stream, factory):
+        stream = factory(flight.meta)
+        try:
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except BaseException as e:
+            flight.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            await stream.aclose()
+            flight.done = True
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            flight.notify()
+
+    async def _follow(self, flight: _Stream, meta: Optional[dict]) -> AsyncIterator:
+        sent = 0
+        try:
+            while True:
+                while sent < len(flight.chunks):
+                    yield flight.chunks[sent]
+                    sent += 1
+                if flight.done:
+                    break
+                await flight.changed.wait()
+            if flight.error is not None:
+                if isinstance(flight.error, asyncio.CancelledError):
+                    raise Exception("Shared generation was cancelled")
+                raise flight.error
+            if meta is not None:
+                meta.update(flight.meta)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
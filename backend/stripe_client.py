@@ -1,14 +1,23 @@
-import stripe
 import os
 from typing import Dict, Any
+from executors import io_executor, run_blocking
 
 class StripeClient:
     def __init__(self):
-        stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_...")
+        self.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_...")
+    
+    def _stripe(self):
+        # The stripe SDK is only needed by the billing routes, so import it on first use.
+        import stripe
+        stripe.api_key = self.api_key
+        return stripe
     
     async def create_customer(self, email: str, name: str = None) -> Dict[str, Any]:
+        stripe = self._stripe()
         try:
-            customer = stripe.Customer.create(
+            customer = await run_blocking(
+                io_executor,
+                stripe.Customer.create,
                 email=email,
                 name=name
             )
@@ -17,16 +26,19 @@ class StripeClient:
             raise Exception(f"Stripe customer creation failed: {str(e)}")
     
     async def create_subscription(self, customer_email: str, price_id: str) -> Dict[str, Any]:
+        stripe = self._stripe()
         try:
             # Create or get customer
-            customers = stripe.Customer.list(email=customer_email)
+            customers = await run_blocking(io_executor, stripe.Customer.list, email=customer_email)
             if customers.data:
                 customer = customers.data[0]
             else:
                 customer = await self.create_customer(customer_email)
             
             # Create subscription
-            subscription = stripe.Subscription.create(
+            subscription = await run_blocking(
+                io_executor,
+                stripe.Subscription.create,
                 customer=customer.id,
                 items=[{"price": price_id}],
                 payment_behavior="default_incomplete",
@@ -38,8 +50,9 @@ class StripeClient:
             raise Exception(f"Stripe subscription creation failed: {str(e)}")
     
     async def cancel_subscription(self, subscription_id: str) -> Dict[str, Any]:
+        stripe = self._stripe()
         try:
-            subscription = stripe.Subscription.delete(subscription_id)
+            subscription = await run_blocking(io_executor, stripe.Subscription.delete, subscription_id)
             return subscription
         except Exception as e:
             raise Exception(f"Stripe subscription cancellation failed: {str(e)}")
@@ -0,0 +1,81 @@
+# backend/tests/conftest.py
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# The backend modules import each other as top-level modules (`import metrics`),
+# the same way main.py is run from the backend directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database.py reads DATABASE_URL at import; tests that touch the database get a
+# throwaway SQLite file unless one is configured.
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "chatbot-tests.db"))
+
+@pytest.fixture
+def fresh_db():
+    """Create every table from scratch on the test database; yields the sync engine."""
+    from database import Base, engine
+    import models  # noqa: F401 - registers the tables on Base.metadata
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+class StandInOllama:
+    """A tiny HTTP server answering the Ollama endpoints the client uses."""
+    def __init__(self, pulled=("mistral:latest",), loaded=()):
+        self.pulled = set(pulled)
+        self.loaded = set(loaded)
+        self.generated = []
+        self.polls = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                stand_in.polls += 1
+                names = stand_in.pulled if self.path == "/api/tags" else stand_in.loaded
+                self.reply(200, {"models": [{"name": name} for name in sorted(names)]})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                model = payload["model"] if ":" in payload["model"] else payload["model"] + ":latest"
+                if model not in stand_in.pulled:
+                    return self.reply(404, {"error": f"model '{payload['model']}' not found"})
+                stand_in.loaded.add(model)
+                stand_in.generated.append(payload.get("prompt"))
+                self.reply(200, {"response": "hi", "prompt_eval_count": 3, "eval_count": 1})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stand_ins():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(StandInOllama(**kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,105 @@
+# backend/tests/test_admission.py
+import asyncio
+from admission import AdmissionController, AdmittedStreamingResponse, Overloaded
+
+SCOPE = {"type": "http", "method": "POST", "path": "/api/chat", "headers": []}
+
+def test_tenant_over_its_share_waits_for_a_release():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=4, tenant_concurrency=1, max_wait_ms=1000)
+        first = await admission.acquire("a", 0)
+        waiting = asyncio.create_task(admission.acquire("a", 0))
+        await asyncio.sleep(0)
+        assert admission.waiting == 1
+        first.release()
+        second = await waiting
+        second.release()
+        assert admission.in_flight == 0 and admission.waiting == 0
+
+    asyncio.run(scenario())
+
+def test_queued_request_is_shed_after_max_wait():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_wait_ms=10)
+        ticket = await admission.acquire("a", 0)
+        try:
+            await admission.acquire("b", 0)
+            assert False, "expected Overloaded"
+        except Overloaded as e:
+            assert e.retry_after >= 1
+        ticket.release()
+        assert admission.in_flight == 0 and admission.waiting == 0
+
+    asyncio.run(scenario())
+
+def test_streamed_ticket_released_when_client_disconnects_before_first_chunk():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        ticket = await admission.acquire("a", 0)
+        provider_started = asyncio.Event()
+
+        async def body():
+            provider_started.set()
+            await asyncio.Event().wait()  # the provider never produces a token
+            yield "data: never\n\n"
+
+        async def receive():
+            await provider_started.wait()
+            return {"type": "http.disconnect"}
+
+        sent = []
+        async def send(message):
+            sent.append(message["type"])
+
+        response = AdmittedStreamingResponse(body(), ticket=ticket, media_type="text/event-stream")
+        await asyncio.wait_for(response(SCOPE, receive, send), 1)
+        assert "http.response.body" not in sent
+        assert ticket.released and admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_streamed_ticket_released_when_send_fails():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        ticket = await admission.acquire("a", 0)
+
+        async def body():
+            yield "data: {}\n\n"
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            raise OSError("connection reset")
+
+        response = AdmittedStreamingResponse(body(), ticket=ticket)
+        try:
+            await response(SCOPE, receive, send)
+        except Exception:
+            pass
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_waiter_cancelled_in_the_same_tick_as_a_release_does_not_leak_the_slot():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_wait_ms=1000)
+        first = await admission.acquire("a", 0)
+        cancelled = asyncio.create_task(admission.acquire("b", 0))
+        await asyncio.sleep(0)
+        assert admission.waiting == 1
+        # What wait_for does to the queued future on a timeout, or (3.12+) when
+        # the waiting task is cancelled; the waiter's own cleanup runs later.
+        admission._tenants["b"].queue[0].future.cancel()
+        first.release()
+        try:
+            await cancelled
+            assert False, "expected CancelledError"
+        except asyncio.CancelledError:
+            pass
+        assert admission.in_flight == 0 and admission.waiting == 0
+        ticket = await asyncio.wait_for(admission.acquire("c", 0), 1)
+        ticket.release()
+        assert admission.in_flight == 0 and not admission._tenants
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+# backend/tests/test_batching.py
+import asyncio
+from batching import BatchingEngine
+
+def test_concurrent_prompts_share_one_generate_call():
+    calls = []
+
+    def generate_batch(prompts, model_name):
+        calls.append((model_name, list(prompts)))
+        return [prompt.upper() for prompt in prompts]
+
+    async def scenario():
+        engine = BatchingEngine(generate_batch, max_batch_size=8, max_wait_ms=50)
+        results = await asyncio.gather(*(engine.submit(f"p{i}", "tiny") for i in range(8)))
+        assert results == [f"P{i}" for i in range(8)]
+        engine._worker.cancel()
+
+    asyncio.run(scenario())
+    assert len(calls) == 1 and len(calls[0][1]) == 8
+
+def test_batches_are_split_by_model_and_size():
+    calls = []
+
+    def generate_batch(prompts, model_name):
+        calls.append((model_name, len(prompts)))
+        return prompts
+
+    async def scenario():
+        engine = BatchingEngine(generate_batch, max_batch_size=3, max_wait_ms=50)
+        submits = [engine.submit("x", "a") for _ in range(3)] + [engine.submit("y", "b") for _ in range(2)]
+        await asyncio.gather(*submits)
+        engine._worker.cancel()
+
+    asyncio.run(scenario())
+    assert ("a", 3) in calls and ("b", 2) in calls
+    assert all(size <= 3 for _, size in calls)
+
+def test_generation_error_reaches_every_caller_in_the_batch():
+    def generate_batch(prompts, model_name):
+        raise RuntimeError("out of memory")
+
+    async def scenario():
+        engine = BatchingEngine(generate_batch, max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*(engine.submit("x", "a") for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        engine._worker.cancel()
+
+    asyncio.run(scenario())
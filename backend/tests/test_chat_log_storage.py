@@ -0,0 +1,50 @@
+# backend/tests/test_chat_log_storage.py
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+from models import ChatLog
+import chat_log_storage
+
+def test_month_helpers():
+    assert chat_log_storage.next_month(date(2024, 12, 1)) == date(2025, 1, 1)
+    assert chat_log_storage.partition_name(date(2024, 5, 1)) == "chat_logs_y2024m05"
+
+def test_archive_exports_and_deletes_expired_months_on_sqlite(fresh_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_log_storage, "ARCHIVE_DIR", str(tmp_path))
+    old = datetime.utcnow() - timedelta(days=200)
+    with fresh_db.begin() as conn:
+        conn.execute(insert(ChatLog), [
+            dict(user_id=1, message="old", response="r", created_at=old),
+            dict(user_id=1, message="new", response="r", created_at=datetime.utcnow()),
+        ])
+    chat_log_storage.archive_expired(retention_days=90)
+    with fresh_db.connect() as conn:
+        assert conn.scalars(select(ChatLog.message)).all() == ["new"]
+    [archive] = os.listdir(tmp_path)
+    with gzip.open(tmp_path / archive, "rt") as f:
+        assert [json.loads(line)["message"] for line in f] == ["old"]
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="set TEST_POSTGRES_URL to a scratch Postgres database")
+def test_uncovered_month_lands_in_default_partition_and_moves_out():
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    far = chat_log_storage.month_start(datetime.utcnow() + timedelta(days=400))
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS chat_logs CASCADE"))
+        conn.execute(text(
+            "CREATE TABLE chat_logs (id serial, message text, created_at timestamp, "
+            "PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"
+        ))
+        chat_log_storage.ensure_partitions(conn)
+        # Past the partitions created in advance: has to go to the default partition.
+        conn.execute(text("INSERT INTO chat_logs (message, created_at) VALUES ('future', :ts)"),
+                     {"ts": datetime.combine(far, datetime.min.time())})
+        assert conn.scalar(text(f"SELECT count(*) FROM {chat_log_storage.DEFAULT_PARTITION}")) == 1
+
+        chat_log_storage.ensure_partitions(conn)
+        assert conn.scalar(text(f"SELECT count(*) FROM {chat_log_storage.DEFAULT_PARTITION}")) == 0
+        assert conn.scalar(text(f"SELECT count(*) FROM {chat_log_storage.partition_name(far)}")) == 1
+        assert far in chat_log_storage.list_partitions(conn)
+        conn.execute(text("DROP TABLE chat_logs CASCADE"))
@@ -0,0 +1,28 @@
+# backend/tests/test_conversation_store.py
+import asyncio
+from conversation_store import ConversationState, ConversationStore
+
+def test_background_summaries_are_tracked_and_cancelled_on_stop():
+    cancelled = []
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def summarize(prompt):
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
+
+        store = ConversationStore(token_budget=10, summarize=summarize)
+        state = ConversationState(1, 1, turns=[["an old question " * 4, "an old answer " * 4]])
+        await store.append(state, "new question", "new answer", "ollama:mistral")
+        assert len(store._tasks) == 1
+        await started.wait()
+        await store.stop()
+        assert not store._tasks
+
+    asyncio.run(scenario())
+    assert len(cancelled) == 1 and "an old question" in cancelled[0]
@@ -0,0 +1,85 @@
+# backend/tests/test_huggingface_client.py
+import asyncio
+import threading
+import time
+from huggingface_client import HuggingFaceClient
+
+MB = 2**20
+
+class WordTokenizer:
+    def encode(self, text):
+        return text.split()
+
+class StandInClient(HuggingFaceClient):
+    """Skips transformers: "loading" a model just records what was resident at the time."""
+    def __init__(self, sizes, budget_mb):
+        super().__init__()
+        self.sizes = sizes
+        self.memory_budget = budget_mb * MB
+        self.resident_during_load = {}
+        self.release_load = threading.Event()
+        self.release_load.set()
+
+    def _estimate_bytes(self, model_name):
+        return self.sizes[model_name] * MB
+
+    def _load(self, model_name):
+        self.resident_during_load[model_name] = set(self.models)
+        self.release_load.wait(5)
+        size = self.sizes[model_name] * MB
+        return WordTokenizer(), object(), size, size
+
+def test_idle_models_are_unloaded_before_the_new_one_loads():
+    client = StandInClient({"a": 40, "b": 40, "c": 40}, budget_mb=100)
+    client.load_model("a")
+    client.load_model("b")
+    client.load_model("c")
+    assert client.resident_during_load["c"] == {"b"}
+    assert list(client.models) == ["b", "c"]
+
+def test_models_in_use_are_never_unloaded():
+    client = StandInClient({"a": 60, "b": 60}, budget_mb=100)
+    with client._use("a"):
+        client.load_model("b")
+        assert set(client.models) == {"a", "b"}
+    assert client.memory_report()["resident_mb"] == 120
+
+def test_memory_report_does_not_wait_for_a_load():
+    client = StandInClient({"a": 10, "slow": 10}, budget_mb=100)
+    client.load_model("a")
+    client.release_load.clear()
+    loader = threading.Thread(target=client.load_model, args=("slow",))
+    loader.start()
+    try:
+        while "slow" not in client.resident_during_load:
+            time.sleep(0.01)
+        started = time.perf_counter()
+        report = client.memory_report()
+        assert time.perf_counter() - started < 0.5
+        assert list(report["models"]) == ["a"]
+    finally:
+        client.release_load.set()
+        loader.join()
+    assert "slow" in client.memory_report()["models"]
+
+def test_chat_counts_tokens_even_if_the_model_is_unloaded_right_after():
+    class EvictedAfterGenerating(StandInClient):
+        def _generate_with(self, tokenizer, model, messages):
+            return ["three word reply" for _ in messages]
+
+        def _generate_batch(self, messages, model_name):
+            results = super()._generate_batch(messages, model_name)
+            # Another request unloads the model as soon as it is unpinned.
+            with self._lock:
+                self.models.clear()
+            return results
+
+    client = EvictedAfterGenerating({"a": 10}, budget_mb=100)
+    meta = {}
+
+    async def scenario():
+        assert await client.chat("hello there", "a", meta) == "three word reply"
+        client.batcher._worker.cancel()
+
+    asyncio.run(scenario())
+    assert meta == {"prompt_tokens": 2, "completion_tokens": 3}
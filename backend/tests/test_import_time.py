@@ -0,0 +1,32 @@
+# backend/tests/test_import_time.py
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Imported lazily by the provider/billing clients; none may load with main.
+HEAVY_MODULES = ("transformers", "torch", "google.generativeai", "stripe")
+# Generous, since CI machines vary; locally `import main` takes well under a second.
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "3000"))
+
+def import_times(module: str) -> dict:
+    """Cumulative import time in microseconds per module, from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND, capture_output=True, text=True, timeout=120,
+        env={**os.environ, "LOG_LEVEL": "ERROR"},
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def test_importing_main_skips_heavy_provider_modules_and_stays_fast():
+    times = import_times("main")
+    loaded = [name for name in HEAVY_MODULES if name in times]
+    assert not loaded, f"main imports {loaded} eagerly"
+    assert times["main"] / 1000 < BUDGET_MS, f"import main took {times['main'] / 1000:.0f} ms"
@@ -0,0 +1,24 @@
+# backend/tests/test_metrics.py
+import pytest
+from sqlalchemy import create_engine, text
+import metrics
+
+def observed_count(operation: str) -> float:
+    for metric in metrics.DB_QUERY_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name == "db_query_seconds_count" and sample.labels["operation"] == operation:
+                return sample.value
+    return 0.0
+
+def test_instrument_engine_times_statements_and_survives_failures():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    with engine.connect() as conn:
+        before = observed_count("SELECT")
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing_table"))
+        conn.rollback()
+        # The failed statement is not observed, and leaves no start time behind.
+        assert observed_count("SELECT") == before
+        conn.execute(text("SELECT 1"))
+        assert observed_count("SELECT") == before + 1
@@ -0,0 +1,32 @@
+# backend/tests/test_model_catalog.py
+import asyncio
+import types
+from model_catalog import ModelCatalog
+from ollama_client import OllamaClient
+
+def test_catalog_reuses_the_ollama_health_check(stand_ins, monkeypatch):
+    monkeypatch.setenv("OLLAMA_HEALTH_INTERVAL", "0")
+    node = stand_ins(pulled=("mistral:latest",))
+    gemini = types.SimpleNamespace(is_available=lambda: False)
+
+    async def scenario():
+        client = OllamaClient(node.url)
+        catalog = ModelCatalog(client, gemini)
+        try:
+            body, etag = await catalog.get()
+            assert body["models"][0] == {"id": "ollama:mistral:latest", "name": "mistral:latest",
+                                         "provider": "ollama", "available": True, "state": "cold"}
+            polls = node.polls
+            # Served from memory: no further requests to Ollama.
+            assert await catalog.get() == (body, etag)
+            assert node.polls == polls
+
+            # The next health check rebuilds the catalog with the new state.
+            node.loaded.add("mistral:latest")
+            await client.refresh()
+            new_body, new_etag = await catalog.get()
+            assert new_body["models"][0]["state"] == "loaded" and new_etag != etag
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,89 @@
+# backend/tests/test_ollama_client.py
+import asyncio
+import socket
+import pytest
+from ollama_client import OllamaClient
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+def run_with(urls, scenario):
+    async def wrapper():
+        client = OllamaClient(urls)
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+
+    return asyncio.run(wrapper())
+
+def test_failed_request_does_not_mark_model_loaded(stand_ins):
+    node = stand_ins(pulled=())
+
+    async def scenario(client):
+        with pytest.raises(Exception):
+            await client.chat("hello", "missing-model")
+        assert client.nodes[0].loaded_models == set()
+
+    run_with(node.url, scenario)
+
+def test_successful_request_marks_model_loaded_and_records_tokens(stand_ins):
+    node = stand_ins()
+
+    async def scenario(client):
+        meta = {}
+        assert await client.chat("hello", "mistral", meta=meta) == "hi"
+        assert client.nodes[0].loaded_models == {"mistral:latest"}
+        assert (meta["prompt_tokens"], meta["completion_tokens"]) == (3, 1)
+
+    run_with(node.url, scenario)
+
+def test_prefers_the_node_that_has_the_model_loaded(stand_ins):
+    cold, warm = stand_ins(), stand_ins(loaded=("mistral:latest",))
+
+    async def scenario(client):
+        await client.refresh()
+        for _ in range(4):
+            await client.chat("hello", "mistral")
+
+    run_with(f"{cold.url},{warm.url}", scenario)
+    assert len(warm.generated) == 4 and not cold.generated
+
+def test_skips_nodes_without_the_model_pulled(stand_ins):
+    empty, pulled = stand_ins(pulled=()), stand_ins()
+
+    async def scenario(client):
+        await client.refresh()
+        await client.chat("hello", "mistral")
+
+    run_with(f"{empty.url},{pulled.url}", scenario)
+    assert pulled.generated == ["hello"]
+
+def test_fails_over_and_ejects_an_unreachable_node(stand_ins, monkeypatch):
+    monkeypatch.setenv("OLLAMA_EJECT_FAILURES", "1")
+    node = stand_ins()
+
+    async def scenario(client):
+        down = client.nodes[0]
+        # Both nodes are idle and unchecked, so the first request tries the dead one first.
+        for _ in range(4):
+            assert await client.chat("hello", "mistral") == "hi"
+        assert not down.is_healthy()
+        assert [status["healthy"] for status in client.status()] == [False, True]
+
+    run_with(f"{closed_port_url()},{node.url}", scenario)
+    assert len(node.generated) == 4
+
+def test_health_check_reports_models_and_state(stand_ins):
+    node = stand_ins(pulled=("mistral:latest", "llama2:latest"), loaded=("llama2:latest",))
+
+    async def scenario(client):
+        assert client.model_state("mistral") == "unknown"
+        await client.refresh()
+        assert client.models() == ["llama2:latest", "mistral:latest"]
+        assert client.model_state("llama2") == "loaded"
+        assert client.model_state("mistral") == "cold"
+
+    run_with(node.url, scenario)
@@ -0,0 +1,31 @@
+# backend/tests/test_passwords.py
+import asyncio
+import hashlib
+from passwords import SCHEME, hash_password, pwd_context, verify_password
+
+def test_hash_and_verify():
+    async def run():
+        password_hash = await hash_password("correct horse")
+        assert pwd_context.identify(password_hash) == SCHEME
+        assert await verify_password("correct horse", password_hash) == (True, None)
+        assert (await verify_password("wrong", password_hash))[0] is False
+
+    asyncio.run(run())
+
+def test_legacy_sha256_is_upgraded_on_login():
+    legacy = hashlib.sha256(b"correct horse").hexdigest()
+
+    async def run():
+        valid, new_hash = await verify_password("correct horse", legacy)
+        assert valid and pwd_context.identify(new_hash) == SCHEME
+        assert await verify_password("correct horse", new_hash) == (True, None)
+        assert await verify_password("wrong", legacy) == (False, None)
+
+    asyncio.run(run())
+
+def test_unknown_user_and_garbage_hash_fail():
+    async def run():
+        assert await verify_password("correct horse", None) == (False, None)
+        assert await verify_password("correct horse", "not a hash") == (False, None)
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+# backend/tests/test_provider_router.py
+import asyncio
+import types
+import pytest
+from provider_router import HuggingFaceProvider, Provider, ProviderRouter, UnknownModel, UnknownProvider
+
+def hf_router(*allowed):
+    client = types.SimpleNamespace(allowed_models=set(allowed))
+    return ProviderRouter([HuggingFaceProvider(client)])
+
+def test_allowed_huggingface_model_is_routed():
+    router = hf_router("microsoft/DialoGPT-medium")
+    provider, model = router.parse_model("huggingface:microsoft/DialoGPT-medium")
+    assert provider.name == "huggingface" and model == "microsoft/DialoGPT-medium"
+    assert router.parse_model("huggingface:default")[1] == "default"
+    assert router.parse_model("huggingface:")[1] is None
+
+@pytest.mark.parametrize("requested", ["huggingface:someone/huge-model", "huggingface:/etc/models/private"])
+def test_unlisted_huggingface_model_is_rejected(requested):
+    with pytest.raises(UnknownModel):
+        hf_router("microsoft/DialoGPT-medium").parse_model(requested)
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(UnknownProvider):
+        hf_router().parse_model("openai:gpt-4")
+
+class SlowProvider(Provider):
+    name = "slow"
+    default_model = "m"
+
+    def __init__(self, client=None):
+        super().__init__(client)
+        self.cancelled = False
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "slow answer"
+
+class FastProvider(Provider):
+    name = "fast"
+    default_model = "m"
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        await asyncio.sleep(0.01)
+        return "fast answer"
+
+def test_hedged_chat_awaits_the_cancelled_loser(monkeypatch):
+    monkeypatch.setenv("HEDGE_DELAY_MS", "20")
+    slow = SlowProvider()
+    router = ProviderRouter([slow, FastProvider(None)])
+
+    async def scenario():
+        result = await router.hedged_chat("hello")
+        # The loser has already finished cancelling when hedged_chat returns.
+        assert slow.cancelled
+        assert [task for task in asyncio.all_tasks() if task is not asyncio.current_task()] == []
+        return result
+
+    assert asyncio.run(scenario()) == ("fast answer", "fast:m")
+    assert router.hedge_stats["hedge_won"] == 1
@@ -0,0 +1,51 @@
+# backend/tests/test_rate_limiter.py
+import asyncio
+from datetime import datetime
+import pytest
+from rate_limiter import POLICIES, RateLimiter
+from usage_history import usage_key
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def run_with_limiter(policy, scenario):
+    async def wrapper():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        return await scenario(RateLimiter(redis, policy=policy, window_seconds=3600), redis)
+
+    return asyncio.run(wrapper())
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_limit_is_enforced(policy):
+    async def scenario(limiter, redis):
+        results = [await limiter.check_rate_limit("k", 3, "1.2.3.4") for _ in range(4)]
+        assert [allowed for allowed, _ in results] == [True, True, True, False]
+        assert results[0][1] == 2
+
+    run_with_limiter(policy, scenario)
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_concurrent_burst_never_overshoots(policy):
+    async def scenario(limiter, redis):
+        results = await asyncio.gather(*(limiter.check_rate_limit("k", 10, "1.2.3.4") for _ in range(50)))
+        assert sum(1 for allowed, _ in results if allowed) == 10
+
+    run_with_limiter(policy, scenario)
+
+def test_usage_hash_records_the_request():
+    async def scenario(limiter, redis):
+        await limiter.check_rate_limit("k", 10, "1.2.3.4")
+        usage = await redis.hgetall(usage_key("k", datetime.utcnow()))
+        assert usage["last_ip"] == "1.2.3.4"
+        assert sum(int(count) for field, count in usage.items() if field.isdigit()) == 1
+
+    run_with_limiter("day", scenario)
+
+def test_token_budget_refuses_once_spent():
+    async def scenario(limiter, redis):
+        assert (await limiter.check_rate_limit("k", 100, "ip", daily_token_limit=50))[0]
+        await limiter.record_tokens("k", 60)
+        assert not (await limiter.check_rate_limit("k", 100, "ip", daily_token_limit=50))[0]
+        # Keys without a budget are unaffected.
+        assert (await limiter.check_rate_limit("k", 100, "ip"))[0]
+
+    run_with_limiter("day", scenario)
@@ -0,0 +1,118 @@
+# backend/tests/test_response_cache.py
+import asyncio
+import pytest
+import response_cache
+from response_cache import CachedResponse, ResponseCache
+from provider_router import AllProvidersFailed, Provider, ProviderRouter
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def embed(text: str):
+    # Prompts that share their first word land on the same axis, so they count as near-duplicates.
+    vector = [0.0] * 8
+    vector[sum(map(ord, text.split()[0])) % 8] = 1.0
+    return vector
+
+class FailingProvider(Provider):
+    name = "failing"
+    default_model = "m"
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        raise Exception("model exploded")
+
+class BlankProvider(Provider):
+    name = "blank"
+    default_model = "m"
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        return "  "
+
+class EchoProvider(Provider):
+    name = "echo"
+    default_model = "m"
+
+    async def chat(self, message, model, conversation=None, meta=None):
+        return f"echo: {message}"
+
+def test_exact_hit_ignores_case_and_whitespace():
+    async def scenario():
+        cache = ResponseCache(maxsize=10, ttl=60)
+        await cache.put("Hello  World", "default", CachedResponse("hi", "ollama:mistral", 1.5))
+        assert (await cache.get("hello world", "default")).response == "hi"
+        assert await cache.get("hello world", "gemini:pro") is None
+        assert cache.stats["exact_hits"] == 1 and cache.stats["misses"] == 1
+
+    run(scenario())
+
+def test_semantic_hit_for_a_near_duplicate_prompt():
+    pytest.importorskip("numpy")
+
+    async def scenario():
+        cache = ResponseCache(maxsize=10, ttl=60, embed=embed, similarity_threshold=0.9)
+        await cache.put("greetings from the widget", "default", CachedResponse("hi", "ollama:mistral", 1.0))
+        value = await cache.get("greetings widget", "default")
+        assert value is not None and value.response == "hi"
+        assert cache.stats["semantic_hits"] == 1
+        # The semantic tier never crosses models.
+        assert await cache.get("greetings widget", "gemini:pro") is None
+
+    run(scenario())
+
+def test_entries_expire_after_ttl(monkeypatch):
+    pytest.importorskip("numpy")
+
+    async def scenario():
+        now = [1000.0]
+        monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+        cache = ResponseCache(maxsize=10, ttl=30, embed=embed)
+        await cache.put("hello", "default", CachedResponse("hi", "ollama:mistral", 1.0))
+        now[0] += 29
+        assert await cache.get("hello", "default") is not None
+        now[0] += 2
+        assert await cache.get("hello", "default") is None
+        assert cache.get_stats()["entries"] == 0 and not cache._vectors
+
+    run(scenario())
+
+def test_lru_eviction_drops_oldest_entry():
+    async def scenario():
+        cache = ResponseCache(maxsize=2, ttl=60)
+        for prompt in ("a", "b", "c"):
+            await cache.put(prompt, "default", CachedResponse(prompt, "m", 0.1))
+        assert await cache.get("a", "default") is None
+        assert (await cache.get("c", "default")).response == "c"
+
+    run(scenario())
+
+def test_blank_responses_are_not_cached():
+    async def scenario():
+        cache = ResponseCache(maxsize=10, ttl=60)
+        await cache.put("hello", "default", CachedResponse("   ", "m", 0.1))
+        assert await cache.get("hello", "default") is None
+
+    run(scenario())
+
+def test_provider_errors_never_reach_the_cache():
+    async def answer(router, cache, message):
+        # What main.chat does: ask the router, then cache whatever it returned.
+        response_text, model_used = await router.chat(message, None)
+        await cache.put(message, "default", CachedResponse(response_text, model_used, 0.1))
+        return response_text
+
+    async def scenario():
+        cache = ResponseCache(maxsize=10, ttl=60)
+        router = ProviderRouter([FailingProvider(None), BlankProvider(None)])
+        with pytest.raises(AllProvidersFailed):
+            await answer(router, cache, "hello")
+        assert await cache.get("hello", "default") is None
+        # Both attempts count against their breakers instead of passing as answers.
+        assert all(provider.breaker.failures == 1 for provider in router.providers)
+
+        # With a working provider behind them, only its answer is cached.
+        router = ProviderRouter([FailingProvider(None), BlankProvider(None), EchoProvider(None)])
+        assert await answer(router, cache, "hello") == "echo: hello"
+        cached = await cache.get("hello", "default")
+        assert cached.response == "echo: hello" and cached.model == "echo:m"
+
+    run(scenario())
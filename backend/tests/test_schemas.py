@@ -0,0 +1,21 @@
+# backend/tests/test_schemas.py
+import pytest
+from pydantic import ValidationError
+from schemas import APIKeyUpdate, UserStatusUpdate
+
+def test_api_key_update_applies_only_sent_fields():
+    update = APIKeyUpdate(cache_responses=True)
+    assert update.dict(exclude_unset=True) == {"cache_responses": True}
+
+@pytest.mark.parametrize("field", ["name", "cache_responses", "coalesce_requests"])
+def test_api_key_update_rejects_null(field):
+    with pytest.raises(ValidationError):
+        APIKeyUpdate(**{field: None})
+
+def test_user_status_update_applies_only_sent_fields():
+    assert UserStatusUpdate(is_active=False).dict(exclude_unset=True) == {"is_active": False}
+
+@pytest.mark.parametrize("field", ["is_active", "is_admin"])
+def test_user_status_update_rejects_null(field):
+    with pytest.raises(ValidationError):
+        UserStatusUpdate(**{field: None})
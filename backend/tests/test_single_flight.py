@@ -0,0 +1,83 @@
+# backend/tests/test_single_flight.py
+import asyncio
+import pytest
+from single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_upstream_call():
+    calls = []
+
+    async def upstream(meta):
+        calls.append(1)
+        meta["tokens"] = 7
+        await asyncio.sleep(0.05)
+        return "hello"
+
+    async def scenario():
+        flight = SingleFlight()
+        metas = [{} for _ in range(10)]
+        results = await asyncio.gather(*(flight.do("key", upstream, meta) for meta in metas))
+        assert results == ["hello"] * 10
+        assert all(meta == {"tokens": 7} for meta in metas)
+        assert flight.stats["calls"] == 1 and flight.stats["coalesced"] == 9
+        # Finished calls are forgotten, so the next one goes upstream again.
+        assert await flight.do("key", upstream) == "hello"
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+def test_one_caller_cancelling_does_not_abort_the_others():
+    async def upstream(meta):
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do("key", upstream))
+        second = asyncio.create_task(flight.do("key", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+def test_upstream_error_reaches_every_caller():
+    async def upstream(meta):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("ollama down")
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", upstream) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(scenario())
+
+def test_late_stream_subscriber_replays_then_follows():
+    started = []
+
+    async def tokens(meta):
+        started.append(1)
+        for token in ("a", "b", "c"):
+            await asyncio.sleep(0.02)
+            yield token
+        meta["model"] = "mistral"
+
+    async def collect(stream):
+        return [chunk async for chunk in stream]
+
+    async def scenario():
+        flight = SingleFlight()
+        first, leader = flight.stream("key", tokens)
+        first_task = asyncio.create_task(collect(first))
+        await asyncio.sleep(0.03)
+        meta = {}
+        second, joined_as_leader = flight.stream("key", tokens, meta)
+        assert leader and not joined_as_leader
+        assert await collect(second) == ["a", "b", "c"]
+        assert await first_task == ["a", "b", "c"]
+        assert meta == {"model": "mistral"}
+
+    asyncio.run(scenario())
+    assert len(started) == 1
@@ -0,0 +1,26 @@
+# backend/tests/test_usage_history.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from usage_history import UsageHistory, naive_utc, usage_key
+
+def test_naive_utc_converts_aware_datetimes():
+    aware = datetime(2024, 1, 1, 2, 30, tzinfo=timezone(timedelta(hours=2)))
+    assert naive_utc(aware) == datetime(2024, 1, 1, 0, 30)
+    assert naive_utc(datetime(2024, 1, 1, 0, 30)) == datetime(2024, 1, 1, 0, 30)
+
+def test_series_accepts_aware_bounds():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await redis.hset(usage_key("k", datetime(2024, 1, 1)), mapping={"0001": 3, "0003": 2, "last_ip": "1.2.3.4"})
+        history = UsageHistory(redis)
+        start = datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)
+        # 01:04+01:00 is 00:04 UTC.
+        end = datetime(2024, 1, 1, 1, 4, tzinfo=timezone(timedelta(hours=1)))
+        series = await history.series(["k"], start, end, step_minutes=2)
+        assert [point["count"] for point in series["k"]] == [3, 2, 0]
+        assert series["k"][0]["timestamp"] == "2024-01-01T00:00:00"
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+# backend/usage_history.py
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+# Per-minute request counts per API key, written by the rate limiter scripts.
+# One Redis hash per key per UTC day, with one field per minute ("HHMM") that
+# holds that minute's count, plus `last_ip` / `last_seen` and the day's `tokens`.
+# That is at most 1440 small integer fields per key per day, which Redis stores
+# as a compact listpack.
+# The hash expires USAGE_HISTORY_DAYS after the day it was created.
+HISTORY_DAYS = int(os.getenv("USAGE_HISTORY_DAYS", "7"))
+MAX_POINTS = 1440
+
+def usage_key(api_key: str, ts: datetime) -> str:
+    return f"usage:{api_key}:{ts.strftime('%Y-%m-%d')}"
+
+def naive_utc(ts: datetime) -> datetime:
+    """`ts` as a naive UTC datetime; naive input is assumed to be UTC already."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def minute_field(ts: datetime) -> str:
+    return ts.strftime("%H%M")
+
+def history_ttl() -> int:
+    return HISTORY_DAYS * 86400
+
+class UsageHistory:
+    def __init__(self, redis_client=None):
+        self.redis = redis_client
+
+    async def series(self, api_keys: List[str], start: datetime, end: datetime,
+                     step_minutes: int = 1) -> Dict[str, List[dict]]:
+        """
+        Request counts for each API key between start and end (UTC), as a dense
+        list of {"timestamp", "count"} points `step_minutes` apart. All hashes for
+        all keys are fetched in one pipelined round trip. Timezone-aware bounds
+        are converted to UTC.
+        """
+        start, end = naive_utc(start).replace(second=0, microsecond=0), naive_utc(end)
+        points = int((end - start).total_seconds() // 60) // step_minutes + 1
+        if points > MAX_POINTS:
+            raise ValueError(f"Range too large: {points} points, at most {MAX_POINTS}; increase step_minutes")
+        if not self.redis or not api_keys:
+            return {api_key: [] for api_key in api_keys}
+
+        days = []
+        day = start.replace(hour=0, minute=0)
+        while day <= end:
+            days.append(day)
+            day += timedelta(days=1)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for api_key in api_keys:
+                for day in days:
+                    pipe.hgetall(usage_key(api_key, day))
+            hashes = await pipe.execute()
+
+        result = {}
+        for i, api_key in enumerate(api_keys):
+            buckets = [0] * points
+            for day, counts in zip(days, hashes[i * len(days):(i + 1) * len(days)]):
+                for field, count in counts.items():
+                    if not field.isdigit():
+                        continue
+                    ts = day.replace(hour=int(field[:2]), minute=int(field[2:]))
+                    if start <= ts <= end:
+                        buckets[int((ts - start).total_seconds() // 60) // step_minutes] += int(count)
+            result[api_key] = [
+                {"timestamp": (start + timedelta(minutes=n * step_minutes)).isoformat(), "count": count}
+                for n, count in enumerate(buckets)
+            ]
+        return result
+
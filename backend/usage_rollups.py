@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Hourly/daily usage rollups maintained incrementally from the ChatLog writer.
+
+Each flushed batch of chat log rows is folded into per-(period, bucket, user,
+API key, model) deltas and upserted into usage_rollups, so analytics never have
+to scan chat_logs. Run `python usage_rollups.py backfill` once to build rollups
+for rows logged before this existed.
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import func, select, delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import UsageRollup, ChatLog
+
+METRICS = ("requests", "errors", "tokens", "latency_ms_total")
+BUCKET_COLUMNS = ("period", "bucket_start", "user_id", "api_key_id", "model")
+
+GROUP_BY = {
+    "user": UsageRollup.user_id,
+    "api_key": UsageRollup.api_key_id,
+    "model": UsageRollup.model,
+    "bucket": UsageRollup.bucket_start,
+}
+
+def truncate(ts: datetime, period: str) -> datetime:
+    if period == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def aggregate(rows: Iterable[dict]) -> dict:
+    """Fold chat log rows into {bucket key: metric deltas} for both periods."""
+    deltas = {}
+    for row in rows:
+        for period in ("hour", "day"):
+            key = (period, truncate(row["created_at"], period), row["user_id"], row["api_key_id"], row["model"])
+            agg = deltas.setdefault(key, dict.fromkeys(METRICS, 0))
+            if row.get("error"):
+                agg["errors"] += 1
+            else:
+                agg["requests"] += 1
+            agg["tokens"] += row.get("total_tokens") or 0
+            agg["latency_ms_total"] += int(row.get("latency_ms") or 0)
+    return deltas
+
+async def apply(db, deltas: dict):
+    """Upsert deltas into usage_rollups (INSERT ... ON CONFLICT DO UPDATE)."""
+    if not deltas:
+        return
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise Exception(f"Usage rollups need ON CONFLICT support, which {dialect} lacks")
+    values = [{**dict(zip(BUCKET_COLUMNS, key)), **agg} for key, agg in deltas.items()]
+    # Chunked to stay well under the driver's bind-parameter limit.
+    for i in range(0, len(values), 1000):
+        stmt = insert(UsageRollup).values(values[i:i + 1000])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(BUCKET_COLUMNS),
+            set_={metric: getattr(UsageRollup, metric) + stmt.excluded[metric] for metric in METRICS}
+        )
+        await db.execute(stmt)
+
+async def query_usage(db, start: Optional[datetime], end: Optional[datetime],
+                      group_by: Optional[str] = None, period: str = "day") -> list:
+    """Usage totals between start and end, optionally grouped, served from rollups only."""
+    columns = [
+        func.coalesce(func.sum(UsageRollup.requests), 0).label("requests"),
+        func.coalesce(func.sum(UsageRollup.errors), 0).label("errors"),
+        func.coalesce(func.sum(UsageRollup.tokens), 0).label("tokens"),
+        func.coalesce(func.sum(UsageRollup.latency_ms_total), 0).label("latency_ms_total"),
+    ]
+    group_column = GROUP_BY[group_by] if group_by else None
+    if group_column is not None:
+        columns.insert(0, group_column.label(group_by))
+    query = select(*columns).filter(UsageRollup.period == period)
+    if start:
+        query = query.filter(UsageRollup.bucket_start >= truncate(start, period))
+    if end:
+        query = query.filter(UsageRollup.bucket_start <= end)
+    if group_column is not None:
+        query = query.group_by(group_column).order_by(group_column)
+    result = []
+    for row in (await db.execute(query)).mappings():
+        row = dict(row)
+        row["avg_latency_ms"] = row["latency_ms_total"] / row["requests"] if row["requests"] else None
+        if isinstance(row.get("bucket"), datetime):
+            row["bucket"] = row["bucket"].isoformat()
+        result.append(row)
+    return result
+
+async def backfill(batch_size: int = 50000):
+    """
+    Rebuild usage_rollups from the chat_logs table. Buckets from before the oldest
+    remaining chat log are kept, since those rows may have been archived already.
+    Failed requests are never written to chat_logs, so `errors` is left as it is
+    and only the other metrics are recomputed.
+    """
+    from database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        oldest = await db.scalar(select(func.min(ChatLog.created_at)))
+        if oldest is None:
+            return
+        rebuilt = UsageRollup.bucket_start >= truncate(oldest, "day")
+        await db.execute(update(UsageRollup).filter(rebuilt).values(requests=0, tokens=0, latency_ms_total=0))
+        last_id = 0
+        while True:
+            rows = (await db.execute(
+                select(ChatLog.id, ChatLog.user_id, ChatLog.api_key_id, ChatLog.model, ChatLog.created_at,
+                       ChatLog.total_tokens, ChatLog.latency_ms)
+                .filter(ChatLog.id > last_id)
+                .order_by(ChatLog.id)
+                .limit(batch_size)
+            )).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            await apply(db, aggregate(rows))
+            print(f"Rolled up chat_logs through id {last_id}")
+        await db.execute(delete(UsageRollup).filter(rebuilt, UsageRollup.requests == 0, UsageRollup.errors == 0))
+        await db.commit()
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+    if sys.argv[1:] == ["backfill"]:
+        asyncio.run(backfill())
+    else:
+        print("usage: python usage_rollups.py backfill")
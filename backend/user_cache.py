@@ -0,0 +1,84 @@
+# backend/user_cache.py
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "user_cache:invalidate"
+
+class UserSnapshot(NamedTuple):
+    """What authenticated routes read from the current user; works as a UserResponse source."""
+    id: int
+    email: str
+    username: str
+    is_active: bool
+    is_admin: bool
+    created_at: datetime
+
+    @classmethod
+    def from_model(cls, user) -> "UserSnapshot":
+        return cls(user.id, user.email, user.username, bool(user.is_active),
+                   bool(user.is_admin), user.created_at)
+
+class UserCache:
+    """
+    Short-TTL LRU of user snapshots keyed by user id, so dashboard polling
+    doesn't SELECT the same user on every request.
+
+    Anything that changes a user's status must call `invalidate`; with Redis
+    attached, invalidations are broadcast so every worker drops its copy. The
+    TTL bounds staleness if a broadcast is missed.
+    """
+    def __init__(self, redis_client=None, maxsize: int = None, ttl: float = None):
+        self.redis = redis_client
+        self.maxsize = maxsize or int(os.getenv("USER_CACHE_SIZE", "1024"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("USER_CACHE_TTL", "30"))
+        self._entries: "OrderedDict[int, tuple[float, UserSnapshot]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        entry = self._entries.get(user_id)
+        if not entry:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return value
+
+    def set(self, value: UserSnapshot):
+        self._entries[value.id] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(value.id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, *user_ids: int):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+        if self.redis and user_ids:
+            try:
+                for user_id in user_ids:
+                    await self.redis.publish(INVALIDATION_CHANNEL, str(user_id))
+            except Exception as e:
+                logger.warning(f"User cache invalidation broadcast failed: {e}")
+
+    async def listen_for_invalidations(self):
+        """Drop users invalidated by other workers. Run as a background task."""
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._entries.pop(int(message["data"]), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User invalidation listener failed: {e}")
+                self._entries.clear()
+                await asyncio.sleep(1)